@@ -1,6 +1,14 @@
 #!/bin/bash
 
+# Before db init: it installs the extensions the schema needs on a new database
+uv run python -m torrent_garden.utils.pre_migrate
 uv run reflex db init
 uv run reflex db makemigrations
 uv run reflex db migrate
+# Partitions of torrent for the current month and the months ahead, before anything inserts torrents
+uv run python -m torrent_garden.utils.create_torrent_partitions
+# Classifies files stored before the extension/category columns, next to the running application
+uv run python -m torrent_garden.utils.backfill_file_categories &
+# Indexes what the embedded search backend has not seen yet, next to the running application
+uv run python -m torrent_garden.utils.build_search_index &
 uv run reflex run --backend-only --env prod
@@ -14,6 +14,39 @@ logging.basicConfig(level=_level, format="%(asctime)s [%(levelname)s] %(name)s:
 # environment variables
 TORRENT_GARDEN_CLIENT_AUTHENTICATION_ENABLE: bool = getenv("TORRENT_GARDEN_ENABLE_CLIENT_AUTHENTICATION", "0") in ["1", "true", "True"]
 TORRENT_GARDEN_CLIENT_AUTHENTICATION_FILE: Optional[str] = getenv("TORRENT_GARDEN_CLIENT_AUTHENTICATION_FILE", None)
+TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_TTL: int = int(getenv("TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_TTL", "60"))
+TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_SIZE: int = int(getenv("TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_SIZE", "1000"))
+TORRENT_GARDEN_CLIENT_AUTHENTICATION_FLUSH_INTERVAL: int = int(getenv("TORRENT_GARDEN_CLIENT_AUTHENTICATION_FLUSH_INTERVAL", "10"))
+
+TORRENT_GARDEN_API_BATCH_MAX_SIZE: int = int(getenv("TORRENT_GARDEN_API_BATCH_MAX_SIZE", "1000"))
+TORRENT_GARDEN_API_DB_THREADS: int = int(getenv("TORRENT_GARDEN_API_DB_THREADS", "4"))
+TORRENT_GARDEN_API_STREAM_BATCH_SIZE: int = int(getenv("TORRENT_GARDEN_API_STREAM_BATCH_SIZE", "500"))
+TORRENT_GARDEN_API_STREAM_MAX_LINE_BYTES: int = int(getenv("TORRENT_GARDEN_API_STREAM_MAX_LINE_BYTES", str(16 * 1024 * 1024)))
+
+TORRENT_GARDEN_INGEST_QUEUE_SIZE: int = int(getenv("TORRENT_GARDEN_INGEST_QUEUE_SIZE", "10000"))
+TORRENT_GARDEN_INGEST_WORKERS: int = int(getenv("TORRENT_GARDEN_INGEST_WORKERS", "2"))
+TORRENT_GARDEN_INGEST_BATCH_SIZE: int = int(getenv("TORRENT_GARDEN_INGEST_BATCH_SIZE", "500"))
+TORRENT_GARDEN_INGEST_BATCH_WAIT_MS: int = int(getenv("TORRENT_GARDEN_INGEST_BATCH_WAIT_MS", "50"))
+TORRENT_GARDEN_INGEST_RETRY_AFTER: int = int(getenv("TORRENT_GARDEN_INGEST_RETRY_AFTER", "1"))
+
+TORRENT_GARDEN_COUNTS_FLUSH_INTERVAL_MS: int = int(getenv("TORRENT_GARDEN_COUNTS_FLUSH_INTERVAL_MS", "1000"))
+TORRENT_GARDEN_COUNTS_FLUSH_EVENTS: int = int(getenv("TORRENT_GARDEN_COUNTS_FLUSH_EVENTS", "1000"))
+
+TORRENT_GARDEN_KNOWN_TORRENTS_SIZE: int = int(getenv("TORRENT_GARDEN_KNOWN_TORRENTS_SIZE", "100000"))
+TORRENT_GARDEN_SEEN_FLUSH_INTERVAL_MS: int = int(getenv("TORRENT_GARDEN_SEEN_FLUSH_INTERVAL_MS", "5000"))
+TORRENT_GARDEN_DIRECTORY_CACHE_SIZE: int = int(getenv("TORRENT_GARDEN_DIRECTORY_CACHE_SIZE", "100000"))
+TORRENT_GARDEN_FILE_SIMILARITY_THRESHOLD: float = float(getenv("TORRENT_GARDEN_FILE_SIMILARITY_THRESHOLD", "0.6"))
+TORRENT_GARDEN_SEARCH_BACKEND: str = getenv("TORRENT_GARDEN_SEARCH_BACKEND", "sql")
+TORRENT_GARDEN_SEARCH_INDEX_DIR: str = getenv("TORRENT_GARDEN_SEARCH_INDEX_DIR", "search_index")
+TORRENT_GARDEN_SEARCH_FLUSH_INTERVAL_MS: int = int(getenv("TORRENT_GARDEN_SEARCH_FLUSH_INTERVAL_MS", "5000"))
+TORRENT_GARDEN_SEARCH_MAX_SEGMENTS: int = int(getenv("TORRENT_GARDEN_SEARCH_MAX_SEGMENTS", "8"))
+TORRENT_GARDEN_TOTALS_CAP: int = int(getenv("TORRENT_GARDEN_TOTALS_CAP", "10000"))
+TORRENT_GARDEN_TOTALS_CACHE_TTL: int = int(getenv("TORRENT_GARDEN_TOTALS_CACHE_TTL", "60"))
+TORRENT_GARDEN_TOTALS_CACHE_SIZE: int = int(getenv("TORRENT_GARDEN_TOTALS_CACHE_SIZE", "10000"))
+TORRENT_GARDEN_SEARCH_CACHE_ENABLE: bool = getenv("TORRENT_GARDEN_SEARCH_CACHE_ENABLE", "1") in ["1", "true", "True"]
+TORRENT_GARDEN_SEARCH_CACHE_TTL: int = int(getenv("TORRENT_GARDEN_SEARCH_CACHE_TTL", "300"))
+TORRENT_GARDEN_SEARCH_CACHE_STALENESS_MS: int = int(getenv("TORRENT_GARDEN_SEARCH_CACHE_STALENESS_MS", "10000"))
+TORRENT_GARDEN_SEARCH_CACHE_TIMEOUT_MS: int = int(getenv("TORRENT_GARDEN_SEARCH_CACHE_TIMEOUT_MS", "100"))
 
 TORRENT_GARDEN_ADS_ENABLE: bool = getenv("TORRENT_GARDEN_ADS_ENABLE", "0") in ["1", "true", "True"]
 TORRENT_GARDEN_ADS_FILE: Optional[str] = getenv("TORRENT_GARDEN_ADS_FILE", None)
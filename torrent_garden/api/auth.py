@@ -0,0 +1,115 @@
+import hmac
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional
+
+import reflex as rx
+from sqlalchemy import Integer, column, values
+from sqlmodel import select, update
+
+from torrent_garden import logger
+from torrent_garden.db.ingest import ingest_stage_seconds
+from torrent_garden.db.model import Crawler
+from torrent_garden.utils.flusher import PeriodicFlusher
+from torrent_garden.utils.lru import LruCache
+
+
+@dataclass
+class CachedCrawler:
+    # None for names without a crawler, so that unknown names do not hit the database either
+    crawler_id: Optional[int]
+    token: Optional[str]
+    expires_at: float
+
+
+class FailedAuthenticationCounter(PeriodicFlusher):
+    """Gathers failed authentications per crawler and adds them to `failed_authentication_count` in one statement."""
+
+    def __init__(self, interval: float):
+        super().__init__("failed-authentication-flusher", interval)
+        self._lock = threading.Lock()
+        self._failures: Counter[int] = Counter()
+
+    def add(self, crawler_id: int):
+        with self._lock:
+            self._failures[crawler_id] += 1
+
+    def _restore(self, failures: Counter[int]):
+        with self._lock:
+            self._failures.update(failures)
+
+    def flush(self):
+        with self._lock:
+            failures, self._failures = self._failures, Counter()
+        if not failures:
+            return
+        failed = values(column("id", Integer), column("failures", Integer), name="failed").data(sorted(failures.items()))
+        try:
+            with rx.session() as session:
+                session.exec(
+                    update(Crawler)
+                    .where(Crawler.id == failed.c.id)
+                    .values(failed_authentication_count=Crawler.failed_authentication_count + failed.c.failures)
+                )
+                session.commit()
+        except Exception:
+            # Keep the failures for the next flush rather than losing them
+            self._restore(failures)
+            raise
+        logger.info(f"Recorded {failures.total()} failed authentications of {len(failures)} crawlers")
+
+
+class CrawlerAuthenticator:
+    """Checks crawler credentials against a TTL cache of the crawler table.
+
+    Tokens are compared in constant time. Changed tokens are picked up once their entry expires. Names without a
+    crawler are cached apart, so that clients sending made up names only ever evict each other.
+    """
+
+    def __init__(self, ttl: float, size: int, failures: FailedAuthenticationCounter):
+        self.ttl = ttl
+        self.failures = failures
+        self._known: LruCache[str, CachedCrawler] = LruCache(size)
+        self._unknown: LruCache[str, CachedCrawler] = LruCache(size)
+
+    def invalidate(self, name: Optional[str] = None):
+        for cache in (self._known, self._unknown):
+            if name is None:
+                cache.clear()
+            else:
+                cache.forget(name)
+
+    def _lookup(self, name: str) -> CachedCrawler:
+        now = monotonic()
+        cached = self._known.get(name) or self._unknown.get(name)
+        if cached is not None and cached.expires_at > now:
+            return cached
+        with rx.session() as session:
+            row = session.exec(select(Crawler.id, Crawler.token).where(Crawler.name == name)).one_or_none()
+        cached = CachedCrawler(
+            crawler_id=row[0] if row is not None else None,
+            token=row[1] if row is not None else None,
+            expires_at=now + self.ttl,
+        )
+        if cached.crawler_id is not None:
+            self._unknown.forget(name)
+            self._known.remember({name: cached})
+        else:
+            self._known.forget(name)
+            self._unknown.remember({name: cached})
+        return cached
+
+    def authenticate(self, name: Optional[str], token: Optional[str]) -> Optional[int]:
+        """Return the id of the crawler if the credentials are valid, counting failed attempts against known crawlers."""
+        if name is None:
+            return None
+        with ingest_stage_seconds.time(stage="auth"):
+            cached = self._lookup(name)
+        if cached.crawler_id is None:
+            return None
+        if token is None or not hmac.compare_digest(token.encode(), cached.token.encode()):
+            self.failures.add(cached.crawler_id)
+            return None
+        return cached.crawler_id
@@ -0,0 +1,150 @@
+"""Process metrics: the `/metrics` endpoint and the instrumentation that is not tied to a single module.
+
+Covers API request rate and latency per route, Reflex event handler latency per state, database pool checkout
+wait and open websocket sessions. Ingest stages are timed where they happen, see `ingest_stage_seconds`.
+"""
+import threading
+from time import monotonic, perf_counter
+from typing import Dict, Tuple
+
+import reflex as rx
+from fastapi.responses import PlainTextResponse
+from reflex.event import Event
+from reflex.middleware import Middleware
+from reflex.model import get_engine
+from reflex.state import BaseState, StateUpdate
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, SessionTransaction
+from sqlmodel import Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from torrent_garden.api.torrent import api, ingest_queue
+from torrent_garden.db.known import known_torrents
+from torrent_garden.utils.metrics import registry
+
+http_requests_total = registry.counter(
+    "torrent_garden_http_requests_total", "API requests per route, method and status code.", labels=("route", "method", "status"),
+)
+http_request_seconds = registry.histogram(
+    "torrent_garden_http_request_seconds", "API request latency per route.", labels=("route",),
+)
+event_seconds = registry.histogram(
+    "torrent_garden_event_seconds", "Reflex event handler latency per state.", labels=("state",),
+)
+db_pool_checkout_seconds = registry.histogram(
+    "torrent_garden_db_pool_checkout_seconds", "Time a session waits for a pooled connection, pre ping included.",
+)
+
+
+def _pool_checked_out() -> float:
+    pool = get_engine().pool
+    return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+
+registry.gauge("torrent_garden_db_pool_checked_out", "Connections currently checked out of the pool.", callback=_pool_checked_out)
+registry.gauge("torrent_garden_ingest_queue_depth", "Torrents waiting in the ingest queue.", callback=lambda: ingest_queue.depth)
+registry.gauge("torrent_garden_known_torrents", "Torrents in the known torrents LRU.", callback=lambda: len(known_torrents))
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware counting and timing requests to the API routes; everything else passes untouched."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Set by the router once a route matched; requests handled by the mounted Reflex app have none
+            route = scope.get("route")
+            if route is not None:
+                http_request_seconds.observe(perf_counter() - start, route=route.path)
+                http_requests_total.inc(route=route.path, method=scope["method"], status=str(status))
+
+
+api.add_middleware(RequestMetricsMiddleware)
+
+
+class EventMetricsMiddleware(Middleware):
+    """Times Reflex event handlers from preprocessing until their final state update."""
+
+    # Background events never reach postprocess, their entries are dropped after this many seconds
+    STALE_AFTER = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started: Dict[int, Tuple[Event, float]] = {}
+
+    async def preprocess(self, app: rx.App, state: BaseState, event: Event) -> None:
+        now = monotonic()
+        with self._lock:
+            if len(self._started) > 10000:
+                self._started = {key: value for key, value in self._started.items() if now - value[1] < self.STALE_AFTER}
+            self._started[id(event)] = (event, now)
+        return None
+
+    async def postprocess(self, app: rx.App, state: BaseState, event: Event, update: StateUpdate) -> StateUpdate:
+        if update.final:
+            with self._lock:
+                started = self._started.pop(id(event), None)
+            if started is not None:
+                # Event names are "<parent state>.<state>.<handler>", states are named "<module>____<class>"
+                state_name = event.name.rpartition(".")[0].rpartition(".")[2].rpartition("____")[2] or event.name
+                event_seconds.observe(monotonic() - started[1], state=state_name)
+        return update
+
+
+_CHECKOUT_STARTED = "torrent_garden_checkout_started"
+_CONNECTED = "torrent_garden_connected"
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _start_checkout(orm_execute_state: ORMExecuteState):
+    # The first statement of a transaction is what makes the session check out a connection
+    info = orm_execute_state.session.info
+    if not info.get(_CONNECTED):
+        info.setdefault(_CHECKOUT_STARTED, perf_counter())
+
+
+@event.listens_for(Session, "after_begin")
+def _end_checkout(session: Session, transaction: SessionTransaction, connection):
+    session.info[_CONNECTED] = True
+    started = session.info.pop(_CHECKOUT_STARTED, None)
+    if started is not None:
+        db_pool_checkout_seconds.observe(perf_counter() - started)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _reset_checkout(session: Session, transaction: SessionTransaction):
+    if transaction.parent is None:
+        session.info.pop(_CONNECTED, None)
+        session.info.pop(_CHECKOUT_STARTED, None)
+
+
+def instrument_app(app: rx.App):
+    """Add the event handler timing and the websocket session gauge to the Reflex app."""
+    app.add_middleware(EventMetricsMiddleware())
+    registry.gauge(
+        "torrent_garden_websocket_sessions",
+        "Open websocket sessions of this backend process.",
+        callback=lambda: len(app.event_namespace.sid_to_token) if app.event_namespace is not None else 0,
+    )
+
+
+@api.get("/metrics", response_class=PlainTextResponse)
+async def api_metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
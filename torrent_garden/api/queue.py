@@ -0,0 +1,188 @@
+import queue
+import threading
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from time import monotonic, perf_counter
+from typing import Dict, List, Optional, Union, TYPE_CHECKING
+
+import reflex as rx
+
+from torrent_garden import logger
+from torrent_garden.db.ingest import add_torrents, ingest_stage_seconds
+
+if TYPE_CHECKING:
+    from torrent_garden.api.torrent import AddTorrent
+
+
+@dataclass
+class IngestItem:
+    torrent: "AddTorrent"
+    crawler_id: Optional[int] = None
+    queued_at: float = field(default_factory=monotonic)
+
+
+class IngestQueueStats:
+    """Counters describing the queue, updated by the writer threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches: int = 0
+        self.torrents: int = 0
+        self.rejected: int = 0
+        self.failed: int = 0
+        self.last_batch_size: int = 0
+        self.max_batch_size: int = 0
+        self.last_commit_seconds: float = 0.0
+        self.max_commit_seconds: float = 0.0
+        self.total_commit_seconds: float = 0.0
+
+    def record_batch(self, size: int, seconds: float):
+        with self._lock:
+            self.batches += 1
+            self.torrents += size
+            self.last_batch_size = size
+            self.max_batch_size = max(self.max_batch_size, size)
+            self.last_commit_seconds = seconds
+            self.max_commit_seconds = max(self.max_commit_seconds, seconds)
+            self.total_commit_seconds += seconds
+
+    def record_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def record_failed(self, count: int):
+        with self._lock:
+            self.failed += count
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "torrents": self.torrents,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "avg_batch_size": self.torrents / self.batches if self.batches else 0.0,
+                "last_commit_seconds": self.last_commit_seconds,
+                "max_commit_seconds": self.max_commit_seconds,
+                "avg_commit_seconds": self.total_commit_seconds / self.batches if self.batches else 0.0,
+            }
+
+
+class IngestQueue:
+    """Bounded in-process queue between the ingest API and the database writers.
+
+    Every writer thread owns one partition of the queue. Torrents are routed to a partition by their
+    info_hash, so the same torrent is always written by the same thread and never raced by another writer.
+    Each writer drains up to `batch_size` items at a time and commits them in one transaction.
+    """
+
+    def __init__(self, maxsize: int, workers: int, batch_size: int, batch_wait: float):
+        workers = max(1, workers)
+        self.maxsize = maxsize
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.stats = IngestQueueStats()
+        self._partitions: List[queue.Queue[IngestItem]] = [
+            queue.Queue(maxsize=max(1, maxsize // workers)) for _ in range(workers)
+        ]
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+
+    @property
+    def depth(self) -> int:
+        return sum(partition.qsize() for partition in self._partitions)
+
+    @property
+    def is_running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self._run, args=(partition,), name=f"ingest-writer-{i}", daemon=True)
+            for i, partition in enumerate(self._partitions)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {len(self._threads)} ingest writers")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the writers after they have drained everything that is still queued."""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Stopped ingest writers")
+
+    def put(self, torrent: "AddTorrent", crawler_id: Optional[int] = None) -> bool:
+        """Queue a torrent without blocking; returns False if the queue is full."""
+        partition = self._partitions[zlib.crc32(torrent.info_hash.encode()) % len(self._partitions)]
+        try:
+            partition.put_nowait(IngestItem(torrent=torrent, crawler_id=crawler_id))
+        except queue.Full:
+            self.stats.record_rejected()
+            return False
+        return True
+
+    def _take(self, partition: "queue.Queue[IngestItem]") -> List[IngestItem]:
+        try:
+            items = [partition.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        # Linger a little so that bursts end up in one transaction
+        deadline = monotonic() + self.batch_wait
+        while len(items) < self.batch_size:
+            remaining = deadline - monotonic()
+            try:
+                items.append(partition.get(timeout=remaining) if remaining > 0 else partition.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self, partition: "queue.Queue[IngestItem]"):
+        while not (self._stopping.is_set() and partition.empty()):
+            items = self._take(partition)
+            if items:
+                self._write(items)
+
+    def _write(self, items: List[IngestItem]):
+        now = monotonic()
+        for item in items:
+            ingest_stage_seconds.observe(now - item.queued_at, stage="queue")
+
+        by_crawler: Dict[Optional[int], List["AddTorrent"]] = defaultdict(list)
+        for item in items:
+            by_crawler[item.crawler_id].append(item.torrent)
+
+        start = perf_counter()
+        try:
+            with rx.session() as session:
+                for crawler_id, torrents in by_crawler.items():
+                    add_torrents(session, torrents, crawler_id)
+                with ingest_stage_seconds.time(stage="commit"):
+                    session.commit()
+        except Exception:
+            logger.exception(f"Failed to write batch of {len(items)} torrents, retrying one by one")
+            self._write_each(items)
+            return
+        self.stats.record_batch(len(items), perf_counter() - start)
+
+    def _write_each(self, items: List[IngestItem]):
+        # A single bad torrent must not take the rest of its batch down with it
+        for item in items:
+            start = perf_counter()
+            try:
+                with rx.session() as session:
+                    add_torrents(session, [item.torrent], item.crawler_id)
+                    with ingest_stage_seconds.time(stage="commit"):
+                        session.commit()
+            except Exception:
+                logger.exception(f"Failed to write torrent: {item.torrent.info_hash}")
+                self.stats.record_failed(1)
+                continue
+            self.stats.record_batch(1, perf_counter() - start)
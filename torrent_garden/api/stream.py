@@ -0,0 +1,218 @@
+"""Incremental decoding of streamed ingest bodies: optional gzip/zstd decompression and NDJSON line splitting.
+
+Decoding runs in bounded steps, see `StreamLines`, so that the API can run each of them off the event loop.
+"""
+import zlib
+from typing import Callable, Iterator, List, Optional
+
+try:
+    # Python 3.14+
+    from compression.zstd import ZstdDecompressor
+except ImportError:
+    ZstdDecompressor = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Upper bound of decompressed bytes produced per call, so that a small compressed chunk cannot blow up in memory
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+
+
+class StreamError(Exception):
+    pass
+
+
+class GzipDecoder:
+    """Decompresses gzip, including streams made of several concatenated gzip members."""
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(wbits=31)
+        self._in_member = False
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        while data:
+            self._in_member = True
+            try:
+                output = self._decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+            except zlib.error as e:
+                raise StreamError(f"Invalid gzip data: {e}") from e
+            if output:
+                yield output
+            if self._decompressor.eof:
+                data = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(wbits=31)
+                self._in_member = False
+            else:
+                data = self._decompressor.unconsumed_tail
+
+    def finish(self) -> Iterator[bytes]:
+        if self._in_member:
+            raise StreamError("Truncated gzip data")
+        return iter(())
+
+
+class BufferedSource:
+    """The compressed bytes received so far, read by a `zstandard` stream reader.
+
+    Once they are used up before the end of the stream, `read` raises BlockingIOError. The reader passes it on from
+    `read1` with its state intact and carries on where it stopped when read again after more bytes were fed.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.finished = False
+
+    def feed(self, data: bytes):
+        self._buffer += data
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._buffer:
+            if self.finished:
+                return b""
+            raise BlockingIOError("Waiting for more of the stream")
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class ZstdDecoder:
+    """Decompresses zstd frames using the standard library module or, on older Pythons, `zstandard`."""
+
+    def __init__(self):
+        self._in_frame = False
+        if ZstdDecompressor is not None:
+            self._decompressor = ZstdDecompressor()
+        else:
+            self._source = BufferedSource()
+            self._reader = zstandard.ZstdDecompressor().stream_reader(self._source, read_across_frames=True)
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        try:
+            if ZstdDecompressor is not None:
+                yield from self._decode_bounded(data)
+            else:
+                self._source.feed(data)
+                yield from self._read()
+        except StreamError:
+            raise
+        except Exception as e:
+            raise StreamError(f"Invalid zstd data: {e}") from e
+
+    def _decode_bounded(self, data: bytes) -> Iterator[bytes]:
+        # The standard library stops at `max_length` and keeps the rest of the input until asked again
+        while data or not self._decompressor.needs_input:
+            self._in_frame = True
+            output = self._decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+            data = b""
+            if output:
+                yield output
+            if self._decompressor.eof:
+                data = self._decompressor.unused_data
+                self._decompressor = ZstdDecompressor()
+                self._in_frame = False
+
+    def _read(self) -> Iterator[bytes]:
+        # read1 decompresses what the buffered input gives, at most DECOMPRESS_CHUNK_SIZE bytes per call
+        while True:
+            try:
+                output = self._reader.read1(DECOMPRESS_CHUNK_SIZE)
+            except BlockingIOError:
+                return
+            if not output:
+                return
+            yield output
+
+    def finish(self) -> Iterator[bytes]:
+        """Check the end of the stream and return the output still held back.
+
+        `zstandard` does not tell a stream cut between two blocks of a frame, it ends with the last complete
+        block; a line cut in half is then rejected like any invalid line.
+        """
+        if ZstdDecompressor is not None:
+            if self._in_frame:
+                raise StreamError("Truncated zstd data")
+            return iter(())
+        self._source.finished = True
+        return self.decode(b"")
+
+
+class IdentityDecoder:
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        if data:
+            yield data
+
+    def finish(self) -> Iterator[bytes]:
+        return iter(())
+
+
+def zstd_available() -> bool:
+    return ZstdDecompressor is not None or zstandard is not None
+
+
+def make_decoder(content_encoding: Optional[str]) -> Optional[Callable[[], object]]:
+    """Return the decoder class for a Content-Encoding header, or None if it is not supported."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return IdentityDecoder
+    if encoding in ("gzip", "x-gzip"):
+        return GzipDecoder
+    if encoding == "zstd" and zstd_available():
+        return ZstdDecoder
+    return None
+
+
+class LineSplitter:
+    """Splits a byte stream into lines, refusing lines longer than `max_line` bytes."""
+
+    def __init__(self, max_line: int):
+        self.max_line = max_line
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        if b"\n" not in data:
+            self._buffer += data
+            lines = []
+        else:
+            lines = (self._buffer + data).split(b"\n")
+            self._buffer = bytearray(lines.pop())
+        # Complete lines too, a whole line can arrive within one chunk
+        if len(self._buffer) > self.max_line or any(len(line) > self.max_line for line in lines):
+            raise StreamError(f"Line longer than {self.max_line} bytes")
+        return lines
+
+    def finish(self) -> List[bytes]:
+        rest, self._buffer = bytes(self._buffer), bytearray()
+        return [rest] if rest.strip() else []
+
+
+class StreamLines:
+    """Lines of a request body, decoded and split one piece of at most DECOMPRESS_CHUNK_SIZE bytes at a time.
+
+    `feed` and `finish` only take the input, `read` does the work and returns None once the input is used up.
+    """
+
+    def __init__(self, decoder, max_line: int):
+        self._decoder = decoder
+        self._splitter = LineSplitter(max_line)
+        self._pieces: Iterator[bytes] = iter(())
+        self._finished = False
+
+    def feed(self, chunk: bytes):
+        self._pieces = self._decoder.decode(chunk)
+
+    def finish(self):
+        self._pieces = self._decoder.finish()
+        self._finished = True
+
+    def read(self) -> Optional[List[bytes]]:
+        piece = next(self._pieces, None)
+        if piece is not None:
+            return self._splitter.feed(piece)
+        if self._finished:
+            self._finished = False
+            return self._splitter.finish()
+        return None
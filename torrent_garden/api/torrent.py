@@ -1,47 +1,104 @@
-from datetime import datetime
-from typing import Optional, List
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from time import perf_counter
+from typing import Callable, Optional, List, Dict, Tuple, TypeVar, Union
 
 import reflex as rx
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
-from sqlmodel import Session, select
-
-from torrent_garden import TORRENT_GARDEN_CLIENT_AUTHENTICATION_ENABLE, logger
-from torrent_garden.db.count import (
-    update_file_counts,
-    update_total_files_size,
-    COUNT_NAME_TORRENT_FILES_ARCHIVES,
-    ARCHIVE_EXTENSIONS,
-    COUNT_NAME_TORRENT_FILES_CODE_FILES,
-    CODE_EXTENSIONS,
-    DOCUMENT_EXTENSIONS,
-    COUNT_NAME_TORRENT_FILES_DOCUMENTS,
-    EXECUTABLE_EXTENSIONS,
-    COUNT_NAME_TORRENT_FILES_EXECUTABLES,
-    COUNT_NAME_TORRENT_FILES_IMAGES,
-    IMAGE_EXTENSIONS,
-    AUDIO_EXTENSIONS,
-    COUNT_NAME_TORRENT_FILES_AUDIO_FILES,
-    COUNT_NAME_TORRENT_FILES_VIDEOS,
-    VIDEO_EXTENSIONS,
-    update_files_size,
-    COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE,
-    COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE,
-    COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE,
-    COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE,
-    COUNT_NAME_TORRENT_FILES_IMAGES_SIZE,
-    COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE,
-    COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE,
-    COUNT_NAME_TORRENT_FILES,
-    COUNT_NAME_TORRENT_FILES_UNKNOWN,
-    COUNT_NAME_TORRENT_FILES_UNKNOWN_SIZE,
-    ALL_KNOWN_EXTENSIONS,
-    update_total_torrent_count,
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel, Field, ValidationError
+from sqlmodel import Session
+
+from torrent_garden import (
+    TORRENT_GARDEN_CLIENT_AUTHENTICATION_ENABLE,
+    TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_SIZE,
+    TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_TTL,
+    TORRENT_GARDEN_CLIENT_AUTHENTICATION_FLUSH_INTERVAL,
+    TORRENT_GARDEN_API_BATCH_MAX_SIZE,
+    TORRENT_GARDEN_API_DB_THREADS,
+    TORRENT_GARDEN_API_STREAM_BATCH_SIZE,
+    TORRENT_GARDEN_API_STREAM_MAX_LINE_BYTES,
+    TORRENT_GARDEN_INGEST_QUEUE_SIZE,
+    TORRENT_GARDEN_INGEST_WORKERS,
+    TORRENT_GARDEN_INGEST_BATCH_SIZE,
+    TORRENT_GARDEN_INGEST_BATCH_WAIT_MS,
+    TORRENT_GARDEN_INGEST_RETRY_AFTER,
+    logger,
 )
-from torrent_garden.db.model import Crawler, Torrent, TorrentFile
+from torrent_garden.api.auth import CrawlerAuthenticator, FailedAuthenticationCounter
+from torrent_garden.api.queue import IngestQueue
+from torrent_garden.api.stream import StreamError, StreamLines, make_decoder
+from torrent_garden.db.count import count_accumulator
+from torrent_garden.db.ingest import IngestStatus, add_torrents, ingest_stage_seconds
+from torrent_garden.db.info_hash import normalize_info_hash
+from torrent_garden.db.known import known_torrents, seen_counter
+from torrent_garden.db.partitions import partition_maintainer
+from torrent_garden.search.backends import search_backend
+from torrent_garden.search.cache import search_cache
+from torrent_garden.utils.metrics import registry
 
 api = FastAPI()
 
+T = TypeVar("T")
+
+# Blocking database work of the endpoints runs here, never on the event loop that also serves the UI websockets
+db_executor = ThreadPoolExecutor(max_workers=TORRENT_GARDEN_API_DB_THREADS, thread_name_prefix="api-db")
+
+
+async def run_blocking(fnc: Callable[..., T], *args) -> T:
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(fnc, *args))
+
+
+ingest_queue = IngestQueue(
+    maxsize=TORRENT_GARDEN_INGEST_QUEUE_SIZE,
+    workers=TORRENT_GARDEN_INGEST_WORKERS,
+    batch_size=TORRENT_GARDEN_INGEST_BATCH_SIZE,
+    batch_wait=TORRENT_GARDEN_INGEST_BATCH_WAIT_MS / 1000,
+)
+
+add_torrent_total = registry.counter(
+    "torrent_garden_add_torrent_total",
+    "Outcome of /api/torrent/add: known, queued, invalid, unauthorized or queue_full.",
+    labels=("result",),
+)
+
+failed_authentications = FailedAuthenticationCounter(interval=TORRENT_GARDEN_CLIENT_AUTHENTICATION_FLUSH_INTERVAL)
+crawler_authenticator = CrawlerAuthenticator(
+    ttl=TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_TTL,
+    size=TORRENT_GARDEN_CLIENT_AUTHENTICATION_CACHE_SIZE,
+    failures=failed_authentications,
+)
+
+
+@asynccontextmanager
+async def ingest_lifespan():
+    # Before ingest, torrents can only be inserted into the partition of their month
+    partition_maintainer.start()
+    count_accumulator.start()
+    seen_counter.start()
+    failed_authentications.start()
+    search_backend.start()
+    search_cache.start()
+    ingest_queue.start()
+    # Warmed in the background, until then unknown torrents simply take the database path
+    db_executor.submit(known_torrents.warm)
+    try:
+        yield
+    finally:
+        # The writers stage their last counts, sightings, search documents and cache generations on commit, so the
+        # flushers have to stop after them
+        ingest_queue.stop()
+        search_cache.stop()
+        search_backend.stop()
+        failed_authentications.stop()
+        seen_counter.stop()
+        count_accumulator.stop()
+        partition_maintainer.stop()
+        db_executor.shutdown()
+
 
 class AddTorrentFile(BaseModel):
     path: str = Field()
@@ -66,147 +123,271 @@ class AddTorrentRequest(BaseModel):
     token: Optional[str] = Field(default=None)
 
 
-def get_torrent_file_type_count(files: List[AddTorrentFile], endings: List[str]) -> int:
-    ret = 0
-    for file in files:
-        for ending in endings:
-            if file.path.lower().endswith(ending):
-                ret += 1
-                break
-    return ret
+class AddTorrentResult(BaseModel):
+    info_hash: str = Field()
+    status: IngestStatus = Field()
+    message: str = Field(default="")
 
 
-def get_torrent_file_type_size(files: List[AddTorrentFile], endings: List[str]) -> int:
-    ret = 0
-    for file in files:
-        for ending in endings:
-            if file.path.lower().endswith(ending):
-                ret += file.size
-                break
-    return ret
+class AddTorrentBatchRequest(BaseModel):
+    torrents: List[AddTorrent] = Field()
+    name: Optional[str] = Field(default=None)
+    token: Optional[str] = Field(default=None)
 
 
-def update_counts(session: Session, torrent: AddTorrent, new_files: List[TorrentFile]):
-    """Update aggregate counters for newly added torrent and its new files.
+class AddTorrentBatchResponse(BaseModel):
+    error: bool = Field()
+    message: str = Field()
+    results: List[AddTorrentResult] = Field(default_factory=list)
 
-    Notes:
-    - We only count category additions for files that are truly new in the DB (new_files),
-      to avoid double-counting when the same file appears in multiple torrents.
-    - Unknown/Other file types (not matching any known extension) are tracked as well.
-    """
-    update_total_torrent_count(session, 1)
-
-    # Total file count/size increments are based on new files only
-    update_file_counts(session, COUNT_NAME_TORRENT_FILES, len(new_files))
-    new_files_total_size = sum(f.size for f in new_files)
-    update_total_files_size(session, new_files_total_size)
-
-    # Define categories for compact iteration
-    categories = [
-        (COUNT_NAME_TORRENT_FILES_ARCHIVES, COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE, ARCHIVE_EXTENSIONS),
-        (COUNT_NAME_TORRENT_FILES_CODE_FILES, COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE, CODE_EXTENSIONS),
-        (COUNT_NAME_TORRENT_FILES_DOCUMENTS, COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE, DOCUMENT_EXTENSIONS),
-        (COUNT_NAME_TORRENT_FILES_EXECUTABLES, COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE, EXECUTABLE_EXTENSIONS),
-        (COUNT_NAME_TORRENT_FILES_IMAGES, COUNT_NAME_TORRENT_FILES_IMAGES_SIZE, IMAGE_EXTENSIONS),
-        (COUNT_NAME_TORRENT_FILES_AUDIO_FILES, COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE, AUDIO_EXTENSIONS),
-        (COUNT_NAME_TORRENT_FILES_VIDEOS, COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE, VIDEO_EXTENSIONS),
-    ]
-
-    for count_name, size_name, endings in categories:
-        count_add = get_torrent_file_type_count(new_files, endings)  # type: ignore[arg-type]
-        size_add = get_torrent_file_type_size(new_files, endings)    # type: ignore[arg-type]
-        update_file_counts(session, count_name, count_add)
-        update_files_size(session, size_name, size_add)
-
-    # Unknown/Other files: those that do not match any known extension set
-    def is_known(path: str) -> bool:
-        p = path.lower()
-        return any(p.endswith(ext) for ext in ALL_KNOWN_EXTENSIONS)
-
-    unknown_count = sum(1 for f in new_files if not is_known(f.path))
-    unknown_size = sum(f.size for f in new_files if not is_known(f.path))
-    update_file_counts(session, COUNT_NAME_TORRENT_FILES_UNKNOWN, unknown_count)
-    update_files_size(session, COUNT_NAME_TORRENT_FILES_UNKNOWN_SIZE, unknown_size)
-
-
-def create_torrent_files(session: Session, db_torrent: Torrent, torrent: AddTorrent) -> List[TorrentFile]:
-    logger.info(f"Adding {len(torrent.files)} files to torrent: {torrent.name}")
-    file_paths = [file.path for file in torrent.files]
-    existing_files = session.exec(select(TorrentFile).where(TorrentFile.path.in_(file_paths))).all()
-    existing_files_map = {file.path: file for file in existing_files}
-    new_files = []
-    for file in torrent.files:
-        if file.path not in existing_files_map.keys():
-            db_torrent_file = TorrentFile(
-                path=file.path,
-                size=file.size,
-                torrent=[db_torrent]
-            )
-            session.add(db_torrent_file)
-            new_files.append(db_torrent_file)
-            existing_files_map[file.path] = db_torrent_file
-        else:
-            existing_file = existing_files_map[file.path]
-            if db_torrent not in existing_file.torrent:
-                existing_file.torrent.append(db_torrent)
-                session.add(existing_file)
-    session.commit()
-    return new_files
 
+class AddTorrentStreamError(BaseModel):
+    line: int = Field()
+    message: str = Field()
+
+
+class AddTorrentStreamResponse(BaseModel):
+    error: bool = Field()
+    message: str = Field()
+    received: int = Field(default=0)
+    created: int = Field(default=0)
+    updated: int = Field(default=0)
+    rejected: int = Field(default=0)
+    batches: int = Field(default=0)
+    seconds: float = Field(default=0.0)
+    # Only the first STREAM_MAX_ERRORS rejected lines are reported
+    errors: List[AddTorrentStreamError] = Field(default_factory=list)
+
+
+STREAM_MAX_ERRORS = 100
 
-def add_torrent(torrent: AddTorrent, crawler: Optional[Crawler] = None):
-    # logger.info(torrent)
-    with rx.session() as session:
-        if crawler is not None:
-            session.refresh(crawler)
-        statement = select(Torrent).where(Torrent.info_hash == torrent.info_hash)
-        db_torrent = session.exec(statement).one_or_none()
-        if db_torrent is None:
-            logger.info(f"Creating torrent: {torrent.name}")
-            db_torrent = Torrent(
-                name=torrent.name,
-                info_hash=torrent.info_hash,
-                size=torrent.size,
-                crawlers=[],
-                files=[],
-            )
-            session.add(db_torrent)
-            session.commit()
-            new_files = create_torrent_files(session, db_torrent, torrent)
-            update_counts(session, torrent, new_files)
-        else:
-            logger.info(f"Updating torrent: {torrent.name}")
-            db_torrent.seen_count += 1
-            db_torrent.updated_at = datetime.now()
-            session.add(db_torrent)
 
-        if crawler is not None:
-            if crawler not in db_torrent.crawlers:
-                logger.info(f"Adding crawler: {crawler.name} to torrent: {torrent.name}")
-                db_torrent.crawlers.append(crawler)
+def validate_torrent(torrent: AddTorrent) -> Optional[str]:
+    """Return the reason a torrent cannot be stored, or None if it is fine.
 
+    The info_hash of an accepted torrent is normalized in place to lowercase hex, see `normalize_info_hash`.
+    """
+    if not torrent.info_hash.strip():
+        return "Missing info_hash"
+    info_hash = normalize_info_hash(torrent.info_hash)
+    if info_hash is None:
+        return "Invalid info_hash"
+    torrent.info_hash = info_hash
+    if not torrent.name.strip():
+        return "Missing name"
+    if torrent.size < 0 or any(file.size < 0 for file in torrent.files):
+        return "Negative size"
+    return None
+
+
+def ingest_torrents(session: Session, torrents: List[AddTorrent], crawler_id: Optional[int] = None) -> List[AddTorrentResult]:
+    """Validate and persist torrents in one transaction, returning a result per torrent in input order."""
+    results: List[Optional[AddTorrentResult]] = []
+    accepted: List[AddTorrent] = []
+    for torrent in torrents:
+        reason = validate_torrent(torrent)
+        if reason is None:
+            results.append(None)
+            accepted.append(torrent)
+        else:
+            results.append(AddTorrentResult(info_hash=torrent.info_hash, status=IngestStatus.REJECTED, message=reason))
+
+    statuses = iter(add_torrents(session, accepted, crawler_id))
+    with ingest_stage_seconds.time(stage="commit"):
         session.commit()
 
+    for i, torrent in enumerate(torrents):
+        if results[i] is None:
+            results[i] = AddTorrentResult(info_hash=torrent.info_hash, status=next(statuses))
+    return results
+
 
 @api.post("/api/torrent/add")
 async def api_add_torrent(request: AddTorrentRequest) -> AddTorrentResponse:
     rsp = AddTorrentResponse(error=False, message="")
 
+    reason = validate_torrent(request.torrent)
+    if reason is not None:
+        add_torrent_total.inc(result="invalid")
+        rsp.error = True
+        rsp.message = reason
+        return rsp
+
+    crawler_id = None
     if TORRENT_GARDEN_CLIENT_AUTHENTICATION_ENABLE:
+        crawler_id = await run_blocking(crawler_authenticator.authenticate, request.name, request.token)
+        if crawler_id is None:
+            add_torrent_total.inc(result="unauthorized")
+            rsp.error = True
+            rsp.message = "Invalid credentials"
+            return rsp
+
+    # Re-announcements of recently seen torrents are only counted, they are written in bulk by the seen counter
+    known = known_torrents.get(request.torrent.info_hash)
+    if known is not None:
+        seen_counter.add(known, crawler_id)
+        add_torrent_total.inc(result="known")
+        return rsp
+
+    if not ingest_queue.put(request.torrent, crawler_id):
+        add_torrent_total.inc(result="queue_full")
+        rsp.error = True
+        rsp.message = "Ingest queue is full, retry later"
+        return JSONResponse(
+            status_code=503,
+            content=rsp.model_dump(),
+            headers={"Retry-After": str(TORRENT_GARDEN_INGEST_RETRY_AFTER)},
+        )
+
+    add_torrent_total.inc(result="queued")
+    return rsp
+
+
+def add_torrent_batch(body: bytes) -> Response:
+    """Parse, validate and store a batch, runs on the database executor."""
+    try:
+        request = AddTorrentBatchRequest.model_validate_json(body)
+    except ValidationError as e:
+        # Same shape as the validation errors FastAPI reports itself
+        errors = [{**error, "loc": ["body", *error["loc"]]} for error in e.errors(include_url=False, include_context=False)]
+        return JSONResponse(status_code=422, content={"detail": errors})
+
+    rsp = AddTorrentBatchResponse(error=False, message="")
+
+    if len(request.torrents) > TORRENT_GARDEN_API_BATCH_MAX_SIZE:
+        rsp.error = True
+        rsp.message = f"Too many torrents, at most {TORRENT_GARDEN_API_BATCH_MAX_SIZE} are accepted per batch"
+        return Response(rsp.model_dump_json(), media_type="application/json")
+
+    crawler_id = None
+    if TORRENT_GARDEN_CLIENT_AUTHENTICATION_ENABLE:
+        crawler_id = crawler_authenticator.authenticate(request.name, request.token)
+        if crawler_id is None:
+            rsp.error = True
+            rsp.message = "Invalid credentials"
+            return Response(rsp.model_dump_json(), media_type="application/json")
+
+    with rx.session() as session:
+        rsp.results = ingest_torrents(session, request.torrents, crawler_id)
+
+    logger.info(f"Batch of {len(request.torrents)} torrents processed")
+    return Response(rsp.model_dump_json(), media_type="application/json")
+
+
+@api.post("/api/torrent/add_batch", response_model=AddTorrentBatchResponse)
+async def api_add_torrent_batch(request: Request) -> Response:
+    # A batch takes a while to parse as well, so the body is handed over to the executor as it is
+    return await run_blocking(add_torrent_batch, await request.body())
+
+
+def reject_stream_line(rsp: AddTorrentStreamResponse, line: int, message: str):
+    rsp.rejected += 1
+    if len(rsp.errors) < STREAM_MAX_ERRORS:
+        rsp.errors.append(AddTorrentStreamError(line=line, message=message))
+
+
+def add_torrent_stream_batch(rsp: AddTorrentStreamResponse, lines: List[Tuple[int, bytes]], crawler_id: Optional[int]):
+    """Parse and store one batch of streamed lines in a transaction, runs on the database executor."""
+    torrents = []
+    for number, line in lines:
+        try:
+            torrent = AddTorrent.model_validate_json(line)
+        except ValidationError as e:
+            error = e.errors(include_url=False)[0]
+            reject_stream_line(rsp, number, f"{'.'.join(map(str, error['loc'])) or 'record'}: {error['msg']}")
+            continue
+        reason = validate_torrent(torrent)
+        if reason is not None:
+            reject_stream_line(rsp, number, reason)
+            continue
+        torrents.append(torrent)
+
+    if torrents:
         with rx.session() as session:
-            crawler = session.exec(select(Crawler).where(Crawler.name == request.name)).one_or_none()
-            if crawler is not None:
-                if crawler.token == request.token:
-                    add_torrent(request.torrent, crawler)
-                else:
-                    crawler.failed_authentication_count += 1
-                    rsp.error = True
-                    rsp.message = "Invalid credentials"
-            else:
-                rsp.error = True
-                rsp.message = "Invalid credentials"
-            session.commit()
-    else:
-        add_torrent(request.torrent)
+            statuses = add_torrents(session, torrents, crawler_id)
+            with ingest_stage_seconds.time(stage="commit"):
+                session.commit()
+        rsp.created += statuses.count(IngestStatus.CREATED)
+        rsp.updated += statuses.count(IngestStatus.UPDATED)
+    rsp.batches += 1
 
-    return rsp
+
+@api.post("/api/torrent/add_stream", response_model=AddTorrentStreamResponse)
+async def api_add_torrent_stream(request: Request) -> Response:
+    """Ingest newline delimited torrents from a (chunked, optionally gzip or zstd compressed) request body.
+
+    Records are parsed as they arrive and stored every TORRENT_GARDEN_API_STREAM_BATCH_SIZE lines, so a crawler
+    can keep one request open for as long as it likes. Credentials are sent as X-Crawler-Name / X-Crawler-Token.
+    Batches stored before an error stay stored; the summary tells how far the stream got.
+    """
+    start = perf_counter()
+    rsp = AddTorrentStreamResponse(error=False, message="")
+
+    decoder_class = make_decoder(request.headers.get("content-encoding"))
+    if decoder_class is None:
+        rsp.error = True
+        rsp.message = f"Unsupported Content-Encoding: {request.headers.get('content-encoding')}"
+        return JSONResponse(status_code=415, content=rsp.model_dump())
+
+    crawler_id = None
+    if TORRENT_GARDEN_CLIENT_AUTHENTICATION_ENABLE:
+        crawler_id = await run_blocking(
+            crawler_authenticator.authenticate, request.headers.get("x-crawler-name"), request.headers.get("x-crawler-token")
+        )
+        if crawler_id is None:
+            rsp.error = True
+            rsp.message = "Invalid credentials"
+            return JSONResponse(status_code=200, content=rsp.model_dump())
+
+    lines = StreamLines(decoder_class(), TORRENT_GARDEN_API_STREAM_MAX_LINE_BYTES)
+    number = 0
+    pending: List[Tuple[int, bytes]] = []
+
+    async def take():
+        nonlocal number, pending
+        # Decompressing and splitting a piece is CPU work, it runs on the executor like the parsing of add_batch
+        while (taken := await run_blocking(lines.read)) is not None:
+            for line in taken:
+                number += 1
+                if not line.strip():
+                    continue
+                rsp.received += 1
+                pending.append((number, line))
+                if len(pending) >= TORRENT_GARDEN_API_STREAM_BATCH_SIZE:
+                    batch, pending = pending, []
+                    await run_blocking(add_torrent_stream_batch, rsp, batch, crawler_id)
+
+    status_code = 200
+    try:
+        async for chunk in request.stream():
+            lines.feed(chunk)
+            await take()
+        lines.finish()
+        await take()
+        if pending:
+            await run_blocking(add_torrent_stream_batch, rsp, pending, crawler_id)
+    except StreamError as e:
+        rsp.error = True
+        rsp.message = f"{e}, stopped after line {number}"
+        status_code = 400
+    except ClientDisconnect:
+        logger.warning(f"Crawler disconnected from stream after line {number}")
+        rsp.error = True
+        rsp.message = f"Client disconnected after line {number}"
+        status_code = 400
+
+    rsp.seconds = perf_counter() - start
+    logger.info(f"Stream of {rsp.received} torrents processed: {rsp.created} created, {rsp.updated} updated, {rsp.rejected} rejected")
+    return JSONResponse(status_code=status_code, content=rsp.model_dump())
+
+
+@api.get("/api/torrent/queue")
+async def api_torrent_queue() -> Dict[str, Union[int, float]]:
+    return {
+        "depth": ingest_queue.depth,
+        "capacity": ingest_queue.maxsize,
+        **ingest_queue.stats.as_dict(),
+        "known_torrents": len(known_torrents),
+        "known_hits": known_torrents.hits,
+        "known_misses": known_torrents.misses,
+    }
@@ -0,0 +1,80 @@
+"""Micro-benchmark of the file classifier against the per-extension endswith loops it replaced.
+
+    uv run python -m torrent_garden.benchmark.classify --files 50000 --repeat 5
+"""
+import argparse
+import random
+from timeit import repeat
+from typing import List, Sequence
+
+from torrent_garden.api.torrent import AddTorrentFile
+from torrent_garden.db.classify import CATEGORY_PRIORITY, classify_files
+from torrent_garden.db.count import ALL_KNOWN_EXTENSIONS
+
+
+def get_torrent_file_type_count(files: Sequence[AddTorrentFile], endings: Sequence[str]) -> int:
+    ret = 0
+    for file in files:
+        for ending in endings:
+            if file.path.lower().endswith(ending):
+                ret += 1
+                break
+    return ret
+
+
+def get_torrent_file_type_size(files: Sequence[AddTorrentFile], endings: Sequence[str]) -> int:
+    ret = 0
+    for file in files:
+        for ending in endings:
+            if file.path.lower().endswith(ending):
+                ret += file.size
+                break
+    return ret
+
+
+def legacy_counts(files: Sequence[AddTorrentFile]):
+    """What update_counts computed per ingest before the classifier."""
+    for _, endings in CATEGORY_PRIORITY:
+        get_torrent_file_type_count(files, endings)
+        get_torrent_file_type_size(files, endings)
+
+    def is_known(path: str) -> bool:
+        p = path.lower()
+        return any(p.endswith(ext) for ext in ALL_KNOWN_EXTENSIONS)
+
+    sum(1 for f in files if not is_known(f.path))
+    sum(f.size for f in files if not is_known(f.path))
+
+
+def generate_files(count: int, seed: int) -> List[AddTorrentFile]:
+    rng = random.Random(seed)
+    # Mostly known extensions, some unknown ones and some without an extension at all
+    extensions = list(ALL_KNOWN_EXTENSIONS) + [".nfo", ".sfv", ".dat", ".001", ""] * 5
+    return [
+        AddTorrentFile(
+            path=f"Some.Release.Name.{i // 100}/Sub Folder/file.{i}{rng.choice(extensions).upper() if i % 7 == 0 else rng.choice(extensions)}",
+            size=rng.randrange(1, 1 << 32),
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50000, help="number of file paths per run")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs, the best one is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = generate_files(args.files, args.seed)
+    legacy = min(repeat(lambda: legacy_counts(files), number=1, repeat=args.repeat))
+    classifier = min(repeat(lambda: classify_files(files), number=1, repeat=args.repeat))
+
+    print(f"{args.files} files, best of {args.repeat}")
+    print(f"  endswith loops: {legacy * 1000:10.2f} ms  {legacy / args.files * 1e9:8.0f} ns/file")
+    print(f"  classifier:     {classifier * 1000:10.2f} ms  {classifier / args.files * 1e9:8.0f} ns/file")
+    print(f"  speedup:        {legacy / classifier:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
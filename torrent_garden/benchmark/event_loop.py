@@ -0,0 +1,110 @@
+"""Responsiveness of the backend event loop while the ingest API is saturated.
+
+Every UI event is handled on the same event loop as the ingest endpoints, so the latency of the backend's
+`/ping` endpoint is a stand-in for the latency a user sees. It is measured once on an idle backend and once
+while several crawlers post batches as fast as they can.
+
+Start the backend first, then:
+
+    uv run python -m torrent_garden.benchmark.event_loop --url http://localhost:8000 --crawlers 8
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import statistics
+from multiprocessing.sharedctypes import Synchronized
+from multiprocessing.synchronize import Event as EventType
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def generate_batch(crawler: int, number: int, size: int, files: int) -> Dict:
+    torrents = []
+    for i in range(size):
+        prefix = f"bench/{os.getpid()}/{crawler}/{number}/{i}"
+        torrents.append({
+            "info_hash": f"{os.getpid():08x}{crawler:08x}{number:012x}{i:012x}",
+            "name": prefix,
+            "size": files * 1000,
+            "files": [{"path": f"{prefix}/file{j}.mkv", "size": 1000} for j in range(files)],
+        })
+    return {"torrents": torrents}
+
+
+def crawl(crawler: int, args: argparse.Namespace, stop: EventType, ingested: Synchronized):
+    # Runs in its own process, so that building and encoding batches does not delay the probes
+    with httpx.Client(base_url=args.url, timeout=None) as client:
+        number = 0
+        while not stop.is_set():
+            batch = generate_batch(crawler, number, args.batch_size, args.files)
+            if args.name is not None:
+                batch.update(name=args.name, token=args.token)
+            client.post("/api/torrent/add_batch", json=batch).raise_for_status()
+            with ingested.get_lock():
+                ingested.value += args.batch_size
+            number += 1
+
+
+async def probe(client: httpx.AsyncClient, duration: float, interval: float) -> List[float]:
+    latencies = []
+    deadline = perf_counter() + duration
+    while perf_counter() < deadline:
+        start = perf_counter()
+        (await client.get("/ping", timeout=None)).raise_for_status()
+        latencies.append(perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+def report(label: str, latencies: List[float], extra: Optional[str] = None):
+    ms = sorted(latency * 1000 for latency in latencies)
+    quantiles = statistics.quantiles(ms, n=100)
+    line = (f"{label:<12} n={len(ms):<5} p50={quantiles[49]:8.1f} ms  p95={quantiles[94]:8.1f} ms  "
+            f"p99={quantiles[98]:8.1f} ms  max={ms[-1]:8.1f} ms")
+    print(line if extra is None else f"{line}  {extra}")
+
+
+async def run(args: argparse.Namespace):
+    async with httpx.AsyncClient(base_url=args.url) as client:
+        report("idle", await probe(client, args.duration, args.interval))
+
+        stop = multiprocessing.Event()
+        ingested = multiprocessing.Value("q", 0)
+        crawlers = [
+            multiprocessing.Process(target=crawl, args=(i, args, stop, ingested), daemon=True)
+            for i in range(args.crawlers)
+        ]
+        for process in crawlers:
+            process.start()
+        # Let the load build up before measuring
+        await asyncio.sleep(args.warmup)
+        start, before = perf_counter(), ingested.value
+        latencies = await probe(client, args.duration, args.interval)
+        throughput = (ingested.value - before) / (perf_counter() - start)
+        stop.set()
+        for process in crawlers:
+            process.join()
+        report("ingesting", latencies, f"{throughput:.0f} torrents/s")
+
+
+def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000", help="backend url")
+    parser.add_argument("--crawlers", type=int, default=8, help="concurrent crawlers posting batches")
+    parser.add_argument("--batch-size", type=int, default=200, help="torrents per batch")
+    parser.add_argument("--files", type=int, default=10, help="files per torrent")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to measure in each phase")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of load before measuring")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between two probes")
+    parser.add_argument("--name", default=None, help="crawler name, if authentication is enabled")
+    parser.add_argument("--token", default=None, help="crawler token, if authentication is enabled")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Throughput of the ingest API under a synthetic crawler load.
+
+A synthetic crawler generates `AddTorrentRequest` payloads that look like real traffic: most requests re-announce
+a few popular torrents, file counts follow a heavy tail from one file up to `--max-files`, and many paths are shared
+between torrents (samples, covers, release notes). The payloads are generated up front, then replayed by
+`--concurrency` clients, either one torrent per `/api/torrent/add` request or in `/api/torrent/add_batch` batches.
+
+By default the API runs in this process against the database configured for the app, which allows counting the
+SQL statements and transactions per torrent. Point it at a scratch database, the torrents are really written.
+With `--url` a running backend is loaded over HTTP instead, statement counts are not available then.
+
+    uv run python -m torrent_garden.benchmark.ingest --torrents 5000 --concurrency 16
+    uv run python -m torrent_garden.benchmark.ingest --batch-size 200 --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+from collections import Counter
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+# Paths that show up in many unrelated torrents
+COMMON_PATHS = (
+    "README.txt",
+    "readme.nfo",
+    "Sample/sample.mkv",
+    "Covers/front.jpg",
+    "Covers/back.jpg",
+    "Torrent downloaded from tracker.txt",
+    "Subs/English.srt",
+    "cover.jpg",
+    "folder.jpg",
+    "RARBG.txt",
+)
+
+EXTENSIONS = ("mkv", "mp4", "avi", "flac", "mp3", "jpg", "png", "pdf", "epub", "iso", "exe", "zip", "rar", "py", "bin")
+
+
+class SyntheticCrawler:
+    """Deterministic generator of ingest payloads for a given seed."""
+
+    def __init__(self, seed: int, reannounce: float, skew: float, max_files: int, file_alpha: float, pool: int = 10000):
+        self.random = random.Random(seed)
+        self.reannounce = reannounce
+        self.skew = skew
+        self.max_files = max_files
+        self.file_alpha = file_alpha
+        self.pool = pool
+        self._announced: List[Dict] = []
+        # Not seeded: a rerun must not find the torrents of the previous run already stored
+        self._prefix = f"{random.getrandbits(32):08x}"
+
+    def _file_count(self) -> int:
+        return min(self.max_files, int(self.random.paretovariate(self.file_alpha)))
+
+    def _files(self, name: str, count: int) -> List[Dict]:
+        files = []
+        for i in range(count):
+            if self.random.random() < 0.1:
+                path = self.random.choice(COMMON_PATHS)
+            else:
+                path = f"{name}/{'CD' + str(i // 1000) + '/' if count > 1000 else ''}{name}.{i:05d}.{self.random.choice(EXTENSIONS)}"
+            files.append({"path": path, "size": int(self.random.lognormvariate(14, 3))})
+        # A shared path may be drawn twice, a torrent lists every path once
+        return list({file["path"]: file for file in files}.values())
+
+    def _new_torrent(self) -> Dict:
+        number = len(self._announced)
+        name = f"synthetic.{self._prefix}.{number}"
+        files = self._files(name, self._file_count())
+        return {
+            "info_hash": f"{self._prefix}{self.random.getrandbits(128):032x}",
+            "name": name,
+            "size": sum(file["size"] for file in files),
+            "files": files,
+        }
+
+    def next(self) -> Dict:
+        if self._announced and self.random.random() < self.reannounce:
+            # Recently announced torrents are the most popular ones
+            rank = min(len(self._announced), int(self.random.paretovariate(self.skew)))
+            return self._announced[-rank]
+        torrent = self._new_torrent()
+        self._announced.append(torrent)
+        if len(self._announced) > self.pool:
+            self._announced.pop(0)
+        return torrent
+
+
+class StatementCounter:
+    """Counts the SQL statements and commits of every engine in this process."""
+
+    def __init__(self):
+        self.statements: Counter[str] = Counter()
+        self.commits = 0
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "commit", self._commit)
+
+    def _before_cursor_execute(self, conn, cursor, statement: str, parameters, context, executemany: bool):
+        self.statements[statement.lstrip().split(None, 1)[0].upper()] += 1
+
+    def _commit(self, conn):
+        self.commits += 1
+
+    def reset(self):
+        self.statements.clear()
+        self.commits = 0
+
+
+def make_requests(args: argparse.Namespace) -> List[bytes]:
+    crawler = SyntheticCrawler(args.seed, args.reannounce, args.skew, args.max_files, args.file_alpha)
+    credentials = {"name": args.name, "token": args.token} if args.name is not None else {}
+    torrents = [crawler.next() for _ in range(args.torrents)]
+    if args.batch_size > 1:
+        return [
+            json.dumps({**credentials, "torrents": torrents[i:i + args.batch_size]}).encode()
+            for i in range(0, len(torrents), args.batch_size)
+        ]
+    return [json.dumps({**credentials, "torrent": torrent}).encode() for torrent in torrents]
+
+
+@asynccontextmanager
+async def in_process_client() -> AsyncIterator[httpx.AsyncClient]:
+    from torrent_garden.api.torrent import api, ingest_lifespan
+
+    async with ingest_lifespan():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://ingest") as client:
+            yield client
+        # Leaving the lifespan drains the ingest queue and flushes the accumulated counters
+
+
+async def wait_for_queue(client: httpx.AsyncClient):
+    while (await client.get("/api/torrent/queue")).json()["depth"] > 0:
+        await asyncio.sleep(0.1)
+
+
+async def replay(client: httpx.AsyncClient, requests: List[bytes], endpoint: str, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    statuses: Counter[int] = Counter()
+    errors = 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for body in pending:
+            start = perf_counter()
+            response = await client.post(endpoint, content=body, headers={"Content-Type": "application/json"})
+            latencies.append(perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code != 200 or response.json().get("error"):
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"latencies": latencies, "statuses": statuses, "errors": errors}
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    requests = make_requests(args)
+    endpoint = "/api/torrent/add_batch" if args.batch_size > 1 else "/api/torrent/add"
+    counter = None
+
+    start = perf_counter()
+    if args.url is None:
+        counter = StatementCounter()
+        counter.install()
+        async with in_process_client() as client:
+            # Only the replay and draining what it queued are measured, not the startup
+            counter.reset()
+            start = perf_counter()
+            result = await replay(client, requests, endpoint, args.concurrency)
+            acknowledged = perf_counter() - start
+        written = perf_counter() - start
+    else:
+        async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+            result = await replay(client, requests, endpoint, args.concurrency)
+            acknowledged = perf_counter() - start
+            await wait_for_queue(client)
+        written = perf_counter() - start
+
+    ms = sorted(latency * 1000 for latency in result["latencies"])
+    quantiles = statistics.quantiles(ms, n=100) if len(ms) > 1 else ms * 99
+    report = {
+        "torrents": args.torrents,
+        "requests": len(requests),
+        "endpoint": endpoint,
+        "concurrency": args.concurrency,
+        "errors": result["errors"],
+        "statuses": {str(status): count for status, count in sorted(result["statuses"].items())},
+        "acknowledged_per_second": args.torrents / acknowledged,
+        "written_per_second": args.torrents / written,
+        "latency_p50_ms": quantiles[49],
+        "latency_p99_ms": quantiles[98],
+        "latency_max_ms": ms[-1],
+    }
+    if counter is not None:
+        report["statements_per_torrent"] = sum(counter.statements.values()) / args.torrents
+        report["transactions_per_torrent"] = counter.commits / args.torrents
+        report["statements"] = dict(counter.statements.most_common())
+    return report
+
+
+def print_report(report: Dict, baseline: Optional[Dict] = None):
+    def line(label: str, key: str, unit: str = "", higher_is_better: bool = True):
+        value = report.get(key)
+        if value is None:
+            print(f"{label:<26} n/a")
+            return
+        text = f"{label:<26} {value:12.2f}{unit}"
+        if baseline is not None and baseline.get(key):
+            change = (value - baseline[key]) / baseline[key] * 100
+            better = change >= 0 if higher_is_better else change <= 0
+            text += f"   {change:+7.1f}% {'better' if better else 'worse'} than {baseline[key]:.2f}"
+        print(text)
+
+    print(f"{report['torrents']} torrents in {report['requests']} requests to {report['endpoint']}, "
+          f"concurrency {report['concurrency']}, statuses {report['statuses']}, errors {report['errors']}")
+    line("acknowledged torrents/s", "acknowledged_per_second")
+    line("written torrents/s", "written_per_second")
+    line("latency p50", "latency_p50_ms", " ms", higher_is_better=False)
+    line("latency p99", "latency_p99_ms", " ms", higher_is_better=False)
+    line("latency max", "latency_max_ms", " ms", higher_is_better=False)
+    line("statements per torrent", "statements_per_torrent", higher_is_better=False)
+    line("transactions per torrent", "transactions_per_torrent", higher_is_better=False)
+    if "statements" in report:
+        print(f"{'statements':<26} " + ", ".join(f"{kind} {count}" for kind, count in report["statements"].items()))
+
+
+def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="backend url, the API runs in this process if omitted")
+    parser.add_argument("--torrents", type=int, default=5000, help="torrents to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--batch-size", type=int, default=1, help="torrents per request, above 1 uses add_batch")
+    parser.add_argument("--reannounce", type=float, default=0.8, help="share of requests re-announcing a known torrent")
+    parser.add_argument("--skew", type=float, default=1.2, help="pareto shape of torrent popularity, lower is more skewed")
+    parser.add_argument("--max-files", type=int, default=100000, help="largest number of files of a torrent")
+    parser.add_argument("--file-alpha", type=float, default=1.1, help="pareto shape of file counts, lower has a longer tail")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the synthetic crawler")
+    parser.add_argument("--name", default=None, help="crawler name, if authentication is enabled")
+    parser.add_argument("--token", default=None, help="crawler token, if authentication is enabled")
+    parser.add_argument("--output", default=None, help="write the report to this json file")
+    parser.add_argument("--compare", default=None, help="json report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
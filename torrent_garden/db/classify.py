@@ -0,0 +1,151 @@
+"""Classification of file paths into the categories tracked on the metrics page.
+
+Every path gets exactly one category. The extension tuples in `db/count.py` overlap (`.ts` is a video and a
+code file, `.dmg` an archive and an executable, `.sh` an executable and a code file), so a path whose suffixes
+belong to several categories gets the first of them in `CATEGORY_PRIORITY`.
+
+Suffixes are looked up in a dict, starting at each of the last few dots of the file name, so multi-dot
+extensions like `.tar.gz` or `.part1.rar` are found as well. Classifying a path costs a handful of dict lookups,
+independent of the number of known extensions.
+"""
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Dict, Iterable, Tuple, TYPE_CHECKING
+
+from sqlalchemy import ColumnElement, and_
+
+from torrent_garden.db.count import (
+    VIDEO_EXTENSIONS,
+    AUDIO_EXTENSIONS,
+    IMAGE_EXTENSIONS,
+    DOCUMENT_EXTENSIONS,
+    EXECUTABLE_EXTENSIONS,
+    ARCHIVE_EXTENSIONS,
+    CODE_EXTENSIONS,
+    COUNT_NAME_TORRENT_FILES_VIDEOS,
+    COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE,
+    COUNT_NAME_TORRENT_FILES_AUDIO_FILES,
+    COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE,
+    COUNT_NAME_TORRENT_FILES_IMAGES,
+    COUNT_NAME_TORRENT_FILES_IMAGES_SIZE,
+    COUNT_NAME_TORRENT_FILES_DOCUMENTS,
+    COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE,
+    COUNT_NAME_TORRENT_FILES_EXECUTABLES,
+    COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE,
+    COUNT_NAME_TORRENT_FILES_ARCHIVES,
+    COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE,
+    COUNT_NAME_TORRENT_FILES_CODE_FILES,
+    COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE,
+    COUNT_NAME_TORRENT_FILES_UNKNOWN,
+    COUNT_NAME_TORRENT_FILES_UNKNOWN_SIZE,
+)
+from torrent_garden.db.model import TorrentFile
+
+if TYPE_CHECKING:
+    from torrent_garden.api.torrent import AddTorrentFile
+
+
+class FileCategory(StrEnum):
+    VIDEO = "video"
+    AUDIO = "audio"
+    IMAGE = "image"
+    DOCUMENT = "document"
+    EXECUTABLE = "executable"
+    ARCHIVE = "archive"
+    CODE = "code"
+    UNKNOWN = "unknown"
+
+
+# Highest priority first, decides the category of extensions listed in several tuples
+CATEGORY_PRIORITY: Tuple[Tuple[FileCategory, Tuple[str, ...]], ...] = (
+    (FileCategory.VIDEO, VIDEO_EXTENSIONS),
+    (FileCategory.AUDIO, AUDIO_EXTENSIONS),
+    (FileCategory.IMAGE, IMAGE_EXTENSIONS),
+    (FileCategory.DOCUMENT, DOCUMENT_EXTENSIONS),
+    (FileCategory.EXECUTABLE, EXECUTABLE_EXTENSIONS),
+    (FileCategory.ARCHIVE, ARCHIVE_EXTENSIONS),
+    (FileCategory.CODE, CODE_EXTENSIONS),
+)
+
+# Counts entries (count, size) fed by each category
+CATEGORY_COUNT_NAMES: Dict[FileCategory, Tuple[str, str]] = {
+    FileCategory.VIDEO: (COUNT_NAME_TORRENT_FILES_VIDEOS, COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE),
+    FileCategory.AUDIO: (COUNT_NAME_TORRENT_FILES_AUDIO_FILES, COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE),
+    FileCategory.IMAGE: (COUNT_NAME_TORRENT_FILES_IMAGES, COUNT_NAME_TORRENT_FILES_IMAGES_SIZE),
+    FileCategory.DOCUMENT: (COUNT_NAME_TORRENT_FILES_DOCUMENTS, COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE),
+    FileCategory.EXECUTABLE: (COUNT_NAME_TORRENT_FILES_EXECUTABLES, COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE),
+    FileCategory.ARCHIVE: (COUNT_NAME_TORRENT_FILES_ARCHIVES, COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE),
+    FileCategory.CODE: (COUNT_NAME_TORRENT_FILES_CODE_FILES, COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE),
+    FileCategory.UNKNOWN: (COUNT_NAME_TORRENT_FILES_UNKNOWN, COUNT_NAME_TORRENT_FILES_UNKNOWN_SIZE),
+}
+
+
+def _build_suffix_index() -> Dict[str, int]:
+    index: Dict[str, int] = {}
+    # Lowest priority first so that higher priorities overwrite it
+    for rank, (_, extensions) in reversed(list(enumerate(CATEGORY_PRIORITY))):
+        for extension in extensions:
+            index[extension.lower()] = rank
+    return index
+
+
+# Suffix to its rank in CATEGORY_PRIORITY, plain ints keep the lookups cheap
+SUFFIX_INDEX: Dict[str, int] = _build_suffix_index()
+# Longest known extension in dots, e.g. 2 for `.part1.rar`
+SUFFIX_MAX_DOTS: int = max(extension.count(".") for extension in SUFFIX_INDEX)
+_CATEGORIES: Tuple[FileCategory, ...] = tuple(category for category, _ in CATEGORY_PRIORITY) + (FileCategory.UNKNOWN,)
+_UNKNOWN_RANK: int = len(CATEGORY_PRIORITY)
+
+
+# Longer "extensions" are parts of file names, not worth an index entry
+EXTENSION_MAX_LENGTH = 16
+
+
+@dataclass
+class CategoryStats:
+    count: int = 0
+    size: int = 0
+
+
+def classify_path(path: str) -> FileCategory:
+    """Return the highest priority category of any known suffix of a path."""
+    name = path[path.rfind("/") + 1:].lower()
+    rank = _UNKNOWN_RANK
+    # Try the suffixes starting at the last SUFFIX_MAX_DOTS dots of the name
+    position = len(name)
+    for _ in range(SUFFIX_MAX_DOTS):
+        position = name.rfind(".", 0, position)
+        if position < 0:
+            break
+        found = SUFFIX_INDEX.get(name[position:])
+        if found is not None and found < rank:
+            rank = found
+    return _CATEGORIES[rank]
+
+
+def file_extension(path: str) -> str:
+    """Return the lower case last suffix of a path without its dot, or an empty string if there is none."""
+    name = path[path.rfind("/") + 1:]
+    position = name.rfind(".")
+    if position < 0 or len(name) - position - 1 > EXTENSION_MAX_LENGTH:
+        return ""
+    return name[position + 1:].lower()
+
+
+def extension_condition(extension: str) -> ColumnElement[bool]:
+    """Match files by extension using the indexed column; `tar.gz` style queries also check the name."""
+    extension = extension.strip().lstrip(".").lower()
+    condition = TorrentFile.extension == extension.rsplit(".", 1)[-1]
+    if "." in extension:
+        condition = and_(condition, TorrentFile.name.ilike(f"%.{extension}"))
+    return condition
+
+
+def classify_files(files: Iterable["AddTorrentFile"]) -> Dict[FileCategory, CategoryStats]:
+    """Count and sum up the sizes of files per category in a single pass."""
+    stats = {category: CategoryStats() for category in FileCategory}
+    for file in files:
+        category_stats = stats[classify_path(file.path)]
+        category_stats.count += 1
+        category_stats.size += file.size
+    return stats
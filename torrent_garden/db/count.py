@@ -1,8 +1,15 @@
-from typing import Optional
+import threading
+from collections import Counter
+from typing import Dict, Mapping, Optional, Tuple
 
-from sqlmodel import Session, select, func, or_
+import reflex as rx
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select, func
 
+from torrent_garden import TORRENT_GARDEN_COUNTS_FLUSH_INTERVAL_MS, TORRENT_GARDEN_COUNTS_FLUSH_EVENTS, logger
+from torrent_garden.db.hooks import staged
 from torrent_garden.db.model import Torrent, TorrentFile, Counts
+from torrent_garden.utils.flusher import PeriodicFlusher
 
 
 def get_torrent_count(session: Session) -> int:
@@ -20,17 +27,19 @@ def get_total_torrent_size(session: Session) -> int:
     return 0
 
 
-def get_file_count_by_extensions(session: Session, extensions: tuple[str, ...]) -> int:
-    """Generic function to count files by their extensions."""
-    if not extensions:
-        return 0
+def get_file_category_stats(session: Session) -> Dict[str, Tuple[int, int]]:
+    """Return (count, size) per stored file category in a single GROUP BY."""
+    statement = (
+        select(TorrentFile.category, func.count(TorrentFile.id), func.coalesce(func.sum(TorrentFile.size), 0))
+        .where(TorrentFile.category.is_not(None))
+        .group_by(TorrentFile.category)
+    )
+    return {category: (int(count), int(size)) for category, count, size in session.exec(statement).all()}
+
 
-    conditions = [TorrentFile.path.ilike(f'%{ext}') for ext in extensions]
-    return int(session.exec(
-        select(func.count(TorrentFile.id))
-        .where(or_(*conditions))
-        .select_from(TorrentFile)
-    ).one())
+def has_unclassified_files(session: Session) -> bool:
+    """Whether files stored before the category column existed still wait for their backfill."""
+    return session.exec(select(TorrentFile.id).where(TorrentFile.category.is_(None)).limit(1)).first() is not None
 
 
 VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.3gp', '.mpg', '.mpeg', '.ts',
@@ -66,34 +75,6 @@ ALL_KNOWN_EXTENSIONS = (
 )
 
 
-def get_video_file_count(session: Session) -> int:
-    return get_file_count_by_extensions(session, VIDEO_EXTENSIONS)
-
-
-def get_audio_file_count(session: Session) -> int:
-    return get_file_count_by_extensions(session, AUDIO_EXTENSIONS)
-
-
-def get_image_file_count(session: Session) -> int:
-    return get_file_count_by_extensions(session, IMAGE_EXTENSIONS)
-
-
-def get_document_file_count(session: Session) -> int:
-    return get_file_count_by_extensions(session, DOCUMENT_EXTENSIONS)
-
-
-def get_archive_file_count(session: Session) -> int:
-    return get_file_count_by_extensions(session, ARCHIVE_EXTENSIONS)
-
-
-def get_executable_file_count(session: Session) -> int:
-    return get_file_count_by_extensions(session, EXECUTABLE_EXTENSIONS)
-
-
-def get_code_file_count(session: Session) -> int:
-    return get_file_count_by_extensions(session, CODE_EXTENSIONS)
-
-
 COUNT_NAME_TORRENTS = "torrents"
 COUNT_NAME_TORRENT_FILES = "torrent_files"
 COUNT_NAME_TORRENT_FILES_SIZE = "torrent_files_size"
@@ -124,34 +105,78 @@ def get_count(session: Session, name: str) -> int:
     return count.value
 
 
+class CountAccumulator(PeriodicFlusher):
+    """Gathers Counts deltas in memory and adds them to the table in a single statement.
+
+    Deltas are staged on a session and only accumulated once that session commits, so rolled back work is
+    never counted. They are written every `interval` seconds, or earlier once `max_events` commits have
+    contributed to them. The increment happens in SQL, so several processes can flush concurrently.
+    """
+
+    def __init__(self, interval: float, max_events: int):
+        super().__init__("counts-flusher", interval)
+        self.max_events = max(1, max_events)
+        self._lock = threading.Lock()
+        self._deltas: Counter[str] = Counter()
+        self._events = 0
+
+    def stage(self, session: Session, name: str, add: int):
+        staged(session, "counts", Counter, self.add)[name] += add
+
+    def add(self, deltas: Mapping[str, int]):
+        with self._lock:
+            self._deltas.update(deltas)
+            self._events += 1
+            full = self._events >= self.max_events
+        if full:
+            self.wake()
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+            self._events = 0
+        rows = [{"name": name, "value": value} for name, value in sorted(deltas.items()) if value]
+        if not rows:
+            return
+        try:
+            with rx.session() as session:
+                statement = pg_insert(Counts).values(rows)
+                session.exec(statement.on_conflict_do_update(
+                    index_elements=[Counts.name],
+                    set_={"value": Counts.value + statement.excluded.value},
+                ))
+                session.commit()
+        except Exception:
+            # Keep the deltas for the next flush rather than losing them
+            with self._lock:
+                self._deltas.update(deltas)
+            raise
+        logger.debug(f"Flushed {len(rows)} counts")
+
+
+count_accumulator = CountAccumulator(
+    interval=TORRENT_GARDEN_COUNTS_FLUSH_INTERVAL_MS / 1000,
+    max_events=TORRENT_GARDEN_COUNTS_FLUSH_EVENTS,
+)
+
+
+def _increment_count(session: Session, name: str, add: int):
+    count_accumulator.stage(session, name, add)
+
+
 def update_total_torrent_count(session: Session, add: int):
     if add > 0:
-        statement = select(Counts).where(Counts.name == COUNT_NAME_TORRENTS)
-        count = session.exec(statement).first()
-        count.value += add
-        session.add(count)
-        session.commit()
+        _increment_count(session, COUNT_NAME_TORRENTS, add)
 
 
 def update_total_files_size(session: Session, add: int):
     if add > 0:
-        statement = select(Counts).where(Counts.name == COUNT_NAME_TORRENT_FILES_SIZE)
-        count = session.exec(statement).first()
-        count.value += add
-        session.add(count)
-        session.commit()
+        _increment_count(session, COUNT_NAME_TORRENT_FILES_SIZE, add)
 
 
 def update_file_counts(session: Session, name: str, add: int):
     if add > 0:
-        statement = select(Counts).where(Counts.name == name)
-        count = session.exec(statement).first()
-        if count is None:
-            count = Counts(name=name, value=add)
-        else:
-            count.value += add
-        session.add(count)
-        session.commit()
+        _increment_count(session, name, add)
 
 
 def get_size(session: Session, name: str) -> int:
@@ -164,11 +189,4 @@ def get_size(session: Session, name: str) -> int:
 
 def update_files_size(session: Session, name: str, add: int):
     if add > 0:
-        statement = select(Counts).where(Counts.name == name)
-        count = session.exec(statement).first()
-        if count is None:
-            count = Counts(name=name, value=add)
-        else:
-            count.value += add
-        session.add(count)
-        session.commit()
+        _increment_count(session, name, add)
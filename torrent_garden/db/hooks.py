@@ -0,0 +1,41 @@
+from typing import Callable, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import SessionTransaction
+from sqlmodel import Session
+
+from torrent_garden import logger
+
+T = TypeVar("T")
+
+_STAGED = "torrent_garden_staged"
+
+
+def staged(session: Session, key: str, factory: Callable[[], T], on_commit: Callable[[T], None]) -> T:
+    """Return the object collecting `key` work of the current transaction, creating it with `factory` if needed.
+
+    Once the transaction commits the object is handed to `on_commit`; when it is rolled back or the session is
+    closed without a commit, it is dropped. In-memory state that mirrors the database can follow a transaction
+    this way without ever getting ahead of it.
+    """
+    entries = session.info.setdefault(_STAGED, {})
+    if key not in entries:
+        entries[key] = (factory(), on_commit)
+    return entries[key][0]
+
+
+@event.listens_for(Session, "after_commit")
+def _run_staged(session: Session):
+    for value, on_commit in session.info.pop(_STAGED, {}).values():
+        try:
+            on_commit(value)
+        except Exception:
+            # The transaction is committed already, failing the caller now would only hide that
+            logger.exception("Failed to apply staged work after commit")
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_staged(session: Session, transaction: SessionTransaction):
+    # Reached without a commit when the transaction was rolled back or the session closed
+    if transaction.parent is None:
+        session.info.pop(_STAGED, None)
@@ -0,0 +1,81 @@
+"""Info hashes: one canonical form for every spelling crawlers send, stored as raw bytes.
+
+BitTorrent v1 info hashes are 20 byte SHA-1 digests, v2 ones 32 byte SHA-256 digests. Crawlers send them as hex
+in either case, v1 also as 32 character base32, or wrapped in a magnet link. In Python an info hash is always the
+lowercase hex string returned by `normalize_info_hash`; in the database it is the raw digest, see `InfoHash`.
+"""
+import base64
+import binascii
+import re
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+V1_SIZE = 20
+V2_SIZE = 32
+
+# Multihash prefix of a SHA-256 digest in a v2 magnet link (urn:btmh:1220<hex>)
+SHA256_MULTIHASH = "1220"
+
+_HEX = re.compile(r"[0-9a-fA-F]+")
+
+
+def _decode(value: str) -> Optional[bytes]:
+    if len(value) in (2 * V1_SIZE, 2 * V2_SIZE) and _HEX.fullmatch(value):
+        return bytes.fromhex(value)
+    if len(value) == 32:
+        try:
+            return base64.b32decode(value.upper())
+        except binascii.Error:
+            return None
+    return None
+
+
+def _magnet_hash(link: str) -> Optional[str]:
+    for topic in parse_qs(urlsplit(link).query).get("xt", ()):
+        if topic.lower().startswith("urn:btih:"):
+            return topic[len("urn:btih:"):]
+        if topic.lower().startswith(f"urn:btmh:{SHA256_MULTIHASH}"):
+            return topic[len(f"urn:btmh:{SHA256_MULTIHASH}"):]
+    return None
+
+
+def normalize_info_hash(value: str) -> Optional[str]:
+    """Return the lowercase hex form of a hex, base32 or magnet info hash, or None if it is none of them."""
+    value = value.strip()
+    if value.lower().startswith("magnet:"):
+        value = _magnet_hash(value)
+        if value is None:
+            return None
+    digest = _decode(value)
+    return None if digest is None else digest.hex()
+
+
+class InfoHash(TypeDecorator):
+    """Binds lowercase hex info hashes as raw bytes and returns them as lowercase hex.
+
+    Values are expected to be normalized already; binding anything else raises ValueError.
+    """
+
+    impl = LargeBinary(V2_SIZE)
+    cache_ok = True
+
+    # Generated migrations only import sqlalchemy and sqlmodel: alembic renders types of a sqlalchemy module as
+    # `sa.<repr>`, so the column is created as the plain LargeBinary it is stored as.
+    __module__ = "sqlalchemy.types"
+
+    def __repr__(self) -> str:
+        return repr(self.impl)
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        digest = bytes.fromhex(value)
+        if len(digest) not in (V1_SIZE, V2_SIZE):
+            raise ValueError(f"Not an info hash: {value!r}")
+        return digest
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Optional[str]:
+        return None if value is None else bytes(value).hex()
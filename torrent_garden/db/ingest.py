@@ -0,0 +1,316 @@
+import hashlib
+from collections import Counter
+from datetime import datetime
+from enum import StrEnum
+from itertools import batched
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from sqlalchemy import DateTime, Integer, column, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select, update
+
+from torrent_garden import logger
+from torrent_garden.db.classify import CATEGORY_COUNT_NAMES, classify_files, classify_path, file_extension
+from torrent_garden.db.count import (
+    update_file_counts,
+    update_total_files_size,
+    update_files_size,
+    update_total_torrent_count,
+    COUNT_NAME_TORRENT_FILES,
+)
+from torrent_garden.db.known import known_torrents, record_sightings_on_commit, remember_on_commit
+from torrent_garden.db.model import CrawlerTorrentLinkModel, FileTorrentLinkModel, Torrent, TorrentFile, TorrentHash
+from torrent_garden.db.partitions import TorrentKey
+from torrent_garden.db.tree import resolve_directories, split_path
+from torrent_garden.search.backends import index_files_on_commit, index_torrents_on_commit
+from torrent_garden.search.cache import CachedTable, invalidate_on_commit
+from torrent_garden.utils.metrics import registry
+
+if TYPE_CHECKING:
+    from torrent_garden.api.torrent import AddTorrent, AddTorrentFile
+
+
+# Rows per INSERT / lookup when writing the files of a batch
+FILE_BATCH_SIZE = 10000
+
+# Bytes of sha256 kept as TorrentFile.path_digest; pre_migrate computes the same digest in SQL
+PATH_DIGEST_SIZE = 16
+
+ingest_stage_seconds = registry.histogram(
+    "torrent_garden_ingest_stage_seconds",
+    "Time spent in each stage of storing torrents: queue, auth, upsert, files, counts, link and commit.",
+    labels=("stage",),
+)
+
+
+class PathDigestCollision(Exception):
+    pass
+
+
+def path_digest(path: str) -> bytes:
+    return hashlib.sha256(path.encode()).digest()[:PATH_DIGEST_SIZE]
+
+
+class IngestStatus(StrEnum):
+    CREATED = "created"
+    UPDATED = "updated"
+    REJECTED = "rejected"
+
+
+def update_counts(session: Session, torrent_count: int, new_files: Sequence["AddTorrentFile"]):
+    """Update aggregate counters for newly added torrents and their new files.
+
+    Notes:
+    - We only count category additions for files that are truly new in the DB (new_files),
+      to avoid double-counting when the same file appears in multiple torrents.
+    - Every file is classified once and counted in exactly one category, unknown/other included.
+    - Nothing is written here; the deltas are staged on the session and accumulated once it commits.
+    """
+    update_total_torrent_count(session, torrent_count)
+
+    # Total file count/size increments are based on new files only
+    update_file_counts(session, COUNT_NAME_TORRENT_FILES, len(new_files))
+    update_total_files_size(session, sum(f.size for f in new_files))
+
+    for category, stats in classify_files(new_files).items():
+        count_name, size_name = CATEGORY_COUNT_NAMES[category]
+        update_file_counts(session, count_name, stats.count)
+        update_files_size(session, size_name, stats.size)
+
+
+def create_torrent_files(
+        session: Session,
+        torrent_ids: Dict[str, int],
+        torrents: Sequence["AddTorrent"],
+) -> List["AddTorrentFile"]:
+    """Insert the files of freshly created torrents and link them, returning the files that are new to the DB.
+
+    Files are stored as their directory and name, see db/tree.py, and are unique by the digest of their full path,
+    so that the unique index stays small and fixed width however long the paths get. The directories of the paths
+    are resolved first, see `resolve_directories`. Digests are inserted with ON CONFLICT (path_digest) DO NOTHING, so
+    the returned rows are exactly the files that did not exist yet, even if another writer inserts the same path
+    concurrently. Only the remaining digests are looked up afterwards, and the stored directory and name are
+    compared, so a digest collision fails the batch instead of linking the wrong file.
+    Links are bulk inserted with conflicts ignored. No relationship is ever loaded, so a torrent with tens of
+    thousands of files takes a handful of statements.
+    """
+    files: Dict[str, "AddTorrentFile"] = {}
+    for torrent in torrents:
+        for file in torrent.files:
+            files.setdefault(file.path, file)
+    if not files:
+        return []
+    logger.info(f"Adding {len(files)} files to {len(torrents)} torrents")
+
+    paths: Dict[bytes, str] = {}
+    for path in files:
+        digest = path_digest(path)
+        if paths.setdefault(digest, path) != path:
+            raise PathDigestCollision(f"Paths {paths[digest]!r} and {path!r} share the digest {digest.hex()}")
+    split = {path: split_path(path) for path in files}
+    directory_ids = resolve_directories(session, {directory for directory, _ in split.values()})
+    stored = {path: (directory_ids.get(directory), name) for path, (directory, name) in split.items()}
+
+    # Sorted so that concurrent writers take the unique index locks in the same order
+    digests = sorted(paths)
+    file_ids: Dict[str, int] = {
+        paths[bytes(digest)]: file_id
+        for digest, file_id in session.exec(
+            pg_insert(TorrentFile)
+            .on_conflict_do_nothing(index_elements=[TorrentFile.path_digest])
+            .returning(TorrentFile.path_digest, TorrentFile.id),
+            params=[
+                {
+                    "name": stored[paths[digest]][1],
+                    "directory_id": stored[paths[digest]][0],
+                    "path_digest": digest,
+                    "size": files[paths[digest]].size,
+                    "extension": file_extension(paths[digest]),
+                    "category": classify_path(paths[digest]),
+                }
+                for digest in digests
+            ],
+            execution_options={"insertmanyvalues_page_size": FILE_BATCH_SIZE},
+        ).all()
+    }
+    new_files = [files[paths[digest]] for digest in digests if paths[digest] in file_ids]
+    index_files_on_commit(session, ((file_ids[file.path], stored[file.path][1]) for file in new_files))
+
+    known_digests = [digest for digest in digests if paths[digest] not in file_ids]
+    for chunk in batched(known_digests, FILE_BATCH_SIZE):
+        rows = session.exec(
+            select(TorrentFile.path_digest, TorrentFile.directory_id, TorrentFile.name, TorrentFile.id)
+            .where(TorrentFile.path_digest.in_(chunk))
+        ).all()
+        for digest, directory_id, name, file_id in rows:
+            path = paths[bytes(digest)]
+            if stored[path] != (directory_id, name):
+                raise PathDigestCollision(
+                    f"Path {path!r} shares the digest {bytes(digest).hex()} with file {file_id} named {name!r}"
+                )
+            file_ids[path] = file_id
+
+    links = sorted({
+        (torrent_ids[torrent.info_hash], file_ids[file.path])
+        for torrent in torrents
+        for file in torrent.files
+    })
+    session.exec(
+        pg_insert(FileTorrentLinkModel)
+        .on_conflict_do_nothing(index_elements=[FileTorrentLinkModel.torrent_id, FileTorrentLinkModel.torrent_file_id]),
+        params=[{"torrent_id": torrent_id, "torrent_file_id": file_id} for torrent_id, file_id in links],
+        execution_options={"insertmanyvalues_page_size": FILE_BATCH_SIZE},
+    )
+    # Cached file pages list the torrents of each file, known files linked to a new torrent change them too
+    invalidate_on_commit(session, CachedTable.FILES)
+    return new_files
+
+
+def link_crawler(session: Session, crawler_id: int, torrent_ids: Sequence[int]):
+    """Link the crawler to every given torrent, existing links are left alone."""
+    if not torrent_ids:
+        return
+    session.exec(
+        pg_insert(CrawlerTorrentLinkModel)
+        .values([{"crawler_id": crawler_id, "torrent_id": torrent_id} for torrent_id in sorted(set(torrent_ids))])
+        .on_conflict_do_nothing(index_elements=[CrawlerTorrentLinkModel.crawler_id, CrawlerTorrentLinkModel.torrent_id])
+    )
+
+
+def upsert_torrents(
+        session: Session,
+        torrents: Dict[str, "AddTorrent"],
+        occurrences: Dict[str, int],
+) -> Dict[str, Tuple[TorrentKey, bool]]:
+    """Insert or re-announce torrents, returning (key, is_new) per info_hash.
+
+    Info hashes are unique in TorrentHash rather than in the partitioned torrent table, see db/partitions.py: the
+    ids of new torrents are claimed there first, the rest are looked up with their created_at. New torrents are
+    then inserted with their id; known torrents only get their seen_count bumped by the number of occurrences and
+    updated_at set, matched by id and created_at so that each is looked up in its partition only. Their files, and
+    with them file_count, are never changed. A concurrent writer claiming the same info_hash makes this one wait
+    for its commit, after which the torrent is known.
+    Rows are sorted by info_hash so that concurrent writers lock them in the same order.
+    """
+    now = datetime.now()
+    hashes = sorted(torrents)
+    claimed = {
+        info_hash: TorrentKey(torrent_id, created_at)
+        for info_hash, torrent_id, created_at in session.exec(
+            pg_insert(TorrentHash)
+            .values([{"info_hash": info_hash, "created_at": now} for info_hash in hashes])
+            .on_conflict_do_nothing(index_elements=[TorrentHash.info_hash])
+            .returning(TorrentHash.info_hash, TorrentHash.id, TorrentHash.created_at)
+        ).all()
+    }
+    missing = [info_hash for info_hash in hashes if info_hash not in claimed]
+    known = {
+        info_hash: TorrentKey(torrent_id, created_at)
+        for info_hash, torrent_id, created_at in session.exec(
+            select(TorrentHash.info_hash, TorrentHash.id, TorrentHash.created_at)
+            .where(TorrentHash.info_hash.in_(missing))
+        ).all()
+    } if missing else {}
+
+    if claimed:
+        session.exec(pg_insert(Torrent).values([
+            {
+                "id": claimed[info_hash].id,
+                "name": torrent.name,
+                "info_hash": info_hash,
+                "size": torrent.size,
+                "file_count": len({file.path for file in torrent.files}),
+                "views": 0,
+                "downloads": 0,
+                "created_at": claimed[info_hash].created_at,
+                "seen_count": occurrences[info_hash],
+            }
+            for info_hash, torrent in sorted(torrents.items())
+            if info_hash in claimed
+        ]))
+    if known:
+        sightings = values(
+            column("id", Integer), column("created_at", DateTime), column("seen", Integer), name="sightings"
+        ).data(sorted(
+            (torrent.id, torrent.created_at, occurrences[info_hash]) for info_hash, torrent in known.items()
+        ))
+        session.exec(
+            update(Torrent)
+            .where(Torrent.id == sightings.c.id, Torrent.created_at == sightings.c.created_at)
+            .values(seen_count=Torrent.seen_count + sightings.c.seen, updated_at=now)
+        )
+    return {
+        **{info_hash: (torrent, True) for info_hash, torrent in claimed.items()},
+        **{info_hash: (torrent, False) for info_hash, torrent in known.items()},
+    }
+
+
+def add_torrents(
+        session: Session,
+        torrents: Sequence["AddTorrent"],
+        crawler_id: Optional[int] = None,
+) -> List[IngestStatus]:
+    """Persist a batch of torrents with set-based statements and return one status per input torrent.
+
+    Torrents found in `known_torrents` are not written at all; their sightings are handed to the seen counter
+    once the session commits and flushed in bulk later. The rest costs a single upsert; file and counter work
+    is only done for new torrents. The same info_hash may appear several times in one batch; every occurrence
+    counts as a sighting. Nothing is committed here; the caller owns the transaction.
+    """
+    if not torrents:
+        return []
+
+    occurrences = Counter(torrent.info_hash for torrent in torrents)
+    unique: Dict[str, "AddTorrent"] = {}
+    known: Dict[str, TorrentKey] = {}
+    for torrent in torrents:
+        if torrent.info_hash in unique or torrent.info_hash in known:
+            continue
+        key = known_torrents.get(torrent.info_hash)
+        if key is None:
+            unique[torrent.info_hash] = torrent
+        else:
+            known[torrent.info_hash] = key
+
+    if known:
+        logger.info(f"Counting {len(known)} known torrents")
+        record_sightings_on_commit(
+            session, {key: occurrences[info_hash] for info_hash, key in known.items()}, crawler_id,
+        )
+
+    torrent_ids: Dict[str, int] = {}
+    existing = set(known)
+    if unique:
+        with ingest_stage_seconds.time(stage="upsert"):
+            upserted = upsert_torrents(session, unique, occurrences)
+        torrent_ids = {info_hash: key.id for info_hash, (key, _) in upserted.items()}
+        existing.update(info_hash for info_hash, (_, is_new) in upserted.items() if not is_new)
+        remember_on_commit(session, {info_hash: key for info_hash, (key, _) in upserted.items()})
+
+        # Only torrents that were not known before need their files and counters
+        created = [torrent for info_hash, torrent in unique.items() if info_hash not in existing]
+        if created:
+            logger.info(f"Creating {len(created)} torrents")
+            index_torrents_on_commit(session, ((torrent_ids[torrent.info_hash], torrent.name) for torrent in created))
+            invalidate_on_commit(session, CachedTable.TORRENTS)
+            with ingest_stage_seconds.time(stage="files"):
+                new_files = create_torrent_files(session, torrent_ids, created)
+            with ingest_stage_seconds.time(stage="counts"):
+                update_counts(session, len(created), new_files)
+
+        if len(existing) > len(known):
+            logger.info(f"Updating {len(existing) - len(known)} torrents")
+
+        if crawler_id is not None:
+            with ingest_stage_seconds.time(stage="link"):
+                link_crawler(session, crawler_id, list(torrent_ids.values()))
+
+    statuses = []
+    seen = set()
+    for torrent in torrents:
+        if torrent.info_hash in existing or torrent.info_hash in seen:
+            statuses.append(IngestStatus.UPDATED)
+        else:
+            statuses.append(IngestStatus.CREATED)
+        seen.add(torrent.info_hash)
+    return statuses
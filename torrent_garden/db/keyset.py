@@ -0,0 +1,161 @@
+"""Keyset pagination: a page starts right after the last row of the previous one instead of skipping rows.
+
+With OFFSET the database produces and throws away every row in front of the page, page 2000 of 500 rows reads a
+million rows. A keyset page seeks to the key of a row instead, so with an index on the key, e.g. (created_at, id),
+every page costs the same. Keys end with the id, which keeps rows in a strict order where the leading columns tie,
+e.g. among the many torrents that were never viewed. Key columns must not be NULL.
+
+Cursors are opaque strings holding the key of a row and the direction to continue in; pages hand out the cursors
+of the pages next to them, there is no jumping to page N.
+"""
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Generic, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import ColumnElement, and_, cast, or_, tuple_
+from sqlmodel.sql.expression import Select
+
+T = TypeVar("T")
+
+_AFTER = "a"
+_BEFORE = "b"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value: Any) -> Any:
+    return {"datetime": value.isoformat()} if isinstance(value, datetime) else value
+
+
+def _decode_value(value: Any) -> Any:
+    return datetime.fromisoformat(value["datetime"]) if isinstance(value, dict) else value
+
+
+def encode_cursor(key: Sequence[Any], backward: bool = False) -> str:
+    """Cursor of the rows after `key`, or before it when `backward`."""
+    payload = json.dumps([_BEFORE if backward else _AFTER, [_encode_value(value) for value in key]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Tuple[Any, ...], bool]:
+    """Return the key and whether to go backward from it."""
+    try:
+        direction, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if direction not in (_AFTER, _BEFORE):
+            raise ValueError(f"Unknown direction {direction!r}")
+        return tuple(_decode_value(value) for value in key), direction == _BEFORE
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(f"Invalid cursor {cursor!r}") from e
+
+
+@dataclass
+class PageRequest:
+    limit: int
+    # From the previous page, None for the first page
+    cursor: Optional[str] = None
+
+
+@dataclass
+class Page(Generic[T]):
+    rows: List[T]
+    # None where there is no page
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+def _page(rows: List[T], keys: List[Tuple[Any, ...]], request: PageRequest, backward: bool) -> Page[T]:
+    # One row more than the limit was fetched to tell whether the listing goes on in the direction read
+    more = len(rows) > request.limit
+    rows, keys = rows[:request.limit], keys[:request.limit]
+    if backward:
+        rows.reverse()
+        keys.reverse()
+    if not rows:
+        return Page(rows=[])
+    # Going forward there is a previous page unless this is the first; going backward there is a next page
+    has_next = backward or more
+    has_prev = more if backward else request.cursor is not None
+    return Page(
+        rows=rows,
+        next_cursor=encode_cursor(keys[-1]) if has_next else None,
+        prev_cursor=encode_cursor(keys[0], backward=True) if has_prev else None,
+    )
+
+
+def page_of_ids(walk: Callable[[Optional[int], bool], Iterator[int]], request: PageRequest) -> Page[int]:
+    """Page through ids found in memory, highest first, reading no further than the end of the page.
+
+    `walk(start, descending)` yields the ids from `start` on in that order, from the first one when `start` is None.
+    """
+    backward = False
+    if request.cursor is None:
+        rows = list(islice(walk(None, True), request.limit + 1))
+    else:
+        key, backward = decode_cursor(request.cursor)
+        if len(key) != 1 or not isinstance(key[0], int):
+            raise InvalidCursor(f"Expected an id cursor, got {key!r}")
+        # The walk seeks to the id of the cursor, so that a page far down costs as much as the first one
+        start = key[0] + 1 if backward else key[0] - 1
+        rows = list(islice(walk(start, not backward), request.limit + 1))
+    return _page(rows, [(row_id,) for row_id in rows], request, backward)
+
+
+class Keyset:
+    """Order of a listing by `(expression, descending)` keys, the last of them unique.
+
+    Expressions other than columns need their type, e.g. `func.ts_rank(..., type_=REAL)`, see `seek`.
+    """
+
+    def __init__(self, *keys: Tuple[ColumnElement, bool]):
+        self.keys = keys
+
+    @property
+    def columns(self) -> List[ColumnElement]:
+        """Selected after the rows, so that the page can build its cursors."""
+        return [expression for expression, _ in self.keys]
+
+    def order_by(self, backward: bool = False) -> List[ColumnElement]:
+        return [
+            expression.asc() if descending == backward else expression.desc() for expression, descending in self.keys
+        ]
+
+    def seek(self, key: Sequence[Any], backward: bool = False) -> ColumnElement[bool]:
+        """Rows after `key` in the order of the listing, or before it when `backward`."""
+        if len(key) != len(self.keys):
+            raise InvalidCursor(f"Expected a key of {len(self.keys)} values, got {key!r}")
+
+        def beyond(expression: ColumnElement, descending: bool, value: Any) -> ColumnElement[bool]:
+            return expression < value if descending != backward else expression > value
+
+        # Cast to the type of the key: a REAL rank read back as a Python float is only equal to itself as a REAL
+        key = [cast(value, expression.type) for expression, value in zip(self.columns, key)]
+        directions = {descending for _, descending in self.keys}
+        if len(directions) == 1:
+            # A row comparison, which an index on the keys serves with a single range
+            return beyond(tuple_(*self.columns), directions.pop(), tuple_(*key))
+        # Mixed directions: equal on the keys in front of one of them and beyond on that one
+        return or_(*(
+            and_(
+                *(expression == value for expression, value in zip(self.columns[:i], key)),
+                beyond(expression, descending, key[i]),
+            )
+            for i, (expression, descending) in enumerate(self.keys)
+        ))
+
+    def paginate(self, statement: Select, request: PageRequest) -> Select:
+        """Restrict a statement selecting a row followed by `columns` to the requested page, plus one row."""
+        backward = False
+        if request.cursor is not None:
+            key, backward = decode_cursor(request.cursor)
+            statement = statement.where(self.seek(key, backward))
+        return statement.order_by(*self.order_by(backward)).limit(request.limit + 1)
+
+    def page(self, rows: Sequence[Sequence[Any]], request: PageRequest) -> Page:
+        """Build the page from the rows of a `paginate` statement."""
+        backward = request.cursor is not None and decode_cursor(request.cursor)[1]
+        return _page([row[0] for row in rows], [tuple(row[1:]) for row in rows], request, backward)
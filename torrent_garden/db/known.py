@@ -0,0 +1,164 @@
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+import reflex as rx
+from sqlalchemy import DateTime, Integer, column, func, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select, update
+
+from torrent_garden import TORRENT_GARDEN_KNOWN_TORRENTS_SIZE, TORRENT_GARDEN_SEEN_FLUSH_INTERVAL_MS, logger
+from torrent_garden.db.hooks import staged
+from torrent_garden.db.model import CrawlerTorrentLinkModel, Torrent, TorrentHash
+from torrent_garden.db.partitions import TorrentKey
+from torrent_garden.utils.flusher import PeriodicFlusher
+from torrent_garden.utils.lru import LruCache
+
+
+class KnownTorrents(LruCache[str, TorrentKey]):
+    """Bounded LRU of info_hash -> torrent key for torrents that are known to be stored.
+
+    Lets re-announcements of recently seen torrents skip the database entirely. Only ids of committed
+    torrents are remembered, so a hit always refers to an existing row.
+    """
+
+    def warm(self):
+        """Fill the free space with the newest torrents of the table, oldest first to be evicted.
+
+        Newest by id, which follows insertion and reads the primary key of torrenthash backwards, a single index
+        unlike the one per partition of torrent. Ordering by when torrents were last seen would sort the whole
+        table: `updated_at` moves with every sighting and is deliberately not indexed, so that those updates stay
+        HOT.
+        """
+        if self.maxsize <= 0:
+            return
+        with rx.session() as session:
+            rows = session.exec(
+                select(TorrentHash.info_hash, TorrentHash.id, TorrentHash.created_at)
+                .order_by(TorrentHash.id.desc())
+                .limit(self.maxsize)
+            ).all()
+        # Entries remembered in the meantime are more recent than anything read here
+        self.remember_cold({
+            info_hash: TorrentKey(torrent_id, created_at) for info_hash, torrent_id, created_at in rows
+        })
+        logger.info(f"Warmed known torrents with {len(rows)} torrents")
+
+
+class SeenCounter(PeriodicFlusher):
+    """Gathers sightings of known torrents and writes them in bulk.
+
+    Every flush adds the sightings to `seen_count` and moves `updated_at` forward with one UPDATE ... FROM
+    (VALUES ...), and links the crawlers that reported them with one INSERT. Many re-announcements of the
+    same torrent between two flushes cost a single row of that statement. Rows are matched by id and created_at,
+    so every one of them is looked up in its own partition.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__("seen-flusher", interval)
+        self._lock = threading.Lock()
+        self._seen: Counter[TorrentKey] = Counter()
+        self._seen_at: Dict[TorrentKey, datetime] = {}
+        self._links: Set[Tuple[int, int]] = set()
+
+    def add(
+            self,
+            torrent: TorrentKey,
+            crawler_id: Optional[int] = None,
+            count: int = 1,
+            seen_at: Optional[datetime] = None,
+    ):
+        seen_at = seen_at or datetime.now()
+        with self._lock:
+            self._seen[torrent] += count
+            if self._seen_at.get(torrent, seen_at) <= seen_at:
+                self._seen_at[torrent] = seen_at
+            if crawler_id is not None:
+                self._links.add((crawler_id, torrent.id))
+
+    def _restore(
+            self, seen: Counter[TorrentKey], seen_at: Dict[TorrentKey, datetime], links: Set[Tuple[int, int]]
+    ):
+        with self._lock:
+            self._seen.update(seen)
+            for torrent, at in seen_at.items():
+                if self._seen_at.get(torrent, at) <= at:
+                    self._seen_at[torrent] = at
+            self._links |= links
+
+    def flush(self):
+        with self._lock:
+            seen, self._seen = self._seen, Counter()
+            seen_at, self._seen_at = self._seen_at, {}
+            links, self._links = self._links, set()
+        if not seen and not links:
+            return
+        try:
+            with rx.session() as session:
+                if seen:
+                    # Sorted so that concurrent flushes lock the rows in the same order
+                    sightings = values(
+                        column("id", Integer),
+                        column("created_at", DateTime),
+                        column("seen", Integer),
+                        column("seen_at", DateTime),
+                        name="sightings",
+                    ).data([
+                        (torrent.id, torrent.created_at, seen[torrent], seen_at[torrent])
+                        for torrent in sorted(seen, key=lambda torrent: torrent.id)
+                    ])
+                    session.exec(
+                        update(Torrent)
+                        .where(Torrent.id == sightings.c.id, Torrent.created_at == sightings.c.created_at)
+                        .values(
+                            seen_count=Torrent.seen_count + sightings.c.seen,
+                            # greatest() ignores NULL, so torrents never updated before take seen_at
+                            updated_at=func.greatest(Torrent.updated_at, sightings.c.seen_at),
+                        )
+                    )
+                if links:
+                    crawled = values(
+                        column("crawler_id", Integer), column("torrent_id", Integer), name="crawled"
+                    ).data(sorted(links))
+                    # Joined with the torrent ids, a torrent removed in the meantime is skipped instead of failing the flush
+                    session.exec(
+                        pg_insert(CrawlerTorrentLinkModel)
+                        .from_select(
+                            ["crawler_id", "torrent_id"],
+                            select(crawled.c.crawler_id, crawled.c.torrent_id).join(
+                                TorrentHash, TorrentHash.id == crawled.c.torrent_id
+                            ),
+                        )
+                        .on_conflict_do_nothing(index_elements=[CrawlerTorrentLinkModel.crawler_id, CrawlerTorrentLinkModel.torrent_id])
+                    )
+                session.commit()
+        except Exception:
+            # Keep the sightings for the next flush rather than losing them
+            self._restore(seen, seen_at, links)
+            raise
+        logger.debug(f"Flushed {seen.total()} sightings of {len(seen)} torrents and {len(links)} crawler links")
+
+
+known_torrents = KnownTorrents(maxsize=TORRENT_GARDEN_KNOWN_TORRENTS_SIZE)
+seen_counter = SeenCounter(interval=TORRENT_GARDEN_SEEN_FLUSH_INTERVAL_MS / 1000)
+
+
+def remember_on_commit(session: Session, torrents: Mapping[str, TorrentKey]):
+    """Remember the torrents as known once the session commits, so that rolled back rows are never remembered."""
+    staged(session, "known_torrents", dict, known_torrents.remember).update(torrents)
+
+
+def _add_sightings(sightings: List[Tuple[TorrentKey, Optional[int], int, datetime]]):
+    for torrent, crawler_id, count, seen_at in sightings:
+        seen_counter.add(torrent, crawler_id, count, seen_at)
+
+
+def record_sightings_on_commit(
+        session: Session, occurrences: Mapping[TorrentKey, int], crawler_id: Optional[int] = None
+):
+    """Count sightings of known torrents, per torrent, once the session commits."""
+    seen_at = datetime.now()
+    staged(session, "sightings", list, _add_sightings).extend(
+        (torrent, crawler_id, count, seen_at) for torrent, count in occurrences.items()
+    )
@@ -1,20 +1,35 @@
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import BigInteger, Column
+from sqlalchemy import BigInteger, Column, Computed, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import Field, Relationship, SQLModel
 
+from torrent_garden.db.info_hash import InfoHash
 
+
+# Link tables are keyed by the pair itself; the reverse index serves lookups from the other side. Torrent ids
+# reference TorrentHash, the primary key of the partitioned torrent table includes created_at.
 class CrawlerTorrentLinkModel(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
-    crawler_id: int = Field(foreign_key="crawler.id")
-    torrent_id: int = Field(foreign_key="torrent.id")
+    crawler_id: int = Field(foreign_key="crawler.id", primary_key=True)
+    torrent_id: int = Field(foreign_key="torrenthash.id", primary_key=True, index=True)
 
 
 class FileTorrentLinkModel(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
-    torrent_id: int = Field(foreign_key="torrent.id")
-    torrent_file_id: int = Field(foreign_key="torrentfile.id")
+    torrent_id: int = Field(foreign_key="torrenthash.id", primary_key=True)
+    torrent_file_id: int = Field(foreign_key="torrentfile.id", primary_key=True, index=True)
+
+
+# Joins of the link tables to torrent, which they have no foreign key to
+_CRAWLER_LINK = "foreign(CrawlerTorrentLinkModel.crawler_id) == Crawler.id"
+_CRAWLER_TORRENT_LINK = "foreign(CrawlerTorrentLinkModel.torrent_id) == Torrent.id"
+_FILE_LINK = "foreign(FileTorrentLinkModel.torrent_file_id) == TorrentFile.id"
+_FILE_TORRENT_LINK = "foreign(FileTorrentLinkModel.torrent_id) == Torrent.id"
+
+# Words of a torrent name: runs of letters and digits, like `search_words` splits names and queries in Python. The
+# default parser would keep "The.Matrix.1999" or "AC/DC" as one word. [:alnum:] follows the ctype of the database,
+# which has to be a UTF-8 locale for letters of every script to count, e.g. C.UTF-8 or en_US.UTF-8.
+NAME_SEARCH_EXPRESSION = "to_tsvector('simple', regexp_replace(name, '[^[:alnum:]]+', ' ', 'g'))"
 
 
 class Crawler(SQLModel, table=True):
@@ -22,29 +37,108 @@ class Crawler(SQLModel, table=True):
     name: str = Field(max_length=128)
     token: str = Field(max_length=1024)
     created_at: datetime = Field(default_factory=datetime.now)
-    torrents: List["Torrent"] = Relationship(back_populates="crawlers", link_model=CrawlerTorrentLinkModel)
+    torrents: List["Torrent"] = Relationship(
+        back_populates="crawlers",
+        link_model=CrawlerTorrentLinkModel,
+        sa_relationship_kwargs={"primaryjoin": _CRAWLER_LINK, "secondaryjoin": _CRAWLER_TORRENT_LINK},
+    )
     failed_authentication_count: int = Field(default=0)
 
 
+class PathSegment(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
+class Directory(SQLModel, table=True):
+    # Top level directories have no parent, NULLS NOT DISTINCT keeps them unique as well (PostgreSQL 15+)
+    __table_args__ = (UniqueConstraint("parent_id", "segment_id", postgresql_nulls_not_distinct=True),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    parent_id: Optional[int] = Field(default=None, foreign_key="directory.id", nullable=True)
+    segment_id: int = Field(foreign_key="pathsegment.id")
+
+
 class TorrentFile(SQLModel, table=True):
+    # Trigram index for file name searches, see search/sql.py; built by pre_migrate, see index_file_names_by_trigram
+    __table_args__ = (
+        Index("ix_torrentfile_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
-    path: str = Field(unique=True)
+    # Last segment of the path, the rest of it is the directory, see db/tree.py
+    name: str = Field()
+    # Directory of the file, NULL for files at the top of a torrent
+    directory_id: Optional[int] = Field(default=None, foreign_key="directory.id", index=True, nullable=True)
+    # Leading 16 bytes of sha256 of the full path, see db/ingest.py; files are unique by it
+    path_digest: bytes = Field(sa_column=Column(LargeBinary(16), nullable=False, unique=True))
     size: int = Field(sa_column=Column(BigInteger(), nullable=False))
-    torrent: List["Torrent"] = Relationship(back_populates="files", link_model=FileTorrentLinkModel)
+    # Set at ingest, see db/classify.py; NULL until backfilled for files stored before these columns existed
+    extension: Optional[str] = Field(default=None, max_length=16, index=True, nullable=True)
+    category: Optional[str] = Field(default=None, max_length=16, index=True, nullable=True)
+    torrent: List["Torrent"] = Relationship(
+        back_populates="files",
+        link_model=FileTorrentLinkModel,
+        sa_relationship_kwargs={"primaryjoin": _FILE_LINK, "secondaryjoin": _FILE_TORRENT_LINK},
+    )
 
 
-class Torrent(SQLModel, table=True):
+# Allocates the id of every torrent and keeps info hashes unique across the partitions of torrent
+class TorrentHash(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
+    info_hash: str = Field(sa_column=Column(InfoHash(), nullable=False, unique=True))
+    # Partition key of the torrent, so that lookups by id read its partition only, see db/partitions.py
+    created_at: datetime = Field()
+
+
+class Torrent(SQLModel, table=True):
+    # Partitioned by created_at month, see db/partitions.py. A unique key of a partitioned table has to include
+    # created_at, hence the (id, created_at) primary key; rows are still identified by id alone. Reads and updates
+    # by id take created_at from TorrentHash, see db/query.py.
+    __table_args__ = (
+        Index("ix_torrent_name_search", "name_search", postgresql_using="gin"),
+        # Keys of the browse listings, see db/keyset.py; the id breaks ties so that pages can seek past them
+        Index("ix_torrent_created_at_id", "created_at", "id"),
+        Index("ix_torrent_downloads_id", "downloads", "id"),
+        Index("ix_torrent_views_id", "views", "id"),
+        Index("ix_torrent_file_count_id", "file_count", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+
+    # Taken from TorrentHash, see upsert_torrents in db/ingest.py
+    id: int = Field(foreign_key="torrenthash.id", primary_key=True, sa_column_kwargs={"autoincrement": False})
     name: str = Field(max_length=1024)
-    info_hash: str = Field()
+    # Words of the name for full-text search, see search/sql.py
+    name_search: Optional[str] = Field(
+        default=None,
+        exclude=True,
+        sa_column=Column(TSVECTOR(), Computed(NAME_SEARCH_EXPRESSION, persisted=True)),
+    )
+    # Lowercase hex in Python, the raw 20 or 32 byte digest in the database, see db/info_hash.py; unique in
+    # TorrentHash
+    info_hash: str = Field(sa_column=Column(InfoHash(), nullable=False))
     size: int = Field(sa_column=Column(BigInteger(), nullable=False))
-    files: List["TorrentFile"] = Relationship(back_populates="torrent", link_model=FileTorrentLinkModel)
+    files: List["TorrentFile"] = Relationship(
+        back_populates="torrent",
+        link_model=FileTorrentLinkModel,
+        sa_relationship_kwargs={"primaryjoin": _FILE_TORRENT_LINK, "secondaryjoin": _FILE_LINK},
+    )
+    # Number of distinct file paths, set at ingest so that listings never load the files
+    file_count: int = Field(default=0)
+    # Indexed with the id for the most viewed / downloaded torrents
     views: int = Field(default=0)
     downloads: int = Field(default=0)
-    created_at: datetime = Field(default_factory=datetime.now)
+    # Partition key, indexed with the id for the timelines and the newest torrents; never updated, see
+    # set_torrent_fillfactor in pre_migrate
+    created_at: datetime = Field(default_factory=datetime.now, primary_key=True)
     updated_at: Optional[datetime] = Field(nullable=True)
     seen_count: int = Field(default=1)
-    crawlers: List["Crawler"] = Relationship(back_populates="torrents", link_model=CrawlerTorrentLinkModel)
+    crawlers: List["Crawler"] = Relationship(
+        back_populates="torrents",
+        link_model=CrawlerTorrentLinkModel,
+        sa_relationship_kwargs={"primaryjoin": _CRAWLER_TORRENT_LINK, "secondaryjoin": _CRAWLER_LINK},
+    )
 
 
 class Ad(SQLModel, table=True):
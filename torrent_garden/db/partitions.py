@@ -0,0 +1,118 @@
+"""Monthly partitions of the torrent table, by created_at.
+
+Every partition holds the torrents created in one month. Queries bounded by created_at only read the partitions of
+their range: the timelines read the months they chart, and the newest torrents are read from the last partition
+first, the older ones only when a page reaches past it. Vacuum, analyze and reindex work partition by partition,
+and the months that are no longer written to stay frozen once vacuumed.
+
+Info hashes are unique in `TorrentHash`, which also allocates the ids and keeps the created_at of every torrent.
+Torrents are looked up and updated by `TorrentKey`, id and created_at, so that PostgreSQL reads a single partition:
+re-announcements carry it from `TorrentHash` and the known torrents, the pages look it up in `TorrentHash` by the
+ids they are given, see `db/query.py`. A condition on the id alone would probe the primary key of every partition.
+
+Partitions are created `PARTITIONS_AHEAD` months ahead, at startup and every `MAINTENANCE_INTERVAL` seconds by a
+background thread, and by `python -m torrent_garden.utils.create_torrent_partitions` after migrating. There is no
+default partition, it would keep the newest torrents from being read from the last partition first; a torrent
+created in a month without partition fails to insert. They live in the `PARTITION_SCHEMA` schema, which the
+migrations do not compare, so they are never mistaken for tables that are gone from the models.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List
+
+import reflex as rx
+from sqlmodel import Session, text
+
+from torrent_garden import logger
+from torrent_garden.utils.flusher import PeriodicFlusher
+
+PARTITION_SCHEMA = "torrent_partitions"
+# Months to have partitions for after the current one
+PARTITIONS_AHEAD = 3
+MAINTENANCE_INTERVAL = 3600
+# Free space left on every page of torrent, see set_torrent_fillfactor in pre_migrate
+TORRENT_FILLFACTOR = 90
+# Partitions are added under an exclusive lock of torrent; rather than queue up ingest behind a long query holding
+# it, give up and try again at the next run
+LOCK_TIMEOUT = "5s"
+# pg_advisory_xact_lock key, so that processes starting together do not race to create the same partition
+_ADVISORY_LOCK = 0x746F7272
+
+
+@dataclass(frozen=True)
+class TorrentKey:
+    """Primary key of a torrent row, created_at picks its partition."""
+    id: int
+    created_at: datetime
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"torrent_{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(session: Session) -> bool:
+    return session.exec(text("""
+        SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('torrent'))
+    """)).one()[0]
+
+
+def create_torrent_partitions(session: Session, first: date, last: date) -> List[str]:
+    """Create the missing partitions of the months from `first` to `last`, without committing."""
+    session.exec(text(f"CREATE SCHEMA IF NOT EXISTS {PARTITION_SCHEMA}"))
+    session.exec(text("SELECT pg_advisory_xact_lock(:key)"), params={"key": _ADVISORY_LOCK})
+    created = []
+    month = month_start(first)
+    while month <= last:
+        name = partition_name(month)
+        exists = session.exec(
+            text("SELECT to_regclass(:name) IS NOT NULL"), params={"name": f"{PARTITION_SCHEMA}.{name}"}
+        ).one()[0]
+        if not exists:
+            session.exec(text(f"""
+                CREATE TABLE {PARTITION_SCHEMA}.{name} PARTITION OF torrent
+                FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+                WITH (fillfactor = {TORRENT_FILLFACTOR})
+            """))
+            created.append(name)
+        month = add_months(month, 1)
+    if created:
+        logger.info(f"Created torrent partitions {', '.join(created)}")
+    return created
+
+
+def ensure_torrent_partitions(session: Session, ahead: int = PARTITIONS_AHEAD):
+    """Create the partitions of the current month and `ahead` months after it, if torrent is partitioned yet."""
+    if not is_partitioned(session):
+        return
+    session.exec(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    current = month_start(datetime.now().date())
+    create_torrent_partitions(session, current, add_months(current, ahead))
+    session.commit()
+
+
+class PartitionMaintainer(PeriodicFlusher):
+    """Keeps partitions of torrent ahead of time, see the module docstring."""
+
+    def __init__(self, interval: float):
+        super().__init__("torrent-partition-maintainer", interval)
+
+    def start(self):
+        # Once right away, the months ahead may have run out while the application was down
+        self._flush()
+        super().start()
+
+    def flush(self):
+        with rx.session() as session:
+            ensure_torrent_partitions(session)
+
+
+partition_maintainer = PartitionMaintainer(interval=MAINTENANCE_INTERVAL)
@@ -0,0 +1,106 @@
+"""Statements behind the pages that are loaded the most.
+
+The UI states build these queries here, so that `utils/check_query_plans.py` explains exactly what the pages run.
+Listings of torrents never load their files, `Torrent.file_count` is shown instead. Listings are paginated by
+keyset, see `db/keyset.py`. Torrents looked up by id take their created_at from `TorrentHash`, so that only their
+partition is read, see `db/partitions.py`.
+"""
+from typing import Optional, Sequence
+
+from sqlalchemy import ColumnElement, Update, and_
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import func, select, update
+from sqlmodel.sql.expression import Select, SelectOfScalar
+
+from torrent_garden.db.keyset import Keyset, PageRequest
+from torrent_garden.db.model import FileTorrentLinkModel, Torrent, TorrentFile, TorrentHash
+
+
+def browse_torrents(keyset: Keyset, request: PageRequest) -> Select:
+    return keyset.paginate(select(Torrent, *keyset.columns), request)
+
+
+def random_torrents(limit: int) -> SelectOfScalar[Torrent]:
+    return select(Torrent).order_by(func.random()).limit(limit)
+
+
+def search_torrent_ids(condition: ColumnElement[bool], keyset: Keyset, request: PageRequest) -> Select:
+    return keyset.paginate(select(Torrent.id, *keyset.columns).where(condition), request)
+
+
+def matching_torrents(condition: ColumnElement[bool]) -> SelectOfScalar[int]:
+    """Every match, to be counted by `db/totals.py`."""
+    return select(Torrent.id).where(condition)
+
+
+def search_file_ids(conditions: Sequence[ColumnElement[bool]], keyset: Keyset, request: PageRequest) -> Select:
+    """Files matching all conditions, e.g. a name search and the extension."""
+    return keyset.paginate(select(TorrentFile.id, *keyset.columns).where(*conditions), request)
+
+
+def matching_files(conditions: Sequence[ColumnElement[bool]]) -> SelectOfScalar[int]:
+    """Every match, to be counted by `db/totals.py`."""
+    return select(TorrentFile.id).where(*conditions)
+
+
+def files_by_id(file_ids: Sequence[int]) -> SelectOfScalar[TorrentFile]:
+    """Files with the torrents they belong to."""
+    return select(TorrentFile).where(TorrentFile.id.in_(file_ids)).options(selectinload(TorrentFile.torrent))
+
+
+def _torrent_key(torrent_id: int) -> ColumnElement[bool]:
+    # Evaluated once before the scan, PostgreSQL then skips every other partition
+    created_at = select(TorrentHash.created_at).where(TorrentHash.id == torrent_id).scalar_subquery()
+    return and_(Torrent.id == torrent_id, Torrent.created_at == created_at)
+
+
+def torrent_by_id(torrent_id: int) -> SelectOfScalar[Torrent]:
+    return select(Torrent).where(_torrent_key(torrent_id))
+
+
+def count_torrent_view(torrent_id: int) -> Update:
+    return update(Torrent).where(_torrent_key(torrent_id)).values(views=Torrent.views + 1)
+
+
+def count_torrent_download(torrent_id: int) -> Update:
+    return update(Torrent).where(_torrent_key(torrent_id)).values(downloads=Torrent.downloads + 1)
+
+
+def torrent_with_crawlers(torrent_id: int) -> SelectOfScalar[Torrent]:
+    """The torrent joined to its crawlers, results have to be made `unique()`.
+
+    Joined rather than loaded by a second statement, which would look the torrent up by id in every partition.
+    """
+    return torrent_by_id(torrent_id).options(joinedload(Torrent.crawlers))
+
+
+def directory_files(torrent_id: int, directory_id: Optional[int], limit: int) -> SelectOfScalar[TorrentFile]:
+    """Files of a torrent directly in the given directory, None being the top of the torrent, by name."""
+    return (
+        select(TorrentFile)
+        .join(FileTorrentLinkModel, FileTorrentLinkModel.torrent_file_id == TorrentFile.id)
+        .where(FileTorrentLinkModel.torrent_id == torrent_id)
+        .where(TorrentFile.directory_id == directory_id if directory_id else TorrentFile.directory_id.is_(None))
+        .order_by(TorrentFile.name)
+        .limit(limit)
+    )
+
+
+def file_with_torrents(file_id: int) -> SelectOfScalar[TorrentFile]:
+    return select(TorrentFile).where(TorrentFile.id == file_id).options(selectinload(TorrentFile.torrent))
+
+
+def _by_id(statement: Select, torrent_ids: Sequence[int]) -> Select:
+    return statement.join(
+        TorrentHash, and_(TorrentHash.id == Torrent.id, TorrentHash.created_at == Torrent.created_at)
+    ).where(TorrentHash.id.in_(torrent_ids))
+
+
+def torrents_by_id(torrent_ids: Sequence[int]) -> SelectOfScalar[Torrent]:
+    """Torrents joined to their TorrentHash row, whose created_at leads each lookup to the partition of the torrent."""
+    return _by_id(select(Torrent), torrent_ids)
+
+
+def torrent_names_by_id(torrent_ids: Sequence[int]) -> Select:
+    """(id, name) of torrents, looked up like `torrents_by_id`."""
+    return _by_id(select(Torrent.id, Torrent.name), torrent_ids)
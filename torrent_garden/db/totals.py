@@ -0,0 +1,109 @@
+"""Totals of the listings, the "N results" and "page N of M" next to the pages.
+
+Counting every match costs as much as reading every match, far more than the page itself when an index finds the
+page early. Totals are therefore as cheap as the listing allows:
+
+- Whole tables and file categories are exact from `Counts`, which ingest keeps up to date.
+- Other queries count their first TORRENT_GARDEN_TOTALS_CAP + 1 matches only. Up to the cap the total is exact;
+  beyond it the planner's estimate of the matches is shown as "~N" when it is above the cap, "10,000+" otherwise.
+
+Counted totals are cached for TORRENT_GARDEN_TOTALS_CACHE_TTL seconds per query, keyed by its SQL and parameters,
+so paging through results or repeating a search counts once. The embedded search backend counts its matches the
+same way with `capped` and `cached`, see `search/embedded.py`.
+"""
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any, Callable, Hashable, Tuple
+
+from sqlmodel import Session, func, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from torrent_garden import (
+    TORRENT_GARDEN_TOTALS_CACHE_SIZE,
+    TORRENT_GARDEN_TOTALS_CACHE_TTL,
+    TORRENT_GARDEN_TOTALS_CAP,
+)
+from torrent_garden.db.count import get_count
+from torrent_garden.utils.lru import LruCache
+
+
+class TotalKind(StrEnum):
+    EXACT = "exact"
+    # More than `value` matches, the cap was reached
+    AT_LEAST = "at_least"
+    # Planner estimate
+    ESTIMATE = "estimate"
+
+
+@dataclass(frozen=True)
+class Total:
+    value: int
+    kind: TotalKind = TotalKind.EXACT
+
+    def _format(self, value: int) -> str:
+        if self.kind == TotalKind.AT_LEAST:
+            return f"{value:,}+"
+        if self.kind == TotalKind.ESTIMATE:
+            return f"~{value:,}"
+        return f"{value:,}"
+
+    @property
+    def label(self) -> str:
+        return self._format(self.value)
+
+    def pages_label(self, per_page: int, page: int) -> str:
+        """Number of pages for "page N of M"; never less than the page shown, estimates can be too low."""
+        pages = max(1, (self.value + per_page - 1) // per_page) if per_page > 0 else 1
+        if page > pages:
+            return f"{page:,}+" if self.kind != TotalKind.EXACT else f"{page:,}"
+        return self._format(pages)
+
+
+class Totals:
+    def __init__(self, cap: int, ttl: float, cache_size: int):
+        self.cap = cap
+        self.ttl = ttl
+        self._cache: LruCache[Hashable, Tuple[float, Total]] = LruCache(cache_size)
+
+    def stored(self, session: Session, name: str) -> Total:
+        """Exact total kept in `Counts` under `name`."""
+        return Total(get_count(session, name))
+
+    def cached(self, key: Hashable, count: Callable[[], Total]) -> Total:
+        """Total cached under `key`, counted with `count` when missing or older than `ttl`."""
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        total = count()
+        self._cache.remember({key: (time.monotonic() + self.ttl, total)})
+        return total
+
+    def capped(self, counted: int, estimate: Callable[[], int]) -> Total:
+        """Total of `counted` matches, counted up to `cap` + 1; beyond the cap `estimate` if it is above the cap."""
+        if counted <= self.cap:
+            return Total(counted)
+        estimated = estimate()
+        return Total(estimated, TotalKind.ESTIMATE) if estimated > self.cap else Total(self.cap, TotalKind.AT_LEAST)
+
+    def count(self, session: Session, matches: SelectOfScalar[Any]) -> Total:
+        """Total of the rows `matches` selects, capped or estimated beyond the cap."""
+        compiled = matches.compile(dialect=session.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+
+        def count() -> Total:
+            counted = int(session.exec(select(func.count()).select_from(matches.limit(self.cap + 1).subquery())).one())
+
+            def estimate() -> int:
+                plan = session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled.string}", compiled.params)
+                return int(plan.scalar()[0]["Plan"]["Plan Rows"])
+
+            return self.capped(counted, estimate)
+
+        return self.cached((compiled.string, tuple(sorted(compiled.params.items()))), count)
+
+
+totals = Totals(
+    cap=TORRENT_GARDEN_TOTALS_CAP,
+    ttl=TORRENT_GARDEN_TOTALS_CACHE_TTL,
+    cache_size=TORRENT_GARDEN_TOTALS_CACHE_SIZE,
+)
@@ -0,0 +1,227 @@
+"""Directory tree of file paths.
+
+Paths are split at every "/" into directory segments and a basename. Each distinct segment name is stored once in
+PathSegment, each distinct directory once in Directory as (parent, segment), and a file stores its directory and
+its basename as `TorrentFile.name`. Joining the segments and the basename with "/" gives the original path back,
+empty segments included.
+
+Full paths are never stored: pages rebuild them with one recursive query for the directories of all files they
+show, see `listed_files`, and a torrent is browsed one directory at a time.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import batched
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from torrent_garden import TORRENT_GARDEN_DIRECTORY_CACHE_SIZE
+from torrent_garden.db.hooks import staged
+from torrent_garden.db.model import Directory, FileTorrentLinkModel, PathSegment, TorrentFile
+from torrent_garden.utils.lru import LruCache
+
+# Segments of a directory from the top, ("Show", "Season 1") for "Show/Season 1/E01.mkv"
+DirectoryPath = Tuple[str, ...]
+
+# Rows per INSERT / lookup when resolving directories
+TREE_BATCH_SIZE = 10000
+
+# Only ids of committed rows are cached, directories and segments are never deleted
+segment_ids: LruCache[str, int] = LruCache(TORRENT_GARDEN_DIRECTORY_CACHE_SIZE)
+directory_ids: LruCache[DirectoryPath, int] = LruCache(TORRENT_GARDEN_DIRECTORY_CACHE_SIZE)
+
+
+def split_path(path: str) -> Tuple[DirectoryPath, str]:
+    *directory, name = path.split("/")
+    return tuple(directory), name
+
+
+def _resolve_segments(session: Session, names: Set[str]) -> Dict[str, int]:
+    ids: Dict[str, int] = {}
+    missing = []
+    for name in sorted(names):
+        segment_id = segment_ids.get(name)
+        if segment_id is None:
+            missing.append(name)
+        else:
+            ids[name] = segment_id
+    if not missing:
+        return ids
+
+    ids.update(session.exec(
+        pg_insert(PathSegment)
+        .on_conflict_do_nothing(index_elements=[PathSegment.name])
+        .returning(PathSegment.name, PathSegment.id),
+        params=[{"name": name} for name in missing],
+        execution_options={"insertmanyvalues_page_size": TREE_BATCH_SIZE},
+    ).all())
+    for chunk in batched([name for name in missing if name not in ids], TREE_BATCH_SIZE):
+        ids.update(session.exec(select(PathSegment.name, PathSegment.id).where(PathSegment.name.in_(chunk))).all())
+    staged(session, "path_segments", dict, segment_ids.remember).update({name: ids[name] for name in missing})
+    return ids
+
+
+def resolve_directories(session: Session, directories: Iterable[DirectoryPath]) -> Dict[DirectoryPath, int]:
+    """Return the id of every given directory and its ancestors, creating the ones that do not exist yet.
+
+    Directories are created level by level from the top, each level with one INSERT ... ON CONFLICT DO NOTHING
+    and one lookup of the rows that existed already. Cached directories cost nothing.
+    """
+    wanted: Set[DirectoryPath] = set()
+    for directory in directories:
+        for depth in range(1, len(directory) + 1):
+            wanted.add(directory[:depth])
+
+    ids: Dict[DirectoryPath, int] = {}
+    missing: Dict[int, List[DirectoryPath]] = defaultdict(list)
+    for directory in wanted:
+        directory_id = directory_ids.get(directory)
+        if directory_id is None:
+            missing[len(directory)].append(directory)
+        else:
+            ids[directory] = directory_id
+    if not missing:
+        return ids
+
+    segments = _resolve_segments(session, {directory[-1] for level in missing.values() for directory in level})
+    created: Dict[DirectoryPath, int] = {}
+    for depth in sorted(missing):
+        level = {
+            (ids[directory[:-1]] if depth > 1 else None, segments[directory[-1]]): directory
+            for directory in missing[depth]
+        }
+        # Sorted so that concurrent writers take the unique index locks in the same order
+        keys = sorted(level, key=lambda key: (key[0] or 0, key[1]))
+        found = {
+            (parent_id, segment_id): directory_id
+            for parent_id, segment_id, directory_id in session.exec(
+                pg_insert(Directory)
+                .on_conflict_do_nothing(index_elements=[Directory.parent_id, Directory.segment_id])
+                .returning(Directory.parent_id, Directory.segment_id, Directory.id),
+                params=[{"parent_id": parent_id, "segment_id": segment_id} for parent_id, segment_id in keys],
+                execution_options={"insertmanyvalues_page_size": TREE_BATCH_SIZE},
+            ).all()
+        }
+        for chunk in batched([key for key in keys if key not in found], TREE_BATCH_SIZE):
+            if depth == 1:
+                condition = and_(Directory.parent_id.is_(None), Directory.segment_id.in_([key[1] for key in chunk]))
+            else:
+                condition = tuple_(Directory.parent_id, Directory.segment_id).in_(chunk)
+            found.update(
+                ((parent_id, segment_id), directory_id)
+                for parent_id, segment_id, directory_id in session.exec(
+                    select(Directory.parent_id, Directory.segment_id, Directory.id).where(condition)
+                ).all()
+            )
+        for key, directory in level.items():
+            ids[directory] = created[directory] = found[key]
+    staged(session, "directories", dict, directory_ids.remember).update(created)
+    return ids
+
+
+def directory_nodes(session: Session, ids: Iterable[int]) -> Dict[int, Tuple[Optional[int], str]]:
+    """Return (parent id, name) of the given directories and all their ancestors, in one recursive query."""
+    ids = sorted(set(ids))
+    if not ids:
+        return {}
+    nodes = (
+        select(Directory.id, Directory.parent_id, Directory.segment_id)
+        .where(Directory.id.in_(ids))
+        .cte("nodes", recursive=True)
+    )
+    # UNION rather than UNION ALL, ancestors shared by several directories are walked once
+    nodes = nodes.union(
+        select(Directory.id, Directory.parent_id, Directory.segment_id).join(nodes, Directory.id == nodes.c.parent_id)
+    )
+    rows = session.exec(
+        select(nodes.c.id, nodes.c.parent_id, PathSegment.name).join(PathSegment, PathSegment.id == nodes.c.segment_id)
+    ).all()
+    return {directory_id: (parent_id, name) for directory_id, parent_id, name in rows}
+
+
+def directory_paths(nodes: Dict[int, Tuple[Optional[int], str]]) -> Dict[int, str]:
+    """Build the full path of every directory of `nodes`, which has to contain all ancestors."""
+    paths: Dict[int, str] = {}
+
+    def path_of(directory_id: int) -> str:
+        path = paths.get(directory_id)
+        if path is None:
+            parent_id, name = nodes[directory_id]
+            path = paths[directory_id] = name if parent_id is None else f"{path_of(parent_id)}/{name}"
+        return path
+
+    for directory_id in nodes:
+        path_of(directory_id)
+    return paths
+
+
+def file_path(paths: Dict[int, str], directory_id: Optional[int], name: str) -> str:
+    """Join a file name to the path of its directory, taken from `directory_paths`."""
+    return name if directory_id is None else f"{paths[directory_id]}/{name}"
+
+
+@dataclass
+class ListedFile:
+    """A file as the pages list it, with its full path."""
+    id: int
+    path: str
+    size: int
+    # Torrents containing the file, for the pages that link to them
+    torrent_ids: List[int] = field(default_factory=list)
+
+
+def listed_files(session: Session, files: Sequence[TorrentFile], with_torrents: bool = False) -> List[ListedFile]:
+    """Rebuild the paths of `files`, in the same order, with one recursive query for all their directories.
+
+    `with_torrents` takes the torrent ids from `TorrentFile.torrent`, which should be loaded with the files.
+    """
+    paths = directory_paths(directory_nodes(session, [file.directory_id for file in files if file.directory_id]))
+    return [
+        ListedFile(
+            id=file.id,
+            path=file_path(paths, file.directory_id, file.name),
+            size=file.size,
+            torrent_ids=[torrent.id for torrent in file.torrent] if with_torrents else [],
+        )
+        for file in files
+    ]
+
+
+@dataclass
+class TreeDirectory:
+    id: int
+    parent_id: Optional[int]
+    name: str
+    # Files and their size in this directory and everything below it
+    files: int = 0
+    size: int = 0
+
+
+def torrent_tree(session: Session, torrent_id: int) -> Tuple[Dict[int, TreeDirectory], int, int]:
+    """Return the directories of a torrent with their recursive file count and size, plus the torrent totals.
+
+    One aggregate over the files of the torrent and one recursive query for the directories, however deep.
+    """
+    stats = session.exec(
+        select(TorrentFile.directory_id, func.count(), func.coalesce(func.sum(TorrentFile.size), 0))
+        .join(FileTorrentLinkModel, FileTorrentLinkModel.torrent_file_id == TorrentFile.id)
+        .where(FileTorrentLinkModel.torrent_id == torrent_id)
+        .group_by(TorrentFile.directory_id)
+    ).all()
+    nodes = directory_nodes(session, [directory_id for directory_id, _, _ in stats if directory_id is not None])
+    tree = {
+        directory_id: TreeDirectory(id=directory_id, parent_id=parent_id, name=name)
+        for directory_id, (parent_id, name) in nodes.items()
+    }
+    total_files = total_size = 0
+    for directory_id, files, size in stats:
+        total_files += files
+        total_size += size
+        while directory_id is not None:
+            directory = tree[directory_id]
+            directory.files += files
+            directory.size += size
+            directory_id = directory.parent_id
+    return tree, total_files, total_size
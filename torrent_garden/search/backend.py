@@ -0,0 +1,50 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlmodel import Session
+
+from torrent_garden.db.keyset import PageRequest
+from torrent_garden.search.query import FileQuery, SearchResult, TorrentQuery
+
+T = TypeVar("T")
+
+
+class SearchBackend:
+    """Answers the search pages with the ids of matching torrents and files.
+
+    Backends with `indexes_ingest` get to see what is stored: `index_torrents` and `index_files` are called with
+    the rows of each committed ingest transaction. Backends that search the database itself need nothing of the
+    kind. `start` and `stop` run with the application lifespan.
+    """
+
+    name: str = ""
+    indexes_ingest: bool = False
+
+    def search_torrents(self, session: Session, query: TorrentQuery, request: PageRequest) -> Optional[SearchResult]:
+        """Return a page of torrents whose name matches, or None if the query has nothing to search."""
+        raise NotImplementedError
+
+    def search_files(self, session: Session, query: FileQuery, request: PageRequest) -> Optional[SearchResult]:
+        """Return a page of files matching the query, or None if it has nothing to search.
+
+        Queries whose text fails `path_query_error` are not searched, callers check it to tell the user why.
+        Cursors of a result only apply to the same query on the same backend.
+        """
+        raise NotImplementedError
+
+    def index_torrents(self, torrents: Iterable[Tuple[int, str]]):
+        """Take (id, name) of new torrents into account."""
+
+    def index_files(self, files: Iterable[Tuple[int, str]]):
+        """Take (id, name) of new files into account."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+def in_order(rows: Iterable[T], ids: Sequence[int], key=lambda row: row.id) -> List[T]:
+    """Return the rows loaded for `ids` in the order of `ids`; ids without a row are skipped."""
+    by_id: Dict[int, T] = {key(row): row for row in rows}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
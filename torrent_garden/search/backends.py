@@ -0,0 +1,47 @@
+"""The search backend of the application, chosen with TORRENT_GARDEN_SEARCH_BACKEND."""
+from pathlib import Path
+from typing import Iterable, Tuple
+
+from sqlmodel import Session
+
+from torrent_garden import (
+    TORRENT_GARDEN_FILE_SIMILARITY_THRESHOLD,
+    TORRENT_GARDEN_SEARCH_BACKEND,
+    TORRENT_GARDEN_SEARCH_FLUSH_INTERVAL_MS,
+    TORRENT_GARDEN_SEARCH_INDEX_DIR,
+    TORRENT_GARDEN_SEARCH_MAX_SEGMENTS,
+)
+from torrent_garden.db.hooks import staged
+from torrent_garden.search.backend import SearchBackend
+from torrent_garden.search.embedded import EmbeddedSearchBackend
+from torrent_garden.search.sql import SqlSearchBackend
+
+
+def create_search_backend(name: str) -> SearchBackend:
+    if name == SqlSearchBackend.name:
+        return SqlSearchBackend()
+    if name == EmbeddedSearchBackend.name:
+        return EmbeddedSearchBackend(
+            directory=Path(TORRENT_GARDEN_SEARCH_INDEX_DIR),
+            flush_interval=TORRENT_GARDEN_SEARCH_FLUSH_INTERVAL_MS / 1000,
+            max_segments=TORRENT_GARDEN_SEARCH_MAX_SEGMENTS,
+            similarity_threshold=TORRENT_GARDEN_FILE_SIMILARITY_THRESHOLD,
+        )
+    raise ValueError(
+        f"Unknown search backend {name!r}, expected {SqlSearchBackend.name} or {EmbeddedSearchBackend.name}"
+    )
+
+
+search_backend = create_search_backend(TORRENT_GARDEN_SEARCH_BACKEND)
+
+
+def index_torrents_on_commit(session: Session, torrents: Iterable[Tuple[int, str]]):
+    """Hand (id, name) of new torrents to the search backend once the session commits."""
+    if search_backend.indexes_ingest:
+        staged(session, "search_torrents", list, search_backend.index_torrents).extend(torrents)
+
+
+def index_files_on_commit(session: Session, files: Iterable[Tuple[int, str]]):
+    """Hand (id, name) of new files to the search backend once the session commits."""
+    if search_backend.indexes_ingest:
+        staged(session, "search_files", list, search_backend.index_files).extend(files)
@@ -0,0 +1,273 @@
+"""Search pages cached in Valkey, shared by every process and visitor.
+
+Popular searches are asked over and over, each time searching and loading the rows of the page anew. A page is
+cached under its normalized query, the backend, the page size and the cursor, together with a compact projection
+of its rows: the columns the search pages show. A hit answers the page without reaching Postgres at all.
+
+Entries are invalidated by generation rather than deleted: every cached table has a counter in Valkey and entries
+hold the generation they were computed at, an entry of an older generation is a miss. Ingest marks the tables it
+adds rows or links to, and the marked tables have their generation incremented every
+TORRENT_GARDEN_SEARCH_CACHE_STALENESS_MS by a background thread. Searches therefore miss new torrents and files for
+at most that long, and a busy ingest invalidates the cache once per interval instead of with every batch. Views,
+downloads and sightings are not tracked; they are as old as the entry, at most TORRENT_GARDEN_SEARCH_CACHE_TTL
+seconds.
+
+Valkey is never required: when it fails the cache is skipped for `RETRY_AFTER` seconds and searches go to the
+backend as if it was disabled.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from enum import StrEnum
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, Generic, List, Optional, Set, TypeVar
+
+import redis
+from reflex.config import get_config
+from sqlmodel import Session
+
+from torrent_garden import (
+    TORRENT_GARDEN_SEARCH_CACHE_ENABLE,
+    TORRENT_GARDEN_SEARCH_CACHE_STALENESS_MS,
+    TORRENT_GARDEN_SEARCH_CACHE_TIMEOUT_MS,
+    TORRENT_GARDEN_SEARCH_CACHE_TTL,
+    logger,
+)
+from torrent_garden.db.hooks import staged
+from torrent_garden.db.keyset import PageRequest
+from torrent_garden.db.model import Torrent
+from torrent_garden.db.query import files_by_id, torrents_by_id
+from torrent_garden.db.totals import Total, TotalKind
+from torrent_garden.db.tree import ListedFile, listed_files
+from torrent_garden.search.backend import in_order
+from torrent_garden.search.backends import search_backend
+from torrent_garden.search.query import FileQuery, SearchMode, SearchResult, TorrentQuery
+from torrent_garden.utils.flusher import PeriodicFlusher
+from torrent_garden.utils.metrics import registry
+
+T = TypeVar("T")
+
+GENERATION_KEY = "torrent_garden:search:generation:{table}"
+PAGE_KEY = "torrent_garden:search:page:{table}:{digest}"
+
+# Seconds to go without the cache once Valkey failed
+RETRY_AFTER = 10
+
+search_cache_requests_total = registry.counter(
+    "torrent_garden_search_cache_requests_total",
+    "Search pages asked of the cache per table and outcome: hit, miss, stale or unavailable.",
+    labels=("table", "outcome"),
+)
+search_cache_seconds = registry.histogram(
+    "torrent_garden_search_cache_seconds",
+    "Time to answer a search page per table and outcome, searching and loading the rows included on misses.",
+    labels=("table", "outcome"),
+)
+
+
+class CachedTable(StrEnum):
+    TORRENTS = "torrent"
+    FILES = "torrentfile"
+
+
+@dataclass
+class SearchPage(Generic[T]):
+    result: SearchResult
+    # Rows of `result.ids`, in the same order; ids whose row is gone are skipped
+    rows: List[T]
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return None if value is None else value.isoformat()
+
+
+def _datetime(value: Optional[str]) -> Optional[datetime]:
+    return None if value is None else datetime.fromisoformat(value)
+
+
+def dump_torrent(torrent: Torrent) -> List[Any]:
+    return [
+        torrent.id, torrent.name, torrent.info_hash, torrent.size, torrent.file_count, torrent.seen_count,
+        torrent.views, torrent.downloads, _timestamp(torrent.created_at), _timestamp(torrent.updated_at),
+    ]
+
+
+def load_torrent(values: List[Any]) -> Torrent:
+    torrent_id, name, info_hash, size, file_count, seen_count, views, downloads, created_at, updated_at = values
+    return Torrent(
+        id=torrent_id, name=name, info_hash=info_hash, size=size, file_count=file_count, seen_count=seen_count,
+        views=views, downloads=downloads, created_at=_datetime(created_at), updated_at=_datetime(updated_at),
+    )
+
+
+def dump_file(file: ListedFile) -> List[Any]:
+    return [file.id, file.path, file.size, file.torrent_ids]
+
+
+def load_file(values: List[Any]) -> ListedFile:
+    file_id, path, size, torrent_ids = values
+    return ListedFile(id=file_id, path=path, size=size, torrent_ids=torrent_ids)
+
+
+class SearchCache(PeriodicFlusher):
+    def __init__(self, url: Optional[str], ttl: int, staleness: float, timeout: float):
+        super().__init__("search-cache-generations", staleness)
+        self.ttl = ttl
+        self._client = (
+            redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout) if url else None
+        )
+        self._lock = threading.Lock()
+        self._changed: Set[CachedTable] = set()
+        self._skip_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._client is not None
+
+    def changed(self, tables: Set[CachedTable]):
+        """Invalidate the pages of `tables` with the next generation, see the module docstring."""
+        with self._lock:
+            self._changed |= tables
+
+    def flush(self):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        if not changed or self._client is None:
+            return
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            for table in sorted(changed):
+                pipeline.incr(GENERATION_KEY.format(table=table))
+            pipeline.execute()
+        except redis.RedisError:
+            # Keep them for the next flush rather than serving stale pages until the entries expire
+            self.changed(changed)
+            raise
+        logger.debug(f"Started a new search cache generation of {', '.join(sorted(changed))}")
+
+    def _unavailable(self, error: redis.RedisError):
+        self._skip_until = monotonic() + RETRY_AFTER
+        logger.warning(f"Search cache unavailable, skipping it for {RETRY_AFTER}s: {error}")
+
+    def fetch(
+        self,
+        table: CachedTable,
+        key: Dict[str, Any],
+        compute: Callable[[], Optional[SearchPage[T]]],
+        dump: Callable[[T], List[Any]],
+        load: Callable[[List[Any]], T],
+    ) -> Optional[SearchPage[T]]:
+        """Return the cached page of `key` if it is of the current generation of `table`, else compute and cache it.
+
+        Pages computed as None, queries with nothing to search, are not cached.
+        """
+        if self._client is None:
+            return compute()
+        start = perf_counter()
+        if monotonic() < self._skip_until:
+            page = compute()
+            search_cache_requests_total.inc(table=table, outcome="unavailable")
+            search_cache_seconds.observe(perf_counter() - start, table=table, outcome="unavailable")
+            return page
+
+        page_key = PAGE_KEY.format(
+            table=table, digest=hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest(),
+        )
+        try:
+            cached, generation = self._client.mget(page_key, GENERATION_KEY.format(table=table))
+        except redis.RedisError as e:
+            self._unavailable(e)
+            cached, generation, outcome = None, None, "unavailable"
+        else:
+            generation = int(generation or 0)
+            entry = json.loads(cached) if cached is not None else None
+            if entry is not None and entry["generation"] == generation:
+                page = SearchPage(
+                    result=SearchResult(
+                        ids=entry["ids"],
+                        total=Total(entry["total"], TotalKind(entry["total_kind"])),
+                        next_cursor=entry["next_cursor"],
+                        prev_cursor=entry["prev_cursor"],
+                    ),
+                    rows=[load(values) for values in entry["rows"]],
+                )
+                search_cache_requests_total.inc(table=table, outcome="hit")
+                search_cache_seconds.observe(perf_counter() - start, table=table, outcome="hit")
+                return page
+            outcome = "miss" if entry is None else "stale"
+
+        page = compute()
+        if page is not None and outcome != "unavailable":
+            # Stored with the generation read before computing: should it have moved on meanwhile, the entry is
+            # stale right away rather than hiding the new rows
+            entry = {
+                "generation": generation,
+                "ids": page.result.ids,
+                "total": page.result.total.value,
+                "total_kind": page.result.total.kind.value,
+                "next_cursor": page.result.next_cursor,
+                "prev_cursor": page.result.prev_cursor,
+                "rows": [dump(row) for row in page.rows],
+            }
+            try:
+                self._client.set(page_key, json.dumps(entry, separators=(",", ":")), ex=self.ttl)
+            except redis.RedisError as e:
+                self._unavailable(e)
+        search_cache_requests_total.inc(table=table, outcome=outcome)
+        search_cache_seconds.observe(perf_counter() - start, table=table, outcome=outcome)
+        return page
+
+
+search_cache = SearchCache(
+    url=get_config().redis_url if TORRENT_GARDEN_SEARCH_CACHE_ENABLE else None,
+    ttl=TORRENT_GARDEN_SEARCH_CACHE_TTL,
+    staleness=TORRENT_GARDEN_SEARCH_CACHE_STALENESS_MS / 1000,
+    timeout=TORRENT_GARDEN_SEARCH_CACHE_TIMEOUT_MS / 1000,
+)
+
+
+def invalidate_on_commit(session: Session, table: CachedTable):
+    """Invalidate the cached pages of `table` once the session commits rows to it."""
+    if search_cache.enabled:
+        staged(session, "search_cache", set, search_cache.changed).add(table)
+
+
+def _page_key(query: Any, request: PageRequest) -> Dict[str, Any]:
+    return {"backend": search_backend.name, "query": asdict(query), "limit": request.limit, "cursor": request.cursor}
+
+
+def search_torrent_page(session: Session, query: TorrentQuery, request: PageRequest) -> Optional[SearchPage[Torrent]]:
+    """The search backend's page of torrents with their rows, from the cache where possible."""
+    # Every backend and mode ignores case, and words are separated by any run of whitespace, so queries differing
+    # only in either share their pages
+    text = query.text.strip().lower()
+    query = TorrentQuery(text=" ".join(text.split()) if query.mode == SearchMode.WORDS else text, mode=query.mode)
+
+    def compute() -> Optional[SearchPage[Torrent]]:
+        result = search_backend.search_torrents(session, query, request)
+        if result is None:
+            return None
+        return SearchPage(result=result, rows=in_order(session.exec(torrents_by_id(result.ids)).all(), result.ids))
+
+    return search_cache.fetch(CachedTable.TORRENTS, _page_key(query, request), compute, dump_torrent, load_torrent)
+
+
+def search_file_page(session: Session, query: FileQuery, request: PageRequest) -> Optional[SearchPage[ListedFile]]:
+    """The search backend's page of files with their paths and torrent ids, from the cache where possible."""
+    query = FileQuery(
+        text=query.text.strip().lower(),
+        mode=query.mode,
+        extension=query.extension.strip().lstrip(".").lower(),
+        category=query.category,
+    )
+
+    def compute() -> Optional[SearchPage[ListedFile]]:
+        result = search_backend.search_files(session, query, request)
+        if result is None:
+            return None
+        files = in_order(session.exec(files_by_id(result.ids)).all(), result.ids)
+        return SearchPage(result=result, rows=listed_files(session, files, with_torrents=True))
+
+    return search_cache.fetch(CachedTable.FILES, _page_key(query, request), compute, dump_file, load_file)
@@ -0,0 +1,270 @@
+"""Search in inverted indexes kept on local disk next to the application, see `search/index.py`.
+
+Torrent and file names are indexed by word as they are ingested, so searches cost a few lookups per query word and
+never touch the database, whose only work left is loading the rows of a page. Torrent names also index each pair of
+consecutive words to find "phrases"; longer phrases are checked on the names of the torrents having all their pairs,
+see `PhraseMatch`. File names index their extensions and category as facets.
+
+The modes match those of the SQL backend word by word rather than on the whole text:
+
+- Words finds the same torrents, ranked newest first instead of by relevance.
+- Contains finds names with a word containing each query word, e.g. "264" in "x264"; words shorter than
+  `PATH_QUERY_MIN_WORD` only match the start of words, which keeps them from scanning the whole dictionary.
+- Similar finds file names with a word sharing enough trigrams with each query word, see `InvertedIndex.similar`.
+
+Pages walk the matching ids newest first from the cursor on and stop after the page, see `Intersection`. Totals
+walk the first TORRENT_GARDEN_TOTALS_CAP + 1 matches only, like the SQL backend counts them, beyond which they are
+estimated from how many of the newest ids match, see `db/totals.py`.
+
+Documents are added in memory and written out by a background thread every TORRENT_GARDEN_SEARCH_FLUSH_INTERVAL_MS,
+or earlier when many are waiting; documents not yet written are lost on a crash and found again by
+`utils/build_search_index.py`.
+"""
+from itertools import islice
+from pathlib import Path
+from typing import Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlmodel import Session
+
+from torrent_garden import logger
+from torrent_garden.db.classify import SUFFIX_MAX_DOTS, classify_path, file_extension
+from torrent_garden.db.keyset import PageRequest, page_of_ids
+from torrent_garden.db.query import torrent_names_by_id
+from torrent_garden.db.totals import Total, totals
+from torrent_garden.search.backend import SearchBackend
+from torrent_garden.search.index import FACET, Intersection, InvertedIndex, Postings
+from torrent_garden.search.query import (
+    PATH_QUERY_MIN_WORD,
+    FileQuery,
+    PathSearchMode,
+    SearchMode,
+    SearchResult,
+    SearchTerm,
+    TorrentQuery,
+    parse_search_query,
+    path_query_error,
+    search_words,
+)
+from torrent_garden.utils.flusher import PeriodicFlusher
+
+# Flush early once the documents waiting in memory hold this many ids
+PENDING_MAX_IDS = 1_000_000
+# Names loaded per statement to check phrases, see `PhraseMatch`
+PHRASE_CHECK_BATCH = 500
+
+
+def extension_facet(extension: str) -> str:
+    return f"{FACET}ext={extension}"
+
+
+def category_facet(category: str) -> str:
+    return f"{FACET}cat={category}"
+
+
+def name_terms(name: str) -> List[str]:
+    words = search_words(name)
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def file_terms(name: str) -> List[str]:
+    terms = search_words(name) + [category_facet(classify_path(name).value)]
+    if file_extension(name):
+        # Every suffix from the last few dots, to find both "gz" and "tar.gz"
+        name = name.lower()
+        position = len(name)
+        for _ in range(SUFFIX_MAX_DOTS):
+            position = name.rfind(".", 0, position)
+            if position < 0:
+                break
+            terms.append(extension_facet(name[position + 1:]))
+    return terms
+
+
+def has_phrase(words: List[str], term: SearchTerm) -> bool:
+    """Whether the words of `term` follow each other in `words`, the last one as a prefix for a prefix term."""
+    *head, last = term.words
+    for i in range(len(words) - len(head)):
+        if words[i:i + len(head)] == head and (
+            words[i + len(head)].startswith(last) if term.prefix else words[i + len(head)] == last
+        ):
+            return True
+    return False
+
+
+class PhraseMatch(Intersection):
+    """Matches of `match` whose names have every phrase of `included` and none of `excluded`.
+
+    The index knows pairs of consecutive words only, so a name having every pair of a phrase of three words or more
+    may still not have them in a row, e.g. "a b c" in "a b x b c". Such names are loaded in batches and checked word
+    by word like the SQL backend matches phrases. Excluded phrases come with the intersection of their pairs: only
+    names in it can have the phrase.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        match: Intersection,
+        included: List[SearchTerm],
+        excluded: List[Tuple[SearchTerm, Intersection]],
+    ):
+        super().__init__(match.included, match.excluded)
+        self.session = session
+        self.phrases = included
+        self.excluded_phrases = excluded
+
+    def walk(self, start: Optional[int], descending: bool) -> Iterator[int]:
+        candidates = super().walk(start, descending)
+        while batch := list(islice(candidates, PHRASE_CHECK_BATCH)):
+            unsure = {
+                doc_id for doc_id in batch
+                if self.phrases or any(doc_id in pairs for _, pairs in self.excluded_phrases)
+            }
+            names = dict(self.session.exec(torrent_names_by_id(list(unsure))).all()) if unsure else {}
+            for doc_id in batch:
+                if doc_id not in unsure:
+                    yield doc_id
+                elif doc_id in names:
+                    words = search_words(names[doc_id])
+                    if all(has_phrase(words, term) for term in self.phrases) and not any(
+                        has_phrase(words, term) for term, _ in self.excluded_phrases
+                    ):
+                        yield doc_id
+
+
+def _count(match: Intersection) -> Total:
+    walked = list(islice(match.walk(None, True), totals.cap + 1))
+
+    def estimate() -> int:
+        # Ids grow with insertion: the share of the newest ids that match, over all ids
+        first, last = walked[0], walked[-1]
+        return min(match.upper_bound, len(walked) * first // (first - last + 1))
+
+    return totals.capped(len(walked), estimate)
+
+
+def _result(match: Intersection, request: PageRequest, key: Hashable) -> SearchResult:
+    # Ids grow with insertion, newest first like the listings
+    page = page_of_ids(match.walk, request)
+    return SearchResult(
+        ids=page.rows,
+        total=totals.cached(key, lambda: _count(match)),
+        next_cursor=page.next_cursor,
+        prev_cursor=page.prev_cursor,
+    )
+
+
+class IndexFlusher(PeriodicFlusher):
+    def __init__(self, indexes: List[InvertedIndex], interval: float):
+        super().__init__("search-index-flusher", interval)
+        self.indexes = indexes
+
+    def flush(self):
+        for index in self.indexes:
+            index.flush()
+            while index.merge():
+                pass
+
+
+class EmbeddedSearchBackend(SearchBackend):
+    name = "embedded"
+    indexes_ingest = True
+
+    def __init__(self, directory: Path, flush_interval: float, max_segments: int, similarity_threshold: float):
+        self.torrents = InvertedIndex(directory / "torrents", max_segments)
+        self.files = InvertedIndex(directory / "files", max_segments)
+        self.similarity_threshold = similarity_threshold
+        self.flusher = IndexFlusher([self.torrents, self.files], flush_interval)
+
+    # ----- Indexing -----
+    def index_torrents(self, torrents: Iterable[Tuple[int, str]]):
+        for torrent_id, name in torrents:
+            self.torrents.add(torrent_id, name_terms(name))
+        self._flush_if_full(self.torrents)
+
+    def index_files(self, files: Iterable[Tuple[int, str]]):
+        for file_id, name in files:
+            self.files.add(file_id, file_terms(name))
+        self._flush_if_full(self.files)
+
+    def _flush_if_full(self, index: InvertedIndex):
+        if index.pending_ids >= PENDING_MAX_IDS:
+            self.flusher.wake()
+
+    def start(self):
+        self.flusher.start()
+        logger.info(
+            f"Search index has {self.torrents.segment_count()} torrent and {self.files.segment_count()} file segments"
+        )
+
+    def stop(self):
+        self.flusher.stop()
+
+    # ----- Searching -----
+    def _term_postings(self, term: SearchTerm) -> List[Postings]:
+        """Postings a torrent must all be in to match `term`: of its word, or of each pair of its words."""
+        if len(term.words) == 1:
+            word = term.words[0]
+            return [self.torrents.prefixed(word) if term.prefix else self.torrents.exact(word)]
+        pairs = [f"{first} {second}" for first, second in zip(term.words, term.words[1:])]
+        return [self.torrents.exact(pair) for pair in pairs[:-1]] + [
+            self.torrents.prefixed(pairs[-1]) if term.prefix else self.torrents.exact(pairs[-1])
+        ]
+
+    def _word_postings(self, index: InvertedIndex, word: str, mode: PathSearchMode) -> Postings:
+        if len(word) < PATH_QUERY_MIN_WORD:
+            return index.prefixed(word)
+        if mode == PathSearchMode.SIMILAR:
+            return index.similar(word, self.similarity_threshold)
+        return index.containing(word)
+
+    def search_torrents(self, session: Session, query: TorrentQuery, request: PageRequest) -> Optional[SearchResult]:
+        key = (self.name, "torrents", query.text, query.mode)
+        if query.mode == SearchMode.CONTAINS:
+            words = search_words(query.text)
+            if not words:
+                return None
+            match = _intersection(self._word_postings(self.torrents, word, PathSearchMode.CONTAINS) for word in words)
+            return _result(match, request, key)
+        parsed = parse_search_query(query.text)
+        if parsed is None:
+            return None
+        # Phrases of three words or more are checked on the names, see PhraseMatch
+        included = [term for term in parsed.included if len(term.words) > 2]
+        excluded = [term for term in parsed.excluded if len(term.words) > 2]
+        match = _intersection(
+            (postings for term in parsed.included for postings in self._term_postings(term)),
+            excluded=[Intersection(self._term_postings(term)) for term in parsed.excluded if len(term.words) <= 2],
+        )
+        if included or excluded:
+            match = PhraseMatch(
+                session, match, included, [(term, Intersection(self._term_postings(term))) for term in excluded]
+            )
+        return _result(match, request, key)
+
+    def search_files(self, session: Session, query: FileQuery, request: PageRequest) -> Optional[SearchResult]:
+        if query.is_empty:
+            return None
+        lookups = []
+        if query.text.strip():
+            if path_query_error(query.text) is not None:
+                return None
+            lookups += [
+                lambda word=word: self._word_postings(self.files, word, query.mode) for word in search_words(query.text)
+            ]
+        extension = query.extension.strip().lstrip(".").lower()
+        if extension:
+            lookups.append(lambda: self.files.exact(extension_facet(extension)))
+        if query.category:
+            lookups.append(lambda: self.files.exact(category_facet(query.category)))
+        key = (self.name, "files", query.text, query.mode, extension, query.category)
+        return _result(_intersection(lookup() for lookup in lookups), request, key)
+
+
+def _intersection(lookups: Iterable[Postings], excluded: Sequence[Intersection] = ()) -> Intersection:
+    """Intersect lookups lazily, the remaining ones are not run once one of them found nothing."""
+    included = []
+    for postings in lookups:
+        included.append(postings)
+        if not postings.lists:
+            break
+    return Intersection(included, excluded)
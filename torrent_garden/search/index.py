@@ -0,0 +1,431 @@
+"""Embedded inverted index: the ids of the documents containing each term, in memory-mapped segments on local disk.
+
+A document is an id with its terms, e.g. a torrent with the words of its name. Added documents are held in memory,
+where they can be searched right away, until `flush` writes them out as a new segment. Segments are immutable;
+`merge` rewrites the smallest of them into one when there are more than `max_segments`. Several processes may share
+a directory: segment files get unique names and appear with an atomic rename, merges are serialized by a file lock,
+and every process picks up the segments of the others when the directory changes. A document found in two
+segments, e.g. while a merge replaces its inputs, is counted once. Documents are never removed or changed.
+
+Lookups return `Postings`, the sorted id lists of the matching terms as they are in the segments, rather than a
+set of their ids. An `Intersection` of lookups is walked in id order from any id on, seeking in the lists of the
+others with each id of the smallest, so a page reads about as many ids as it shows however many documents match.
+
+Segment layout, little endian:
+
+    header         magic, version, term count, highest id (4 x uint32), id count, terms size (2 x uint64)
+    term offsets   term count + 1 x uint64, start of each term in the terms
+    id offsets     term count + 1 x uint64, start of the ids of each term in the ids
+    terms          the terms in byte order, UTF-8, each followed by a newline, padded to 4 bytes
+    ids            uint32 document ids, ascending for each term
+"""
+import fcntl
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from torrent_garden import logger
+
+MAGIC = b"TGSI"
+VERSION = 1
+_HEADER = struct.Struct("<4sIIIQQ")
+SEGMENT_SUFFIX = ".seg"
+_SEPARATOR = b"\n"
+# Sorts after every byte of UTF-8, so prefix + _AFTER bounds the terms starting with prefix
+_AFTER = b"\xff"
+# Terms starting with this are attributes such as a file extension, they are never matched by substring
+FACET = "\x1f"
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class Segment:
+    """A read-only segment file, mapped into memory."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.term_count, self.max_id, id_count, terms_size = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a search index segment of version {VERSION}: {path}")
+        if sys.byteorder == "big":
+            raise RuntimeError("Search index segments can only be mapped on little endian machines")
+        view = memoryview(self._map)
+        position = _HEADER.size
+        offsets_size = 8 * (self.term_count + 1)
+        self._term_offsets = view[position:position + offsets_size].cast("Q")
+        position += offsets_size
+        self._id_offsets = view[position:position + offsets_size].cast("Q")
+        position += offsets_size
+        self._terms_start = position
+        self._terms_end = position + terms_size
+        position = self._terms_end + -self._terms_end % 4
+        self._ids = view[position:position + 4 * id_count].cast("I")
+
+    def term(self, i: int) -> bytes:
+        return self._map[self._terms_start + self._term_offsets[i]:self._terms_start + self._term_offsets[i + 1] - 1]
+
+    def ids(self, i: int) -> memoryview:
+        return self._ids[self._id_offsets[i]:self._id_offsets[i + 1]]
+
+    def _bisect(self, key: bytes) -> int:
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def exact(self, term: bytes) -> Iterable[int]:
+        i = self._bisect(term)
+        return (i,) if i < self.term_count and self.term(i) == term else ()
+
+    def prefixed(self, prefix: bytes) -> Iterable[int]:
+        return range(self._bisect(prefix), self._bisect(prefix + _AFTER))
+
+    def containing(self, needle: bytes) -> Iterator[int]:
+        """Indexes of the terms containing `needle`, facets excepted; the terms are searched as one block."""
+        start = self._terms_start
+        while True:
+            found = self._map.find(needle, start, self._terms_end)
+            if found < 0:
+                return
+            i = bisect_right(self._term_offsets, found - self._terms_start) - 1
+            if self._map[self._terms_start + self._term_offsets[i]] != ord(FACET):
+                yield i
+            start = self._terms_start + self._term_offsets[i + 1]
+
+    def entries(self) -> Iterator[Tuple[bytes, memoryview]]:
+        for i in range(self.term_count):
+            yield self.term(i), self.ids(i)
+
+
+class SegmentWriter:
+    """Writes a segment from terms added in byte order, without holding its ids in memory."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._term_offsets = array("Q", [0])
+        self._id_offsets = array("Q", [0])
+        self._terms = tempfile.TemporaryFile(dir=path.parent)
+        self._ids = tempfile.TemporaryFile(dir=path.parent)
+        self._max_id = 0
+        self._last: Optional[bytes] = None
+
+    def add(self, term: bytes, ids: Iterable[int]):
+        """Add a term with its ids in ascending order, repeated ids are written once."""
+        if self._last is not None and term <= self._last:
+            raise ValueError(f"Terms must be added in ascending order: {term!r} after {self._last!r}")
+        unique = array("I")
+        previous = -1
+        for doc_id in ids:
+            if doc_id != previous:
+                unique.append(doc_id)
+                previous = doc_id
+        if not unique:
+            return
+        self._last = term
+        self._max_id = max(self._max_id, unique[-1])
+        self._terms.write(term + _SEPARATOR)
+        self._term_offsets.append(self._terms.tell())
+        self._id_offsets.append(self._id_offsets[-1] + len(unique))
+        _little_endian(unique).tofile(self._ids)
+
+    def close(self) -> Path:
+        """Write the segment next to its final path and rename it into place, so that it appears complete."""
+        temporary = self.path.with_suffix(".tmp")
+        terms_size = self._terms.tell()
+        with open(temporary, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, len(self._term_offsets) - 1, self._max_id, self._id_offsets[-1], terms_size))
+            _little_endian(self._term_offsets).tofile(file)
+            _little_endian(self._id_offsets).tofile(file)
+            for source in (self._terms, self._ids):
+                source.seek(0)
+                shutil.copyfileobj(source, file)
+                if source is self._terms:
+                    file.write(b"\0" * (-terms_size % 4))
+                source.close()
+            file.flush()
+            os.fsync(file.fileno())
+        os.rename(temporary, self.path)
+        return self.path
+
+
+class Postings:
+    """Documents of a lookup: the ascending id lists of each matching term, in the segments and in memory.
+
+    The lists are read in place and merged as they are walked; a document in several of them is found once.
+    """
+
+    def __init__(self, lists: Iterable[Sequence[int]]):
+        self.lists = [ids for ids in lists if len(ids)]
+
+    @property
+    def size(self) -> int:
+        """Ids in all lists, at least the number of documents."""
+        return sum(len(ids) for ids in self.lists)
+
+    def __contains__(self, doc_id: int) -> bool:
+        for ids in self.lists:
+            i = bisect_left(ids, doc_id)
+            if i < len(ids) and ids[i] == doc_id:
+                return True
+        return False
+
+    def seek(self, doc_id: int, descending: bool) -> Optional[int]:
+        """The first document at `doc_id` or after it in the walk order, None if there is none."""
+        found = None
+        for ids in self.lists:
+            if descending:
+                i = bisect_right(ids, doc_id)
+                if i and (found is None or ids[i - 1] > found):
+                    found = ids[i - 1]
+            else:
+                i = bisect_left(ids, doc_id)
+                if i < len(ids) and (found is None or ids[i] < found):
+                    found = ids[i]
+        return found
+
+    def walk(self, start: Optional[int], descending: bool) -> Iterator[int]:
+        """Documents from `start` on, highest first when `descending`; from the first one when `start` is None."""
+        if descending:
+            lists = [reversed(ids if start is None else ids[:bisect_right(ids, start)]) for ids in self.lists]
+        else:
+            lists = [iter(ids if start is None else ids[bisect_left(ids, start):]) for ids in self.lists]
+        previous = None
+        for doc_id in heapq.merge(*lists, reverse=descending):
+            if doc_id != previous:
+                yield doc_id
+                previous = doc_id
+
+
+class Intersection:
+    """Documents found by every one of `included` and not by all postings of any of `excluded`."""
+
+    def __init__(self, included: List[Postings], excluded: Sequence["Intersection"] = ()):
+        self.included = included
+        self.excluded = excluded
+
+    @property
+    def upper_bound(self) -> int:
+        return min((postings.size for postings in self.included), default=0)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return bool(self.included) and all(doc_id in postings for postings in self.included)
+
+    def walk(self, start: Optional[int], descending: bool) -> Iterator[int]:
+        """Matching documents from `start` on, like `Postings.walk`.
+
+        The smallest postings drive the walk; the others are sought to each of its ids, and the ids up to the
+        document they continue with are skipped.
+        """
+        if not self.included or not all(postings.lists for postings in self.included):
+            return
+        driver, *others = sorted(self.included, key=lambda postings: postings.size)
+        skip_to = None
+        for doc_id in driver.walk(start, descending):
+            if skip_to is not None and (doc_id > skip_to if descending else doc_id < skip_to):
+                continue
+            for postings in others:
+                found = postings.seek(doc_id, descending)
+                if found is None:
+                    return
+                if found != doc_id:
+                    skip_to = found
+                    break
+            else:
+                if not any(doc_id in excluded for excluded in self.excluded):
+                    yield doc_id
+
+
+def trigrams(word: str) -> Set[str]:
+    """Trigrams of a word padded like pg_trgm does, two spaces in front and one behind."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def word_similarity(word: str, term: str) -> float:
+    """Share of the trigrams of `word` found in `term`, close to pg_trgm word_similarity for single words."""
+    wanted = trigrams(word)
+    return len(wanted & trigrams(term)) / len(wanted)
+
+
+class InvertedIndex:
+    """Documents added in memory and flushed to segments in `directory`, searchable by term."""
+
+    def __init__(self, directory: Path, max_segments: int):
+        self.directory = directory
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Set[int]] = defaultdict(set)
+        self.pending_ids = 0
+        self._segments: Dict[Path, Segment] = {}
+
+    # ----- Writing -----
+    def add(self, doc_id: int, terms: Iterable[str]):
+        with self._lock:
+            for term in terms:
+                self._pending[term].add(doc_id)
+                self.pending_ids += 1
+
+    def flush(self) -> Optional[Path]:
+        """Write the documents added since the last flush to a new segment."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(set)
+            self.pending_ids = 0
+        if not pending:
+            return None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            writer = SegmentWriter(self.directory / f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}")
+            for term, ids in sorted((term.encode(), ids) for term, ids in pending.items()):
+                writer.add(term, sorted(ids))
+            path = writer.close()
+        except Exception:
+            # Keep the documents for the next flush rather than losing them
+            with self._lock:
+                for term, ids in pending.items():
+                    self._pending[term] |= ids
+                    self.pending_ids += len(ids)
+            raise
+        self.refresh()
+        return path
+
+    def merge(self) -> bool:
+        """Merge the smallest segments into one if there are more than `max_segments`; False if nothing was done.
+
+        Only one process merges at a time, the others skip while the lock is held.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "merge.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.refresh()
+            segments = sorted(self._segments.values(), key=lambda segment: segment.path.stat().st_size)
+            if len(segments) <= self.max_segments:
+                return False
+            inputs = segments[:len(segments) - self.max_segments + 1]
+            start = time.perf_counter()
+            writer = SegmentWriter(self.directory / f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}")
+            merged = heapq.merge(*(segment.entries() for segment in inputs), key=lambda entry: entry[0])
+            term, lists = None, []
+            for entry_term, ids in merged:
+                if entry_term != term and lists:
+                    writer.add(term, heapq.merge(*lists))
+                    lists = []
+                term = entry_term
+                lists.append(ids)
+            if lists:
+                writer.add(term, heapq.merge(*lists))
+            writer.close()
+            for segment in inputs:
+                segment.path.unlink()
+        self.refresh()
+        logger.info(f"Merged {len(inputs)} segments of {self.directory} in {time.perf_counter() - start:.1f}s")
+        return True
+
+    # ----- Reading -----
+    def refresh(self):
+        """Map the segments written since the last call, by any process, and forget the removed ones.
+
+        Listing the directory costs microseconds for the few segments it holds, unlike its mtime it never misses two
+        changes in a row.
+        """
+        try:
+            paths = {self.directory / name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX)}
+        except FileNotFoundError:
+            return
+        if paths == self._segments.keys():
+            return
+        segments = {path: segment for path, segment in self._segments.items() if path in paths}
+        for path in paths - segments.keys():
+            try:
+                segments[path] = Segment(path)
+            except FileNotFoundError:
+                # Merged away in the meantime; the next refresh sees the merged segment
+                continue
+        # Mapped segments stay readable after their file is removed, searches running now keep their own list
+        with self._lock:
+            self._segments = segments
+
+    @property
+    def max_id(self) -> int:
+        """Highest document id in the segments, documents not flushed yet excepted."""
+        self.refresh()
+        return max((segment.max_id for segment in self._segments.values()), default=0)
+
+    def _lookup(self, select_segment: Callable[[Segment], Iterable[int]], select_pending: Callable[[str], bool]) -> Postings:
+        self.refresh()
+        with self._lock:
+            segments = list(self._segments.values())
+            lists = [sorted(ids) for term, ids in self._pending.items() if select_pending(term)]
+        for segment in segments:
+            lists.extend(segment.ids(i) for i in select_segment(segment))
+        return Postings(lists)
+
+    def exact(self, term: str) -> Postings:
+        key = term.encode()
+        self.refresh()
+        with self._lock:
+            segments = list(self._segments.values())
+            lists = [sorted(self._pending.get(term, ()))]
+        for segment in segments:
+            lists.extend(segment.ids(i) for i in segment.exact(key))
+        return Postings(lists)
+
+    def prefixed(self, prefix: str) -> Postings:
+        key = prefix.encode()
+        return self._lookup(lambda segment: segment.prefixed(key), lambda term: term.startswith(prefix))
+
+    def containing(self, needle: str) -> Postings:
+        """Documents with a term containing `needle`, which must not contain a newline."""
+        key = needle.encode()
+        return self._lookup(
+            lambda segment: segment.containing(key),
+            lambda term: needle in term and not term.startswith(FACET),
+        )
+
+    def similar(self, word: str, threshold: float) -> Postings:
+        """Documents with a term holding at least `threshold` of the trigrams of `word`, see `word_similarity`.
+
+        Candidates are the terms containing one of the trigrams inside the word, so a typo anywhere still finds
+        the term through the others.
+        """
+        inner = {trigram.encode() for trigram in trigrams(word) if " " not in trigram} or {word.encode()}
+
+        def select_segment(segment: Segment) -> Iterator[int]:
+            candidates = set()
+            for trigram in inner:
+                candidates.update(segment.containing(trigram))
+            for i in candidates:
+                if word_similarity(word, segment.term(i).decode()) >= threshold:
+                    yield i
+
+        return self._lookup(
+            select_segment,
+            lambda term: not term.startswith(FACET) and word_similarity(word, term) >= threshold,
+        )
+
+    def segment_count(self) -> int:
+        self.refresh()
+        return len(self._segments)
@@ -0,0 +1,115 @@
+"""What the search pages ask a search backend for, independent of the backend answering it.
+
+Torrent names are searched by word, with "phrases", prefix* terms and -exclusions, or by substring. File names are
+searched by substring or by similarity, optionally narrowed to an extension or a category. Backends answer with
+the ids of a page of matching rows, the pages load the rows themselves.
+"""
+import re
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import List, Optional
+
+from torrent_garden.db.totals import Total
+
+
+class SearchMode(StrEnum):
+    WORDS = "Words"
+    CONTAINS = "Contains"
+
+
+SEARCH_MODE_OPTIONS = [mode.value for mode in SearchMode]
+SEARCH_PLACEHOLDER = 'Words, "a phrase", prefix*, -excluded'
+
+
+class PathSearchMode(StrEnum):
+    CONTAINS = "Contains"
+    SIMILAR = "Similar"
+
+
+PATH_SEARCH_MODE_OPTIONS = [mode.value for mode in PathSearchMode]
+
+# An optionally negated "phrase" with an optional * after the closing quote, or a bare term
+_TERM = re.compile(r'(-?)(?:"([^"]*)"?(\*?)|([^\s"]+))')
+# Words of a name: runs of letters and digits, every other character separates words, like NAME_SEARCH_EXPRESSION
+# of db/model.py splits them in PostgreSQL
+_WORD = re.compile(r"[^\W_]+")
+
+# Trigram indexes only take trigrams from runs of letters and digits
+PATH_QUERY_MIN_WORD = 3
+_TRIGRAM_WORD = re.compile(rf"[^\W_]{{{PATH_QUERY_MIN_WORD},}}")
+
+
+def search_words(text: str) -> List[str]:
+    """Split a name or query into lower case words, the way every backend indexes them."""
+    return _WORD.findall(text.lower())
+
+
+@dataclass
+class SearchTerm:
+    # Words that must follow each other, a single one for a plain term
+    words: List[str]
+    # Whether the last word also matches longer words
+    prefix: bool = False
+
+
+@dataclass
+class ParsedQuery:
+    included: List[SearchTerm] = field(default_factory=list)
+    excluded: List[SearchTerm] = field(default_factory=list)
+
+
+def parse_search_query(query: str) -> Optional[ParsedQuery]:
+    """Parse a search box query, or return None if it has no word to look for.
+
+    Every word is required, "quoted words" must follow each other, a trailing * also matches longer words
+    (`ubun*`) and a leading - excludes a word or phrase (`-cam`). Terms are split into words like the names, so
+    `x264-GROUP` looks for x264 directly followed by group. A query of exclusions only is not searched, it would
+    match nearly every torrent.
+    """
+    parsed = ParsedQuery()
+    for negate, phrase, phrase_prefix, term in _TERM.findall(query):
+        if phrase or phrase_prefix:
+            words, prefix = search_words(phrase), bool(phrase_prefix)
+        else:
+            words, prefix = search_words(term.rstrip("*")), term.endswith("*")
+        if not words:
+            continue
+        (parsed.excluded if negate else parsed.included).append(SearchTerm(words=words, prefix=prefix))
+    return parsed if parsed.included else None
+
+
+def path_query_error(query: str) -> Optional[str]:
+    """Return why a path query is not searched, or None if it is selective enough for a trigram index."""
+    if not _TRIGRAM_WORD.search(query):
+        return f"Type at least {PATH_QUERY_MIN_WORD} letters or digits in a row"
+    return None
+
+
+@dataclass
+class TorrentQuery:
+    text: str
+    mode: SearchMode = SearchMode.WORDS
+
+
+@dataclass
+class FileQuery:
+    # Searched in the file name, may be empty when an extension or category is given
+    text: str = ""
+    mode: PathSearchMode = PathSearchMode.CONTAINS
+    extension: str = ""
+    category: str = ""
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.text.strip() and not self.extension.strip().lstrip(".") and not self.category
+
+
+@dataclass
+class SearchResult:
+    # Ids of the matching rows of the requested page, in result order
+    ids: List[int]
+    # Number of matching rows over all pages, exact or not, see db/totals.py
+    total: Total
+    # Of the pages next to this one, see db/keyset.py; None where there is none
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
@@ -0,0 +1,173 @@
+"""Search in PostgreSQL, with the indexes of the torrent and torrentfile tables.
+
+Names are searched by word with full-text search: `Torrent.name_search` holds the words of every name and a GIN
+index finds the torrents containing all words of a query, however many torrents are stored. Results are ranked by
+`ts_rank`, newest first among equals, and paged by keyset on the rank, see `db/keyset.py`. The Contains mode is a
+substring search ignoring case; it reads the whole table and finds parts of words, e.g. "264" in "x264".
+
+Files are searched by name, substring or similarity, with the pg_trgm GIN index of `TorrentFile.name`; the
+directories of their path are not searched, files only store the id of theirs, see db/tree.py. The index looks up
+the trigrams of the query, which is why queries without three letters or digits in a row are never sent, see
+`path_query_error`.
+"""
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import REAL, ColumnElement, func
+from sqlmodel import Session, select
+
+from torrent_garden import TORRENT_GARDEN_FILE_SIMILARITY_THRESHOLD
+from torrent_garden.db.classify import CATEGORY_COUNT_NAMES, FileCategory, extension_condition
+from torrent_garden.db.keyset import Keyset, PageRequest
+from torrent_garden.db.model import Torrent, TorrentFile
+from torrent_garden.db.query import matching_files, matching_torrents, search_file_ids, search_torrent_ids
+from torrent_garden.db.totals import Total, totals
+from torrent_garden.search.backend import SearchBackend
+from torrent_garden.search.query import (
+    FileQuery,
+    ParsedQuery,
+    PathSearchMode,
+    SearchMode,
+    SearchResult,
+    SearchTerm,
+    TorrentQuery,
+    parse_search_query,
+    path_query_error,
+)
+
+# Text search configuration of Torrent.name_search: no stemming and no stop words, names are in every language
+SEARCH_CONFIG = "simple"
+
+
+def _term_tsquery(term: SearchTerm) -> str:
+    lexemes = [f"'{word}'" for word in term.words]
+    if term.prefix:
+        lexemes[-1] += ":*"
+    return lexemes[0] if len(lexemes) == 1 else f"({' <-> '.join(lexemes)})"
+
+
+def to_tsquery(parsed: ParsedQuery) -> str:
+    """Render a parsed query for `to_tsquery`; words are letters and digits only, they need no escaping."""
+    return " & ".join(
+        [_term_tsquery(term) for term in parsed.included] + [f"!{_term_tsquery(term)}" for term in parsed.excluded]
+    )
+
+
+# Newest first, served by the (created_at, id) index
+NEWEST_TORRENTS = Keyset((Torrent.created_at, True), (Torrent.id, True))
+# Files without a name search, and files matching a substring
+FILES_BY_NAME = Keyset((TorrentFile.name, False), (TorrentFile.id, False))
+
+
+@dataclass
+class NameSearch:
+    condition: ColumnElement[bool]
+    keyset: Keyset
+
+
+def name_search(query: str, mode: SearchMode) -> Optional[NameSearch]:
+    """Condition and order of the torrents matching a search box query, or None if nothing is to be searched."""
+    query = query.strip()
+    if not query:
+        return None
+    if mode == SearchMode.CONTAINS:
+        return NameSearch(condition=Torrent.name.icontains(query, autoescape=True), keyset=NEWEST_TORRENTS)
+    parsed = parse_search_query(query)
+    if parsed is None:
+        return None
+    tsquery = func.to_tsquery(SEARCH_CONFIG, to_tsquery(parsed))
+    return NameSearch(
+        condition=Torrent.name_search.bool_op("@@")(tsquery),
+        keyset=Keyset(
+            (func.ts_rank(Torrent.name_search, tsquery, type_=REAL), True),
+            (Torrent.created_at, True),
+            (Torrent.id, True),
+        ),
+    )
+
+
+@dataclass
+class PathSearch:
+    condition: ColumnElement[bool]
+    keyset: Keyset
+    # pg_trgm.word_similarity_threshold of the Similar mode, see `prepare`
+    similarity_threshold: Optional[float] = None
+
+    def prepare(self, session: Session):
+        """Apply the settings of the search to the current transaction, before running its statements."""
+        if self.similarity_threshold is not None:
+            session.exec(select(func.set_config("pg_trgm.word_similarity_threshold", str(self.similarity_threshold), True)))
+
+
+def path_search(
+    query: str, mode: PathSearchMode, similarity_threshold: float = TORRENT_GARDEN_FILE_SIMILARITY_THRESHOLD
+) -> Optional[PathSearch]:
+    """Condition and order of the files whose name matches, or None if the query is rejected by `path_query_error`.
+
+    Contains finds the query anywhere in the name, ignoring case. Similar finds names with a part that has at
+    least `similarity_threshold` of its trigrams in common with the query, so typos still match, best first.
+    """
+    query = query.strip()
+    if path_query_error(query) is not None:
+        return None
+    if mode == PathSearchMode.SIMILAR:
+        return PathSearch(
+            condition=TorrentFile.name.op("%>")(query),
+            keyset=Keyset(
+                (func.word_similarity(query, TorrentFile.name, type_=REAL), True),
+                (TorrentFile.name, False),
+                (TorrentFile.id, False),
+            ),
+            similarity_threshold=similarity_threshold,
+        )
+    return PathSearch(condition=TorrentFile.name.icontains(query, autoescape=True), keyset=FILES_BY_NAME)
+
+
+class SqlSearchBackend(SearchBackend):
+    """Searches the database, which keeps its indexes up to date by itself."""
+
+    name = "sql"
+
+    def search_torrents(self, session: Session, query: TorrentQuery, request: PageRequest) -> Optional[SearchResult]:
+        search = name_search(query.text, query.mode)
+        if search is None:
+            return None
+        rows = session.exec(search_torrent_ids(search.condition, search.keyset, request)).all()
+        page = search.keyset.page(rows, request)
+        return SearchResult(
+            ids=page.rows,
+            total=totals.count(session, matching_torrents(search.condition)),
+            next_cursor=page.next_cursor,
+            prev_cursor=page.prev_cursor,
+        )
+
+    def _files_total(self, session: Session, query: FileQuery, conditions: List[ColumnElement[bool]]) -> Total:
+        if query.category and not query.text.strip() and not query.extension.strip().lstrip("."):
+            # Ingest counts the files of each category
+            return totals.stored(session, CATEGORY_COUNT_NAMES[FileCategory(query.category)][0])
+        return totals.count(session, matching_files(conditions))
+
+    def search_files(self, session: Session, query: FileQuery, request: PageRequest) -> Optional[SearchResult]:
+        if query.is_empty:
+            return None
+        conditions: List[ColumnElement[bool]] = []
+        keyset = FILES_BY_NAME
+        if query.text.strip():
+            search = path_search(query.text, query.mode)
+            if search is None:
+                return None
+            search.prepare(session)
+            conditions.append(search.condition)
+            keyset = search.keyset
+        if query.extension.strip().lstrip("."):
+            conditions.append(extension_condition(query.extension))
+        if query.category:
+            conditions.append(TorrentFile.category == query.category)
+        rows = session.exec(search_file_ids(conditions, keyset, request)).all()
+        page = keyset.page(rows, request)
+        return SearchResult(
+            ids=page.rows,
+            total=self._files_total(session, query, conditions),
+            next_cursor=page.next_cursor,
+            prev_cursor=page.prev_cursor,
+        )
@@ -2,7 +2,8 @@ import sys
 
 import reflex as rx
 
-from torrent_garden.api.torrent import api as torrent_api
+from torrent_garden.api.metrics import instrument_app
+from torrent_garden.api.torrent import api as torrent_api, ingest_lifespan
 from torrent_garden.utils.backfill_counts import backfill_counts
 from torrent_garden.utils.create_ads import create_ads
 from torrent_garden.utils.create_clients import create_clients
@@ -11,6 +12,8 @@ app = rx.App(
     theme=rx.theme(accent_color="green"),
     api_transformer=torrent_api,
 )
+app.register_lifespan_task(ingest_lifespan)
+instrument_app(app)
 
 from torrent_garden.db.model import Torrent     # noqa
 from torrent_garden.db.model import TorrentFile # noqa
@@ -3,6 +3,7 @@ from typing import Optional
 import reflex as rx
 from reflex import Component
 
+from torrent_garden.db.info_hash import SHA256_MULTIHASH, V2_SIZE
 from torrent_garden.db.model import Torrent
 from torrent_garden.ui.state.torrent.action import TorrentViewState
 
@@ -13,6 +14,12 @@ class OpenTorrentButton(rx.ComponentState):
         torrent: Torrent = props.pop("torrent")
         icon: str = props.pop("icon", "external-link")
         text: Optional[str] = props.pop("text", None)
+        # v2 info hashes are SHA-256 multihashes in magnet links
+        topic = rx.cond(
+            torrent.info_hash.length() == 2 * V2_SIZE,
+            f"urn:btmh:{SHA256_MULTIHASH}{torrent.info_hash}",
+            f"urn:btih:{torrent.info_hash}",
+        )
 
         return rx.link(
             rx.cond(
@@ -22,7 +29,7 @@ class OpenTorrentButton(rx.ComponentState):
             ),
             on_click=[
                 lambda: TorrentViewState.open(torrent.id),
-                rx.redirect(f"magnet:?xt=urn:btih:{torrent.info_hash}&amp;dn={torrent.name}")
+                rx.redirect(f"magnet:?xt={topic}&amp;dn={torrent.name}")
             ],
             color_scheme="blue",
             **props
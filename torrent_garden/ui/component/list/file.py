@@ -2,11 +2,11 @@ from typing import List
 
 import reflex as rx
 
-from torrent_garden.db.model import TorrentFile
+from torrent_garden.db.tree import ListedFile
 from torrent_garden.ui.helper import pretty_size
 
 
-def file_list_item(f: TorrentFile) -> rx.Component:
+def file_list_item(f: ListedFile) -> rx.Component:
     return rx.card(
         rx.vstack(
             rx.text(
@@ -28,7 +28,7 @@ def file_list_item(f: TorrentFile) -> rx.Component:
     )
 
 
-def file_list(files: List[TorrentFile]) -> rx.Component:
+def file_list(files: List[ListedFile]) -> rx.Component:
     return rx.vstack(
         rx.foreach(files, file_list_item),
         width="100%",
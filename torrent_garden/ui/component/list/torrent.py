@@ -21,7 +21,7 @@ def torrent_list_item(t: Torrent) -> rx.Component:
             # Key facts
             rx.hstack(
                 rx.badge(f"Size: {pretty_size(t.size)}", color_scheme="gray"),
-                rx.badge(f"Files: {t.files.length()}", color_scheme="gray"),
+                rx.badge(f"Files: {t.file_count}", color_scheme="gray"),
                 rx.spacer(),
                 justify="between",
                 width="100%",
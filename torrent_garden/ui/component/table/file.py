@@ -2,7 +2,7 @@ from typing import List
 
 import reflex as rx
 
-from torrent_garden.db.model import TorrentFile
+from torrent_garden.db.tree import ListedFile
 from torrent_garden.ui.helper import pretty_size
 
 
@@ -35,7 +35,7 @@ def file_table_header(sort_by=None, sort_desc=True, on_sort=None) -> rx.Componen
     )
 
 
-def file_table_body_row(file: TorrentFile) -> rx.Component:
+def file_table_body_row(file: ListedFile) -> rx.Component:
     return rx.table.row(
         rx.table.cell(
             rx.text(
@@ -50,11 +50,11 @@ def file_table_body_row(file: TorrentFile) -> rx.Component:
     )
 
 
-def file_table_body(files: List[TorrentFile]) -> rx.Component:
+def file_table_body(files: List[ListedFile]) -> rx.Component:
     return rx.table.body(rx.foreach(files, file_table_body_row))
 
 
-def file_table(files: List[TorrentFile], sort_by=None, sort_desc=True, on_sort=None) -> rx.Component:
+def file_table(files: List[ListedFile], sort_by=None, sort_desc=True, on_sort=None) -> rx.Component:
     return rx.table.root(
         file_table_header(sort_by=sort_by, sort_desc=sort_desc, on_sort=on_sort),
         file_table_body(files),
@@ -2,7 +2,7 @@ from typing import List
 
 import reflex as rx
 
-from torrent_garden.db.model import TorrentFile
+from torrent_garden.db.tree import ListedFile
 from torrent_garden.ui.helper import pretty_size
 from torrent_garden.ui.state.search_files import FileSearchState
 
@@ -37,20 +37,20 @@ def file_search_table_header(sort_by=None, sort_desc=True, on_sort=None) -> rx.C
     )
 
 
-def file_search_action_cell(f: TorrentFile) -> rx.Component:
+def file_search_action_cell(f: ListedFile) -> rx.Component:
     return rx.hstack(
         rx.icon_button(
             rx.icon("chevrons-right"),
             on_click=lambda: FileSearchState.open_related(f.id),
             color_scheme="indigo",
-            disabled=rx.cond(f.torrent.length() == 0, True, False),
+            disabled=rx.cond(f.torrent_ids.length() == 0, True, False),
         ),
         justify="end",
         width="100%",
     )
 
 
-def file_search_table_body_row(f: TorrentFile) -> rx.Component:
+def file_search_table_body_row(f: ListedFile) -> rx.Component:
     return rx.table.row(
         rx.table.cell(
             rx.text(
@@ -66,11 +66,11 @@ def file_search_table_body_row(f: TorrentFile) -> rx.Component:
     )
 
 
-def file_search_table_body(files: List[TorrentFile]) -> rx.Component:
+def file_search_table_body(files: List[ListedFile]) -> rx.Component:
     return rx.table.body(rx.foreach(files, file_search_table_body_row))
 
 
-def file_search_table(files: List[TorrentFile], sort_by=None, sort_desc=True, on_sort=None) -> rx.Component:
+def file_search_table(files: List[ListedFile], sort_by=None, sort_desc=True, on_sort=None) -> rx.Component:
     return rx.table.root(
         file_search_table_header(sort_by=sort_by, sort_desc=sort_desc, on_sort=on_sort),
         file_search_table_body(files),
@@ -57,7 +57,7 @@ def torrent_table_body_row(torrent: Torrent) -> rx.Component:
             overflow="hidden",
         ),
         rx.table.cell(rx.text(pretty_size(torrent.size))),
-        rx.table.cell(rx.text(torrent.files.length())),
+        rx.table.cell(rx.text(torrent.file_count)),
         rx.table.cell(rx.text(torrent.seen_count)),
         rx.table.cell(rx.text(torrent.views)),
         rx.table.cell(rx.text(torrent.downloads)),
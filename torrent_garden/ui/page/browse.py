@@ -4,7 +4,7 @@ from torrent_garden.ui.component.button.debounced import debounced_button
 from torrent_garden.ui.component.table.torrent import torrent_table
 from torrent_garden.ui.component.list.torrent import torrent_list
 from torrent_garden.ui.page.base import page_base
-from torrent_garden.ui.state.browse import BrowseState, MODE_OPTIONS, COUNT_OPTIONS
+from torrent_garden.ui.state.browse import BrowseState, MODE_OPTIONS, COUNT_OPTIONS, Mode
 
 
 def page_browse_table_form() -> rx.Component:
@@ -38,19 +38,16 @@ def page_browse_table_loading() -> rx.Component:
     )
 
 
-def pagination_number_button(number: int) -> rx.Component:
-    return rx.button(
-        rx.text(number),
-        variant=rx.cond(number == BrowseState.page, "solid", "soft"),
-        on_click=lambda: BrowseState.set_page(number),
-    )
-
-
 def pagination_controls() -> rx.Component:
     return rx.hstack(
-        rx.button("Prev", on_click=BrowseState.prev_page, disabled=BrowseState.page <= 1),
-        rx.foreach(BrowseState.page_numbers, pagination_number_button),
-        rx.button("Next", on_click=BrowseState.next_page, disabled=BrowseState.page >= BrowseState.total_pages),
+        rx.button("First", on_click=BrowseState.first_page, disabled=BrowseState.prev_cursor == ""),
+        rx.button("Prev", on_click=BrowseState.prev_page, disabled=BrowseState.prev_cursor == ""),
+        rx.text("Page ", BrowseState.page, " of ", BrowseState.total_pages, " · ", BrowseState.total_label, " results"),
+        rx.button(
+            "Next",
+            on_click=BrowseState.next_page,
+            disabled=(BrowseState.next_cursor == "") & (BrowseState.mode != Mode.RANDOM.value),
+        ),
         width="100%",
         justify="center",
         spacing="2",
@@ -1,10 +1,10 @@
 from typing import List, Optional
 
 import reflex as rx
-from sqlalchemy.orm import selectinload
-from sqlmodel import select
 
-from torrent_garden.db.model import TorrentFile, Torrent
+from torrent_garden.db.model import Torrent
+from torrent_garden.db.query import file_with_torrents, torrents_by_id
+from torrent_garden.db.tree import ListedFile, listed_files
 from torrent_garden.ui.component.list.torrent import torrent_list
 from torrent_garden.ui.component.table.torrent import torrent_table
 from torrent_garden.ui.page.base import page_base
@@ -13,32 +13,21 @@ from torrent_garden.ui.helper import array_count
 
 class PageFileTorrentsState(rx.State):
     is_loading: bool = True
-    file: Optional[TorrentFile] = None
+    file: Optional[ListedFile] = None
     torrents: List[Torrent] = []
 
     @rx.event
     def on_load(self):
         self.is_loading = True
         with rx.session() as session:
-            file_stmt = (
-                select(TorrentFile)
-                .where(TorrentFile.id == self.fid)
-                .options(selectinload(TorrentFile.torrent))
-            )
-            file_obj = session.exec(file_stmt).one_or_none()
+            file_obj = session.exec(file_with_torrents(self.fid)).one_or_none()
             if file_obj:
-                # Load torrents with their files for display richness
-                torrent_ids = [t.id for t in file_obj.torrent]
-                if torrent_ids:
-                    torrents_stmt = (
-                        select(Torrent)
-                        .where(Torrent.id.in_(torrent_ids))
-                        .options(selectinload(Torrent.files))
-                    )
-                    self.torrents = list(session.exec(torrents_stmt).all())
+                file = listed_files(session, [file_obj], with_torrents=True)[0]
+                if file.torrent_ids:
+                    self.torrents = list(session.exec(torrents_by_id(file.torrent_ids)).all())
                 else:
                     self.torrents = []
-                self.file = file_obj
+                self.file = file
             else:
                 self.file = None
                 self.torrents = []
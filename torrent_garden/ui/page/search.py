@@ -1,5 +1,6 @@
 import reflex as rx
 
+from torrent_garden.search.query import SEARCH_MODE_OPTIONS, SEARCH_PLACEHOLDER, SearchMode
 from torrent_garden.ui.component.button.debounced import debounced_button
 from torrent_garden.ui.component.table.torrent import torrent_table
 from torrent_garden.ui.component.table.file import file_table
@@ -14,10 +15,15 @@ def search_form() -> rx.Component:
         rx.hstack(
             rx.input(
                 value=SearchState.torrent_query,
-                placeholder="Torrent name contains...",
+                placeholder=rx.cond(SearchState.torrent_mode == SearchMode.CONTAINS, "Torrent name contains...", SEARCH_PLACEHOLDER),
                 on_change=SearchState.set_torrent_query,
                 width="100%",
             ),
+            rx.select(
+                SEARCH_MODE_OPTIONS,
+                value=SearchState.torrent_mode,
+                on_change=SearchState.set_torrent_mode,
+            ),
             rx.select(
                 COUNT_OPTIONS,
                 value=SearchState.count,
@@ -72,6 +78,10 @@ def search_results() -> rx.Component:
             ),
         ),
         # File results
+        rx.cond(
+            SearchState.file_error != "",
+            rx.text(SearchState.file_error, color_scheme="gray"),
+        ),
         rx.cond(
             SearchState.files.length() > 0,
             rx.vstack(
@@ -1,10 +1,11 @@
 import reflex as rx
 
+from torrent_garden.search.query import PATH_SEARCH_MODE_OPTIONS
 from torrent_garden.ui.component.button.debounced import debounced_button
 from torrent_garden.ui.component.table.file_search import file_search_table
 from torrent_garden.ui.page.base import page_base
 from torrent_garden.ui.state.browse import COUNT_OPTIONS
-from torrent_garden.ui.state.search_files import FileSearchState
+from torrent_garden.ui.state.search_files import CATEGORY_OPTIONS, FileSearchState
 
 
 def search_files_form() -> rx.Component:
@@ -15,12 +16,22 @@ def search_files_form() -> rx.Component:
             on_change=FileSearchState.set_name_query,
             width="100%",
         ),
+        rx.select(
+            PATH_SEARCH_MODE_OPTIONS,
+            value=FileSearchState.mode,
+            on_change=FileSearchState.set_mode,
+        ),
         rx.input(
             value=FileSearchState.ext_query,
             placeholder="Ext (e.g. mp4)",
             on_change=FileSearchState.set_ext_query,
             width="200px",
         ),
+        rx.select(
+            CATEGORY_OPTIONS,
+            value=FileSearchState.category,
+            on_change=FileSearchState.set_category,
+        ),
         rx.select(
             COUNT_OPTIONS,
             value=FileSearchState.count,
@@ -51,7 +62,7 @@ def search_files_results() -> rx.Component:
                 width="100%",
                 spacing="3",
             ),
-            rx.text("No files found.", color_scheme="gray"),
+            rx.text(rx.cond(FileSearchState.error != "", FileSearchState.error, "No files found."), color_scheme="gray"),
         ),
         width="100%",
         spacing="2",
@@ -76,19 +87,12 @@ def search_files() -> rx.Component:
 
 
 
-def pagination_number_button(number: int) -> rx.Component:
-    return rx.button(
-        rx.text(number),
-        variant=rx.cond(number == FileSearchState.page, "solid", "soft"),
-        on_click=lambda: FileSearchState.set_page(number),
-    )
-
-
 def pagination_controls() -> rx.Component:
     return rx.hstack(
-        rx.button("Prev", on_click=FileSearchState.prev_page, disabled=FileSearchState.page <= 1),
-        rx.foreach(FileSearchState.page_numbers, pagination_number_button),
-        rx.button("Next", on_click=FileSearchState.next_page, disabled=FileSearchState.page >= FileSearchState.total_pages),
+        rx.button("First", on_click=FileSearchState.first_page, disabled=FileSearchState.prev_cursor == ""),
+        rx.button("Prev", on_click=FileSearchState.prev_page, disabled=FileSearchState.prev_cursor == ""),
+        rx.text("Page ", FileSearchState.page, " of ", FileSearchState.total_pages, " · ", FileSearchState.total_label, " results"),
+        rx.button("Next", on_click=FileSearchState.next_page, disabled=FileSearchState.next_cursor == ""),
         width="100%",
         justify="center",
         spacing="2",
@@ -1,5 +1,6 @@
 import reflex as rx
 
+from torrent_garden.search.query import SEARCH_MODE_OPTIONS, SEARCH_PLACEHOLDER, SearchMode
 from torrent_garden.ui.component.button.debounced import debounced_button
 from torrent_garden.ui.component.table.torrent import torrent_table
 from torrent_garden.ui.component.list.torrent import torrent_list
@@ -8,19 +9,12 @@ from torrent_garden.ui.state.browse import COUNT_OPTIONS
 from torrent_garden.ui.state.search_torrents import TorrentSearchState
 
 
-def pagination_number_button(number: int) -> rx.Component:
-    return rx.button(
-        rx.text(number),
-        variant=rx.cond(number == TorrentSearchState.page, "solid", "soft"),
-        on_click=lambda: TorrentSearchState.set_page(number),
-    )
-
-
 def pagination_controls() -> rx.Component:
     return rx.hstack(
-        rx.button("Prev", on_click=TorrentSearchState.prev_page, disabled=TorrentSearchState.page <= 1),
-        rx.foreach(TorrentSearchState.page_numbers, pagination_number_button),
-        rx.button("Next", on_click=TorrentSearchState.next_page, disabled=TorrentSearchState.page >= TorrentSearchState.total_pages),
+        rx.button("First", on_click=TorrentSearchState.first_page, disabled=TorrentSearchState.prev_cursor == ""),
+        rx.button("Prev", on_click=TorrentSearchState.prev_page, disabled=TorrentSearchState.prev_cursor == ""),
+        rx.text("Page ", TorrentSearchState.page, " of ", TorrentSearchState.total_pages, " · ", TorrentSearchState.total_label, " results"),
+        rx.button("Next", on_click=TorrentSearchState.next_page, disabled=TorrentSearchState.next_cursor == ""),
         width="100%",
         justify="center",
         spacing="2",
@@ -31,10 +25,15 @@ def search_torrents_form() -> rx.Component:
     return rx.hstack(
         rx.input(
             value=TorrentSearchState.query,
-            placeholder="Torrent name contains...",
+            placeholder=rx.cond(TorrentSearchState.mode == SearchMode.CONTAINS, "Torrent name contains...", SEARCH_PLACEHOLDER),
             on_change=TorrentSearchState.set_query,
             width="100%",
         ),
+        rx.select(
+            SEARCH_MODE_OPTIONS,
+            value=TorrentSearchState.mode,
+            on_change=TorrentSearchState.set_mode,
+        ),
         rx.select(
             COUNT_OPTIONS,
             value=TorrentSearchState.count,
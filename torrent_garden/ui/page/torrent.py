@@ -3,11 +3,56 @@ import reflex as rx
 from torrent_garden.ui.component.button.open_torrent import open_torrent_button
 from torrent_garden.ui.component.table.file import file_table
 from torrent_garden.ui.component.list.file import file_list
-from torrent_garden.ui.helper import pretty_size, array_count
+from torrent_garden.ui.helper import pretty_size
 from torrent_garden.ui.page.base import page_base
+from torrent_garden.db.tree import TreeDirectory
 from torrent_garden.ui.state.torrent.view import PageTorrentState
 
 
+def breadcrumb(directory: TreeDirectory) -> rx.Component:
+    return rx.hstack(
+        rx.text("/", color_scheme="gray"),
+        rx.link(directory.name, on_click=PageTorrentState.open_directory(directory.id), cursor="pointer"),
+        spacing="2",
+    )
+
+
+def directory_breadcrumbs() -> rx.Component:
+    return rx.hstack(
+        rx.link(rx.icon("folder-root"), on_click=PageTorrentState.open_directory(0), cursor="pointer"),
+        rx.foreach(PageTorrentState.breadcrumbs, breadcrumb),
+        width="100%",
+        wrap="wrap",
+        spacing="2",
+        align="center",
+    )
+
+
+def directory_row(directory: TreeDirectory) -> rx.Component:
+    return rx.table.row(
+        rx.table.cell(
+            rx.link(
+                rx.hstack(rx.icon("folder"), rx.text(directory.name, style={"wordBreak": "break-word"}), align="center"),
+                on_click=PageTorrentState.open_directory(directory.id),
+                cursor="pointer",
+            ),
+            width="50%",
+        ),
+        rx.table.cell(rx.text(f"{directory.files} files, {pretty_size(directory.size)}")),
+    )
+
+
+def directory_table() -> rx.Component:
+    return rx.cond(
+        PageTorrentState.subdirectories,
+        rx.table.root(
+            rx.table.body(rx.foreach(PageTorrentState.subdirectories, directory_row)),
+            width="100%",
+            table_layout="fixed",
+        ),
+    )
+
+
 def torrent_page_found() -> rx.Component:
     return rx.vstack(
         rx.hstack(
@@ -18,7 +63,7 @@ def torrent_page_found() -> rx.Component:
         rx.hstack(
             rx.heading(f"Size: {pretty_size(PageTorrentState.torrent.size)}", size="4"),
             rx.divider(orientation="vertical"),
-            rx.heading(f"Files: {array_count(PageTorrentState.torrent.files)}", size="4"),
+            rx.heading(f"Files: {PageTorrentState.file_count}", size="4"),
             width="100%",
             justify="center"
         ),
@@ -28,11 +73,20 @@ def torrent_page_found() -> rx.Component:
             justify="center"
         ),
 
+        directory_breadcrumbs(),
+        directory_table(),
         rx.hstack(
-            rx.mobile_only(file_list(PageTorrentState.torrent.files), width="100%"),
-            rx.tablet_and_desktop(file_table(PageTorrentState.torrent.files), width="100%"),
+            rx.mobile_only(file_list(PageTorrentState.files), width="100%"),
+            rx.tablet_and_desktop(file_table(PageTorrentState.files), width="100%"),
             width="100%",
         ),
+        rx.cond(
+            PageTorrentState.is_truncated,
+            rx.text(
+                f"Showing the first {PageTorrentState.files.length()} of {PageTorrentState.directory_file_count} files",
+                color_scheme="gray",
+            ),
+        ),
 
         width="100%"
     )
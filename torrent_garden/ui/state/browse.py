@@ -3,12 +3,14 @@ from typing import List
 from datetime import datetime
 
 import reflex as rx
-from sqlmodel import func, select
-from sqlalchemy.orm import selectinload
 
+from torrent_garden.db.count import COUNT_NAME_TORRENTS
+from torrent_garden.db.keyset import Keyset, PageRequest
+from torrent_garden.db.totals import Total, TotalKind, totals
 from torrent_garden.db.model import Torrent
+from torrent_garden.db.query import browse_torrents, random_torrents
 
-MODE_OPTIONS = ["Newest", "Most Downloaded", "Most Viewed", "Random"]
+MODE_OPTIONS = ["Newest", "Most Downloaded", "Most Viewed", "Most Files", "Random"]
 ORDER_OPTIONS = ["Descending", "Ascending"]
 COUNT_OPTIONS = ["10", "20", "50", "100", "200", "500"]
 
@@ -17,9 +19,20 @@ class Mode(StrEnum):
     NEWEST = "Newest"
     MOST_DOWNLOADED = "Most Downloaded"
     MOST_VIEWED = "Most Viewed"
+    MOST_FILES = "Most Files"
     RANDOM = "Random"
 
 
+# Each order is served by an index on its keys, see utils/check_query_plans.py; Random has no order to page through
+# and shows another random page instead
+MODE_KEYSET = {
+    Mode.NEWEST: Keyset((Torrent.created_at, True), (Torrent.id, True)),
+    Mode.MOST_DOWNLOADED: Keyset((Torrent.downloads, True), (Torrent.id, True)),
+    Mode.MOST_VIEWED: Keyset((Torrent.views, True), (Torrent.id, True)),
+    Mode.MOST_FILES: Keyset((Torrent.file_count, True), (Torrent.id, True)),
+}
+
+
 class Order(StrEnum):
     DESCENDING = "Descending"
     ASCENDING = "Ascending"
@@ -39,8 +52,13 @@ class BrowseState(rx.State):
 
     query: str = ""
 
+    # Shown as "page N of M"; pages are reached by cursor, see db/keyset.py
     page: int = 1
     total: int = 0
+    total_kind: str = TotalKind.EXACT.value
+    _cursor: str = ""
+    next_cursor: str = ""
+    prev_cursor: str = ""
 
     torrents: List[Torrent] = []
     _torrents: List[Torrent] = []
@@ -49,45 +67,44 @@ class BrowseState(rx.State):
     sort_by: str = ""  # one of: name, size, files, seen, views, downloads, created_at, updated_at; empty means no override
     sort_desc: bool = True
 
-    def _total_pages(self) -> int:
-        if self._count <= 0:
-            return 1
-        return max(1, (self.total + self._count - 1) // self._count)
+    def _total(self) -> Total:
+        return Total(self.total, TotalKind(self.total_kind))
+
+    def _set_total(self, total: Total):
+        self.total = total.value
+        self.total_kind = total.kind.value
 
     @rx.var
-    def total_pages(self) -> int:
-        return self._total_pages()
+    def total_label(self) -> str:
+        return self._total().label
 
     @rx.var
-    def page_numbers(self) -> list[int]:
-        tp = self._total_pages()
-        window = 3
-        start = max(1, self.page - window)
-        end = min(tp, self.page + window)
-        pages = list(range(start, end + 1))
-        return sorted(pages)
+    def total_pages(self) -> str:
+        return self._total().pages_label(self._count, self.page)
 
     def _load_torrents(self):
         self.is_loading = True
         with rx.session() as session:
-            data_stmt = select(Torrent).options(selectinload(Torrent.files))
-            total_stmt = select(func.count(Torrent.id)).select_from(Torrent)
             # Note: Browse page should not search the database by name; it only filters displayed items locally.
-            match self._mode:
-                case Mode.NEWEST:
-                    data_stmt = data_stmt.order_by(Torrent.created_at.desc())
-                case Mode.MOST_DOWNLOADED:
-                    data_stmt = data_stmt.order_by(Torrent.downloads.desc())
-                case Mode.MOST_VIEWED:
-                    data_stmt = data_stmt.order_by(Torrent.views.desc())
-                case Mode.RANDOM:
-                    data_stmt = data_stmt.order_by(func.random())
-            offset = (self.page - 1) * self._count
-            data_stmt = data_stmt.limit(self._count).offset(offset)
-            self.torrents = list(session.exec(data_stmt).all())
-            self.total = int(session.exec(total_stmt).one())
+            keyset = MODE_KEYSET.get(self._mode)
+            if keyset is None:
+                self.torrents = list(session.exec(random_torrents(self._count)).all())
+                self.next_cursor = self.prev_cursor = ""
+            else:
+                request = PageRequest(limit=self._count, cursor=self._cursor or None)
+                page = keyset.page(session.exec(browse_torrents(keyset, request)).all(), request)
+                self.torrents = page.rows
+                self.next_cursor = page.next_cursor or ""
+                self.prev_cursor = page.prev_cursor or ""
+                if not self.prev_cursor:
+                    self.page = 1
+            self._set_total(totals.stored(session, COUNT_NAME_TORRENTS))
         self.is_loading = False
 
+    def _first_page(self):
+        self.page = 1
+        self._cursor = ""
+
     @rx.event
     def refresh(self):
         self._load_torrents()
@@ -96,14 +113,14 @@ class BrowseState(rx.State):
     def set_mode(self, mode: str):
         self.mode = mode
         self._mode = Mode(mode)
-        self.page = 1
+        self._first_page()
         yield BrowseState.refresh
 
     @rx.event
     def set_count(self, count: str):
         self.count = count
         self._count = int(count)
-        self.page = 1
+        self._first_page()
         yield BrowseState.refresh
 
     @rx.event
@@ -112,25 +129,24 @@ class BrowseState(rx.State):
         self.query = query
 
     @rx.event
-    def set_page(self, page: int):
-        if page < 1:
-            page = 1
-        tp = self._total_pages()
-        if page > tp:
-            page = tp
-        self.page = page
+    def first_page(self):
+        self._first_page()
         yield BrowseState.refresh
 
     @rx.event
     def next_page(self):
-        if self.page < self._total_pages():
+        if self._mode == Mode.RANDOM:
+            yield BrowseState.refresh
+        elif self.next_cursor:
+            self._cursor = self.next_cursor
             self.page += 1
             yield BrowseState.refresh
 
     @rx.event
     def prev_page(self):
-        if self.page > 1:
-            self.page -= 1
+        if self.prev_cursor:
+            self._cursor = self.prev_cursor
+            self.page = max(1, self.page - 1)
             yield BrowseState.refresh
 
     @rx.event
@@ -153,8 +169,8 @@ class BrowseState(rx.State):
         self.is_loading = True
         self.query = ""
         self.torrents = []
-        self.page = 1
-        self.total = 0
+        self._first_page()
+        self._set_total(Total(0))
 
     @rx.var
     def filtered_torrents(self) -> List[Torrent]:
@@ -173,8 +189,7 @@ class BrowseState(rx.State):
                 if col == "size":
                     return int(t.size or 0)
                 if col == "files":
-                    # t.files is eager-loaded list
-                    return len(list(t.files or []))
+                    return int(t.file_count or 0)
                 if col == "seen":
                     return int(t.seen_count or 0)
                 if col == "views":
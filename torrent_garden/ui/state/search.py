@@ -2,10 +2,12 @@ from typing import List
 from datetime import datetime
 
 import reflex as rx
-from sqlalchemy.orm import selectinload
-from sqlmodel import select
 
-from torrent_garden.db.model import Torrent, TorrentFile
+from torrent_garden.db.keyset import PageRequest
+from torrent_garden.db.model import Torrent
+from torrent_garden.db.tree import ListedFile
+from torrent_garden.search.cache import search_file_page, search_torrent_page
+from torrent_garden.search.query import SEARCH_MODE_OPTIONS, FileQuery, SearchMode, TorrentQuery, path_query_error
 from torrent_garden.ui.state.browse import COUNT_OPTIONS
 
 
@@ -14,6 +16,7 @@ class SearchState(rx.State):
 
     # Queries
     torrent_query: str = ""
+    torrent_mode: str = SEARCH_MODE_OPTIONS[0]
     file_name_query: str = ""
     file_ext_query: str = ""
 
@@ -23,7 +26,9 @@ class SearchState(rx.State):
 
     # Results
     torrents: List[Torrent] = []
-    files: List[TorrentFile] = []
+    files: List[ListedFile] = []
+    # Why the file name query was not searched, see path_query_error
+    file_error: str = ""
 
     # Sorting (client-side)
     torrent_sort_by: str = ""
@@ -44,7 +49,7 @@ class SearchState(rx.State):
             if col == "size":
                 return int(t.size or 0)
             if col == "files":
-                return len(list(t.files or []))
+                return int(t.file_count or 0)
             if col == "seen":
                 return int(t.seen_count or 0)
             if col == "views":
@@ -59,12 +64,12 @@ class SearchState(rx.State):
         return sorted(items, key=key_func, reverse=self.torrent_sort_desc)
 
     @rx.var
-    def sorted_files(self) -> List[TorrentFile]:
+    def sorted_files(self) -> List[ListedFile]:
         col = (self.file_sort_by or "").strip()
         items = self.files
         if not col:
             return items
-        def key_func(f: TorrentFile):
+        def key_func(f: ListedFile):
             if col == "path":
                 return (f.path or "").lower()
             if col == "size":
@@ -76,6 +81,10 @@ class SearchState(rx.State):
     def set_torrent_query(self, value: str):
         self.torrent_query = value
 
+    @rx.event
+    def set_torrent_mode(self, value: str):
+        self.torrent_mode = value
+
     @rx.event
     def set_file_name_query(self, value: str):
         self.file_name_query = value
@@ -90,31 +99,20 @@ class SearchState(rx.State):
         self._count = int(value)
 
     def _search_torrents(self, session) -> List[Torrent]:
-        q = (self.torrent_query or "").strip()
-        if not q:
+        query = TorrentQuery(text=self.torrent_query or "", mode=SearchMode(self.torrent_mode))
+        page = search_torrent_page(session, query, PageRequest(limit=self._count))
+        return [] if page is None else page.rows
+
+    def _search_files(self, session) -> List[ListedFile]:
+        query = FileQuery(text=(self.file_name_query or "").strip(), extension=self.file_ext_query or "")
+        self.file_error = ""
+        if query.is_empty:
             return []
-        stmt = (
-            select(Torrent)
-            .options(selectinload(Torrent.files))
-            .where(Torrent.name.contains(q))
-            .order_by(Torrent.created_at.desc())
-            .limit(self._count)
-        )
-        return list(session.exec(stmt).all())
-
-    def _search_files(self, session) -> List[TorrentFile]:
-        name_q = (self.file_name_query or "").strip()
-        ext_q = (self.file_ext_query or "").strip().lstrip(".")
-        if not name_q and not ext_q:
+        if query.text and path_query_error(query.text) is not None:
+            self.file_error = path_query_error(query.text)
             return []
-        stmt = select(TorrentFile)
-        if name_q:
-            stmt = stmt.where(TorrentFile.path.contains(name_q))
-        if ext_q:
-            # Match file extension at the end of the path
-            stmt = stmt.where(TorrentFile.path.like(f"%.{ext_q}"))
-        stmt = stmt.limit(self._count)
-        return list(session.exec(stmt).all())
+        page = search_file_page(session, query, PageRequest(limit=self._count))
+        return [] if page is None else page.rows
 
     # Sorting events
     @rx.event
@@ -154,3 +152,4 @@ class SearchState(rx.State):
         self.file_ext_query = ""
         self.torrents = []
         self.files = []
+        self.file_error = ""
@@ -1,60 +1,73 @@
 from typing import List
 
 import reflex as rx
-from sqlalchemy.orm import selectinload
-from sqlmodel import select, func
 
-from torrent_garden.db.model import TorrentFile, Torrent
+from torrent_garden.db.classify import FileCategory
+from torrent_garden.db.keyset import PageRequest
+from torrent_garden.db.totals import Total, TotalKind
+from torrent_garden.db.query import count_torrent_view, file_with_torrents
+from torrent_garden.db.tree import ListedFile
+from torrent_garden.search.cache import search_file_page
+from torrent_garden.search.query import PATH_SEARCH_MODE_OPTIONS, FileQuery, PathSearchMode, path_query_error
 from torrent_garden.ui.state.browse import COUNT_OPTIONS
 
+CATEGORY_ALL = "all"
+CATEGORY_OPTIONS = [CATEGORY_ALL] + [category.value for category in FileCategory]
+
 
 class FileSearchState(rx.State):
     is_loading: bool = False
 
     # Inputs
     name_query: str = ""
+    mode: str = PATH_SEARCH_MODE_OPTIONS[0]
     ext_query: str = ""
+    category: str = CATEGORY_ALL
 
     # Result limit
     count: str = COUNT_OPTIONS[2]  # default "50"
     _count: int = int(COUNT_OPTIONS[2])
 
-    # Pagination
+    # Pagination: "page N of M", pages are reached by cursor, see db/keyset.py
     page: int = 1
     total: int = 0
+    total_kind: str = TotalKind.EXACT.value
+    _cursor: str = ""
+    next_cursor: str = ""
+    prev_cursor: str = ""
 
     # Results
-    files: List[TorrentFile] = []
+    files: List[ListedFile] = []
+    # Why the query was not searched, see path_query_error
+    error: str = ""
 
     # Sorting (client-side within current result page)
     sort_by: str = ""
     sort_desc: bool = True
 
     # ----- Computed -----
-    def _total_pages(self) -> int:
-        if self._count <= 0:
-            return 1
-        return max(1, (self.total + self._count - 1) // self._count)
+    def _total(self) -> Total:
+        return Total(self.total, TotalKind(self.total_kind))
+
+    def _set_total(self, total: Total):
+        self.total = total.value
+        self.total_kind = total.kind.value
 
     @rx.var
-    def total_pages(self) -> int:
-        return self._total_pages()
+    def total_label(self) -> str:
+        return self._total().label
 
     @rx.var
-    def page_numbers(self) -> list[int]:
-        tp = self._total_pages()
-        window = 3
-        start = max(1, self.page - window)
-        end = min(tp, self.page + window)
-        return list(range(start, end + 1))
+    def total_pages(self) -> str:
+        return self._total().pages_label(self._count, self.page)
 
     @rx.var
-    def sorted_files(self) -> List[TorrentFile]:
+    def sorted_files(self) -> List[ListedFile]:
         col = (self.sort_by or "").strip()
         items = self.files
         if not col:
             return items
-        def key_func(f: TorrentFile):
+        def key_func(f: ListedFile):
             if col == "path":
                 return (f.path or "").lower()
             if col == "size":
@@ -65,71 +78,78 @@ class FileSearchState(rx.State):
     @rx.event
     def set_name_query(self, value: str):
         self.name_query = value
-        self.page = 1
+        self._first_page()
 
     @rx.event
     def set_ext_query(self, value: str):
         # normalize: strip leading dot
         self.ext_query = (value or "").lstrip(".")
-        self.page = 1
+        self._first_page()
+
+    @rx.event
+    def set_mode(self, value: str):
+        self.mode = value
+        self._first_page()
+
+    @rx.event
+    def set_category(self, value: str):
+        self.category = value
+        self._first_page()
 
     @rx.event
     def set_count(self, value: str):
         self.count = value
         self._count = int(value)
+        self._first_page()
+
+    def _first_page(self):
         self.page = 1
+        self._cursor = ""
 
     @rx.event
-    def set_page(self, page: int):
-        if page < 1:
-            page = 1
-        tp = self._total_pages()
-        if page > tp:
-            page = tp
-        self.page = page
+    def first_page(self):
+        self._first_page()
         yield FileSearchState.search
 
     @rx.event
     def next_page(self):
-        if self.page < self._total_pages():
+        if self.next_cursor:
+            self._cursor = self.next_cursor
             self.page += 1
             yield FileSearchState.search
 
     @rx.event
     def prev_page(self):
-        if self.page > 1:
-            self.page -= 1
+        if self.prev_cursor:
+            self._cursor = self.prev_cursor
+            self.page = max(1, self.page - 1)
             yield FileSearchState.search
 
-    def _search_files(self, session) -> List[TorrentFile]:
-        name_q = (self.name_query or "").strip()
-        ext_q = (self.ext_query or "").strip()
-        if not name_q and not ext_q:
-            self.total = 0
-            return []
-        base = select(TorrentFile)
-        if name_q:
-            base = base.where(TorrentFile.path.contains(name_q))
-        if ext_q:
-            base = base.where(TorrentFile.path.like(f"%.{ext_q}"))
-
-        total_stmt = select(func.count(TorrentFile.id)).select_from(base.subquery())
-        self.total = int(session.exec(total_stmt).one())
-
-        stmt = (
-            select(TorrentFile)
-            .options(selectinload(TorrentFile.torrent))
+    def _search_files(self, session) -> List[ListedFile]:
+        query = FileQuery(
+            text=(self.name_query or "").strip(),
+            mode=PathSearchMode(self.mode),
+            extension=self.ext_query or "",
+            category=self.category if self.category != CATEGORY_ALL else "",
         )
-        if name_q:
-            stmt = stmt.where(TorrentFile.path.contains(name_q))
-        if ext_q:
-            stmt = stmt.where(TorrentFile.path.like(f"%.{ext_q}"))
-        stmt = (
-            stmt.order_by(TorrentFile.path.asc())
-            .limit(self._count)
-            .offset((self.page - 1) * self._count)
-        )
-        return list(session.exec(stmt).all())
+        self.error = ""
+        self._set_total(Total(0))
+        self.next_cursor = self.prev_cursor = ""
+        if query.is_empty:
+            return []
+        if query.text and path_query_error(query.text) is not None:
+            self.error = path_query_error(query.text)
+            return []
+        request = PageRequest(limit=self._count, cursor=self._cursor or None)
+        page = search_file_page(session, query, request)
+        if page is None:
+            return []
+        self._set_total(page.result.total)
+        self.next_cursor = page.result.next_cursor or ""
+        self.prev_cursor = page.result.prev_cursor or ""
+        if not self.prev_cursor:
+            self.page = 1
+        return page.rows
 
     @rx.event
     def set_sort(self, column: str):
@@ -153,30 +173,24 @@ class FileSearchState(rx.State):
         self.is_loading = False
         self.name_query = ""
         self.ext_query = ""
+        self.category = CATEGORY_ALL
         self.files = []
-        self.page = 1
-        self.total = 0
+        self.error = ""
+        self._first_page()
+        self._set_total(Total(0))
 
     @rx.event
     def open_related(self, fid: int):
         with rx.session() as session:
-            stmt = (
-                select(TorrentFile)
-                .where(TorrentFile.id == fid)
-                .options(selectinload(TorrentFile.torrent))
-            )
-            f = session.exec(stmt).one_or_none()
+            f = session.exec(file_with_torrents(fid)).one_or_none()
             if not f:
                 return
             torrents = list(f.torrent or [])
             if len(torrents) == 1:
                 tid = torrents[0].id
                 # increment views similar to TorrentViewState.view
-                t_stmt = select(Torrent).where(Torrent.id == tid)
-                t = session.exec(t_stmt).one_or_none()
-                if t:
-                    t.views += 1
-                    session.commit()
+                session.exec(count_torrent_view(tid))
+                session.commit()
                 yield rx.redirect(f"/t/{tid}")
             elif len(torrents) > 1:
                 yield rx.redirect(f"/file/{fid}/torrents")
@@ -2,10 +2,12 @@ from typing import List
 from datetime import datetime
 
 import reflex as rx
-from sqlalchemy.orm import selectinload
-from sqlmodel import select, func
 
+from torrent_garden.db.keyset import PageRequest
 from torrent_garden.db.model import Torrent
+from torrent_garden.db.totals import Total, TotalKind
+from torrent_garden.search.cache import search_torrent_page
+from torrent_garden.search.query import SEARCH_MODE_OPTIONS, SearchMode, TorrentQuery
 from torrent_garden.ui.state.browse import COUNT_OPTIONS
 
 
@@ -14,14 +16,19 @@ class TorrentSearchState(rx.State):
 
     # Inputs
     query: str = ""
+    mode: str = SEARCH_MODE_OPTIONS[0]
 
     # Result limit
     count: str = COUNT_OPTIONS[2]  # default "50"
     _count: int = int(COUNT_OPTIONS[2])
 
-    # Pagination
+    # Pagination: "page N of M", pages are reached by cursor, see db/keyset.py
     page: int = 1
     total: int = 0
+    total_kind: str = TotalKind.EXACT.value
+    _cursor: str = ""
+    next_cursor: str = ""
+    prev_cursor: str = ""
 
     # Results
     torrents: List[Torrent] = []
@@ -31,22 +38,20 @@ class TorrentSearchState(rx.State):
     sort_desc: bool = True
 
     # ----- Computed -----
-    def _total_pages(self) -> int:
-        if self._count <= 0:
-            return 1
-        return max(1, (self.total + self._count - 1) // self._count)
+    def _total(self) -> Total:
+        return Total(self.total, TotalKind(self.total_kind))
+
+    def _set_total(self, total: Total):
+        self.total = total.value
+        self.total_kind = total.kind.value
 
     @rx.var
-    def total_pages(self) -> int:
-        return self._total_pages()
+    def total_label(self) -> str:
+        return self._total().label
 
     @rx.var
-    def page_numbers(self) -> list[int]:
-        tp = self._total_pages()
-        window = 3
-        start = max(1, self.page - window)
-        end = min(tp, self.page + window)
-        return list(range(start, end + 1))
+    def total_pages(self) -> str:
+        return self._total().pages_label(self._count, self.page)
 
     @rx.var
     def sorted_torrents(self) -> List[Torrent]:
@@ -60,7 +65,7 @@ class TorrentSearchState(rx.State):
             if col == "size":
                 return int(t.size or 0)
             if col == "files":
-                return len(list(t.files or []))
+                return int(t.file_count or 0)
             if col == "seen":
                 return int(t.seen_count or 0)
             if col == "views":
@@ -78,60 +83,57 @@ class TorrentSearchState(rx.State):
     @rx.event
     def set_query(self, value: str):
         self.query = value
-        self.page = 1
+        self._first_page()
+
+    @rx.event
+    def set_mode(self, value: str):
+        self.mode = value
+        self._first_page()
 
     @rx.event
     def set_count(self, value: str):
         self.count = value
         self._count = int(value)
+        self._first_page()
+
+    def _first_page(self):
         self.page = 1
+        self._cursor = ""
 
     @rx.event
-    def set_page(self, page: int):
-        if page < 1:
-            page = 1
-        tp = self._total_pages()
-        if page > tp:
-            page = tp
-        self.page = page
+    def first_page(self):
+        self._first_page()
         yield TorrentSearchState.search
 
     @rx.event
     def next_page(self):
-        if self.page < self._total_pages():
+        if self.next_cursor:
+            self._cursor = self.next_cursor
             self.page += 1
             yield TorrentSearchState.search
 
     @rx.event
     def prev_page(self):
-        if self.page > 1:
-            self.page -= 1
+        if self.prev_cursor:
+            self._cursor = self.prev_cursor
+            self.page = max(1, self.page - 1)
             yield TorrentSearchState.search
 
     # ----- Data access -----
     def _search_torrents(self, session) -> List[Torrent]:
-        q = (self.query or "").strip()
-        if not q:
-            self.total = 0
+        query = TorrentQuery(text=self.query or "", mode=SearchMode(self.mode))
+        request = PageRequest(limit=self._count, cursor=self._cursor or None)
+        page = search_torrent_page(session, query, request)
+        if page is None:
+            self._set_total(Total(0))
+            self.next_cursor = self.prev_cursor = ""
             return []
-        base = (
-            select(Torrent)
-            .where(Torrent.name.contains(q))
-        )
-        # total count
-        total_stmt = select(func.count(Torrent.id)).select_from(base.subquery())
-        self.total = int(session.exec(total_stmt).one())
-
-        # page data
-        stmt = (
-            select(Torrent)
-            .options(selectinload(Torrent.files))
-            .where(Torrent.name.contains(q))
-            .order_by(Torrent.created_at.desc())
-            .limit(self._count)
-            .offset((self.page - 1) * self._count)
-        )
-        return list(session.exec(stmt).all())
+        self._set_total(page.result.total)
+        self.next_cursor = page.result.next_cursor or ""
+        self.prev_cursor = page.result.prev_cursor or ""
+        if not self.prev_cursor:
+            self.page = 1
+        return page.rows
 
     @rx.event
     def set_sort(self, column: str):
@@ -155,5 +157,5 @@ class TorrentSearchState(rx.State):
         self.is_loading = False
         self.query = ""
         self.torrents = []
-        self.page = 1
-        self.total = 0
+        self._first_page()
+        self._set_total(Total(0))
@@ -1,37 +1,79 @@
-from typing import Optional
+from typing import Dict, List, Optional
 
 import reflex as rx
-from sqlalchemy.orm import selectinload
-from sqlmodel import select
 
 from torrent_garden.db.model import Torrent
+from torrent_garden.db.query import count_torrent_view, directory_files, torrent_with_crawlers
+from torrent_garden.db.tree import ListedFile, TreeDirectory, listed_files, torrent_tree
+
+# Files shown of a single directory, a flat torrent can list tens of thousands
+DIRECTORY_FILES_LIMIT = 1000
 
 
 class PageTorrentState(rx.State):
     is_loading: bool = True
     torrent: Optional[Torrent] = None
 
+    file_count: int = 0
+    # Directory being browsed, 0 is the top of the torrent
+    directory: int = 0
+    breadcrumbs: List[TreeDirectory] = []
+    subdirectories: List[TreeDirectory] = []
+    files: List[ListedFile] = []
+    directory_file_count: int = 0
+
+    _tree: Dict[int, TreeDirectory] = {}
+
     @rx.event
     def on_load(self):
         self.is_loading = True
         with rx.session() as session:
-            statement = (
-                select(Torrent)
-                .where(Torrent.id == self.tid)
-                .options(selectinload(Torrent.files), selectinload(Torrent.crawlers))
-            )
-            torrent = session.exec(statement).one_or_none()
+            session.exec(count_torrent_view(self.tid))
+            session.commit()
+            torrent = session.exec(torrent_with_crawlers(self.tid)).unique().one_or_none()
             if torrent:
-                torrent.views += 1
-                session.add(torrent)
-                session.commit()
-                session.refresh(torrent)
                 session.expunge(torrent)
                 self.torrent = torrent
+                self._tree, self.file_count, _ = torrent_tree(session, torrent.id)
+                self._open(session, 0)
             else:
                 self.torrent = None
+                self._tree = {}
         self.is_loading = False
 
+    def _open(self, session, directory: int):
+        if directory not in self._tree:
+            directory = 0
+        self.directory = directory
+
+        breadcrumbs = []
+        parent = self._tree.get(directory)
+        while parent is not None:
+            breadcrumbs.append(parent)
+            parent = self._tree.get(parent.parent_id)
+        self.breadcrumbs = breadcrumbs[::-1]
+        parent_id = directory or None
+        self.subdirectories = sorted(
+            (child for child in self._tree.values() if child.parent_id == parent_id), key=lambda child: child.name
+        )
+
+        files = session.exec(directory_files(self.torrent.id, directory, DIRECTORY_FILES_LIMIT)).all()
+        self.files = listed_files(session, files)
+        subdirectory_files = sum(child.files for child in self.subdirectories)
+        total = self._tree[directory].files if directory else self.file_count
+        self.directory_file_count = total - subdirectory_files
+
+    @rx.event
+    def open_directory(self, directory: int):
+        if self.torrent is None:
+            return
+        with rx.session() as session:
+            self._open(session, directory)
+
     @rx.var
     def is_found(self) -> bool:
         return self.torrent is not None
+
+    @rx.var
+    def is_truncated(self) -> bool:
+        return self.directory_file_count > len(self.files)
@@ -4,37 +4,17 @@ import reflex as rx
 
 from sqlmodel import Session, select
 
+from torrent_garden import logger
+from torrent_garden.db.classify import CATEGORY_COUNT_NAMES
 from torrent_garden.db.count import (
     get_torrent_count,
     get_torrent_file_count,
     get_total_torrent_size,
-    get_archive_file_count,
-    get_code_file_count,
-    get_document_file_count,
-    get_executable_file_count,
-    get_image_file_count,
-    get_audio_file_count,
-    get_video_file_count,
+    get_file_category_stats,
+    has_unclassified_files,
     COUNT_NAME_TORRENTS,
     COUNT_NAME_TORRENT_FILES,
     COUNT_NAME_TORRENT_FILES_SIZE,
-    COUNT_NAME_TORRENT_FILES_ARCHIVES,
-    COUNT_NAME_TORRENT_FILES_CODE_FILES,
-    COUNT_NAME_TORRENT_FILES_DOCUMENTS,
-    COUNT_NAME_TORRENT_FILES_EXECUTABLES,
-    COUNT_NAME_TORRENT_FILES_IMAGES,
-    COUNT_NAME_TORRENT_FILES_AUDIO_FILES,
-    COUNT_NAME_TORRENT_FILES_VIDEOS,
-    get_size,
-    COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE,
-    COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE,
-    COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE,
-    COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE,
-    COUNT_NAME_TORRENT_FILES_IMAGES_SIZE,
-    COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE,
-    COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE,
-    COUNT_NAME_TORRENT_FILES_UNKNOWN,
-    COUNT_NAME_TORRENT_FILES_UNKNOWN_SIZE,
 )
 from torrent_garden.db.model import Counts
 
@@ -51,6 +31,18 @@ def _backfill_counts(session: Session, name: str, fnc: Callable[[Session], int])
     session.commit()
 
 
+def backfill_category_counts(session: Session):
+    """Recompute the count and size of every file category from the stored categories."""
+    if has_unclassified_files(session):
+        logger.warning("Files without category found, keeping category counts until backfill_file_categories is done")
+        return
+    stats = get_file_category_stats(session)
+    for category, (count_name, size_name) in CATEGORY_COUNT_NAMES.items():
+        count, size = stats.get(category, (0, 0))
+        _backfill_counts(session, count_name, lambda s: count)
+        _backfill_counts(session, size_name, lambda s: size)
+
+
 def backfill_counts():
     with rx.session() as session:
         _backfill_counts(session, COUNT_NAME_TORRENTS, get_torrent_count)
@@ -58,59 +50,4 @@ def backfill_counts():
         _backfill_counts(session, COUNT_NAME_TORRENT_FILES, get_torrent_file_count)
         _backfill_counts(session, COUNT_NAME_TORRENT_FILES_SIZE, get_total_torrent_size)
 
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_ARCHIVES, get_archive_file_count)
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE, lambda s: get_size(s, COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE))
-
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_CODE_FILES, get_code_file_count)
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE, lambda s: get_size(s, COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE))
-
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_DOCUMENTS, get_document_file_count)
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE, lambda s: get_size(s, COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE))
-
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_EXECUTABLES, get_executable_file_count)
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE, lambda s: get_size(s, COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE))
-
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_IMAGES, get_image_file_count)
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_IMAGES_SIZE, lambda s: get_size(s, COUNT_NAME_TORRENT_FILES_IMAGES_SIZE))
-
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_AUDIO_FILES, get_audio_file_count)
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE, lambda s: get_size(s, COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE))
-
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_VIDEOS, get_video_file_count)
-        _backfill_counts(session, COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE, lambda s: get_size(s, COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE))
-
-        # Unknown/Other: totals minus known categories
-        _backfill_counts(
-            session,
-            COUNT_NAME_TORRENT_FILES_UNKNOWN,
-            lambda s: max(
-                0,
-                get_torrent_file_count(s)
-                - (
-                    get_archive_file_count(s)
-                    + get_code_file_count(s)
-                    + get_document_file_count(s)
-                    + get_executable_file_count(s)
-                    + get_image_file_count(s)
-                    + get_audio_file_count(s)
-                    + get_video_file_count(s)
-                ),
-            ),
-        )
-        _backfill_counts(
-            session,
-            COUNT_NAME_TORRENT_FILES_UNKNOWN_SIZE,
-            lambda s: max(
-                0,
-                get_size(s, COUNT_NAME_TORRENT_FILES_SIZE)
-                - (
-                    get_size(s, COUNT_NAME_TORRENT_FILES_ARCHIVES_SIZE)
-                    + get_size(s, COUNT_NAME_TORRENT_FILES_CODE_FILES_SIZE)
-                    + get_size(s, COUNT_NAME_TORRENT_FILES_DOCUMENTS_SIZE)
-                    + get_size(s, COUNT_NAME_TORRENT_FILES_EXECUTABLES_SIZE)
-                    + get_size(s, COUNT_NAME_TORRENT_FILES_IMAGES_SIZE)
-                    + get_size(s, COUNT_NAME_TORRENT_FILES_AUDIO_FILES_SIZE)
-                    + get_size(s, COUNT_NAME_TORRENT_FILES_VIDEOS_SIZE)
-                ),
-            ),
-        )
+        backfill_category_counts(session)
@@ -0,0 +1,58 @@
+"""Fill in `extension` and `category` of files stored before these columns existed.
+
+Runs online, next to the application: files are classified in small batches walked by id, each batch is
+written with one UPDATE ... FROM (VALUES ...) and committed on its own. It can be interrupted and restarted
+at any time, finished files are skipped.
+
+    uv run python -m torrent_garden.utils.backfill_file_categories
+"""
+from time import perf_counter
+
+import reflex as rx
+from sqlalchemy import Integer, String, column, values
+from sqlmodel import select, update
+
+from torrent_garden import logger
+from torrent_garden.db.classify import classify_path, file_extension
+from torrent_garden.db.model import TorrentFile
+from torrent_garden.utils.backfill_counts import backfill_category_counts
+
+BATCH_SIZE = 5000
+
+
+def backfill_file_categories(batch_size: int = BATCH_SIZE) -> int:
+    last_id = 0
+    total = 0
+    start = perf_counter()
+    while True:
+        with rx.session() as session:
+            rows = session.exec(
+                select(TorrentFile.id, TorrentFile.name)
+                .where(TorrentFile.id > last_id)
+                .where(TorrentFile.category.is_(None))
+                .order_by(TorrentFile.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            classified = values(
+                column("id", Integer), column("extension", String), column("category", String), name="classified"
+            ).data([(file_id, file_extension(name), str(classify_path(name))) for file_id, name in rows])
+            session.exec(
+                update(TorrentFile)
+                .where(TorrentFile.id == classified.c.id)
+                .values(extension=classified.c.extension, category=classified.c.category)
+            )
+            session.commit()
+        last_id = rows[-1][0]
+        total += len(rows)
+        logger.info(f"Classified {total} files, up to id {last_id}, {total / (perf_counter() - start):.0f} files/s")
+
+    if total:
+        with rx.session() as session:
+            backfill_category_counts(session)
+    return total
+
+
+if __name__ == "__main__":
+    backfill_file_categories()
@@ -0,0 +1,84 @@
+"""Index the torrents and files stored before the embedded search backend was enabled, or rebuild its index.
+
+Runs online, next to the application, which indexes what it ingests itself: torrents and files are walked by id in
+batches, from the highest id found in the index up to the highest id stored when the build starts, and written to
+segments that the application picks up as they appear. Documents the application had not flushed when it stopped
+are behind its last segment, so they are indexed again as well; a document indexed twice is found once. It can be
+interrupted and restarted at any time. Does nothing unless TORRENT_GARDEN_SEARCH_BACKEND is embedded.
+
+    uv run python -m torrent_garden.utils.build_search_index [--rebuild]
+
+--rebuild removes the index first and indexes everything; stop the application while it runs, or searches miss
+what is not indexed yet.
+"""
+import argparse
+import shutil
+from time import perf_counter
+from typing import Callable, Iterable, Tuple
+
+import reflex as rx
+from sqlmodel import func, select
+
+from torrent_garden import TORRENT_GARDEN_SEARCH_BACKEND, TORRENT_GARDEN_SEARCH_INDEX_DIR, logger
+from torrent_garden.db.model import Torrent, TorrentFile
+from torrent_garden.search.backends import create_search_backend
+from torrent_garden.search.embedded import PENDING_MAX_IDS, EmbeddedSearchBackend
+from torrent_garden.search.index import InvertedIndex
+
+BATCH_SIZE = 10000
+
+
+def _build(
+        name: str,
+        index: InvertedIndex,
+        add: Callable[[Iterable[Tuple[int, str]]], None],
+        id_column,
+        text_column,
+        batch_size: int,
+) -> int:
+    last_id = index.max_id
+    with rx.session() as session:
+        end_id = session.exec(select(func.max(id_column))).one() or 0
+    total = 0
+    start = perf_counter()
+    while last_id < end_id:
+        with rx.session() as session:
+            rows = session.exec(
+                select(id_column, text_column)
+                .where(id_column > last_id)
+                .where(id_column <= end_id)
+                .order_by(id_column)
+                .limit(batch_size)
+            ).all()
+        if not rows:
+            break
+        add(rows)
+        if index.pending_ids >= PENDING_MAX_IDS:
+            index.flush()
+            while index.merge():
+                pass
+        last_id = rows[-1][0]
+        total += len(rows)
+        logger.info(f"Indexed {total} {name}, up to id {last_id} of {end_id}, {total / (perf_counter() - start):.0f} {name}/s")
+    index.flush()
+    while index.merge():
+        pass
+    return total
+
+
+def build_search_index(rebuild: bool = False, batch_size: int = BATCH_SIZE):
+    backend = create_search_backend(TORRENT_GARDEN_SEARCH_BACKEND)
+    if not isinstance(backend, EmbeddedSearchBackend):
+        logger.info(f"The {backend.name} search backend has no index to build")
+        return
+    if rebuild:
+        shutil.rmtree(TORRENT_GARDEN_SEARCH_INDEX_DIR, ignore_errors=True)
+    _build("torrents", backend.torrents, backend.index_torrents, Torrent.id, Torrent.name, batch_size)
+    _build("files", backend.files, backend.index_files, TorrentFile.id, TorrentFile.name, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index stored torrents and files for the embedded search backend")
+    parser.add_argument("--rebuild", action="store_true", help="remove the index and index everything again")
+    args = parser.parse_args()
+    build_search_index(rebuild=args.rebuild)
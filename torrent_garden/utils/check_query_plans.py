@@ -0,0 +1,221 @@
+"""Check that the queries behind the most loaded pages are served by indexes.
+
+Seeds a torrent with files in a few directories and a crawler inside a transaction, runs the statements of the
+browse, torrent and file pages against it, browse pages after a cursor included, and explains every SELECT they
+sent, selectinload queries included. Sequential scans, hash and merge joins are disabled while explaining, so the
+planner only reads a whole table or index when no index can serve the query, however small the tables are. A
+sequential scan anywhere in a plan fails the check, and so does an index scan that is not bounded by the leading
+column of its index: that reads the whole index in place of the table. An index scan below a LIMIT without any
+condition is fine, it just reads in order, and so is any scan of an empty partition of torrent. Everything is
+rolled back, the check can run against any database, e.g. a disposable one migrated in CI. It logs the full scans,
+with `--check` it also exits with 1 on any of them:
+
+    uv run python -m torrent_garden.utils.check_query_plans --check
+
+Searches of the SQL backend, search/sql.py, are covered whichever backend is configured, except the Contains mode
+of torrent names: a substring search of names cannot use an index.
+"""
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple
+
+import reflex as rx
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from torrent_garden import logger
+from torrent_garden.api.torrent import AddTorrent, AddTorrentFile
+from torrent_garden.db.ingest import add_torrents
+from torrent_garden.db.keyset import PageRequest, encode_cursor
+from torrent_garden.db.model import Crawler, Torrent, TorrentFile
+from torrent_garden.db.query import (
+    browse_torrents,
+    directory_files,
+    file_with_torrents,
+    files_by_id,
+    torrent_with_crawlers,
+    torrents_by_id,
+)
+from torrent_garden.db.tree import listed_files, torrent_tree
+from torrent_garden.search.query import FileQuery, PathSearchMode, SearchMode, TorrentQuery
+from torrent_garden.search.sql import SqlSearchBackend
+from torrent_garden.ui.state.browse import MODE_KEYSET, Mode
+
+
+@dataclass
+class Sample:
+    name: str
+    torrent_id: int
+    file_id: int
+    directory_id: int
+
+
+def _browse(mode: Mode) -> Callable[[Session, Sample], None]:
+    def run(session: Session, sample: Sample):
+        keyset = MODE_KEYSET[mode]
+        first = session.exec(browse_torrents(keyset, PageRequest(limit=20))).all()
+        # Both directions from the key of a row, like the Next and Prev buttons
+        for backward in (False, True):
+            cursor = encode_cursor(first[0][1:], backward=backward)
+            session.exec(browse_torrents(keyset, PageRequest(limit=20, cursor=cursor))).all()
+    return run
+
+
+def _search(session: Session, sample: Sample):
+    query = TorrentQuery(text=sample.name, mode=SearchMode.WORDS)
+    result = SqlSearchBackend().search_torrents(session, query, PageRequest(limit=50))
+    session.exec(torrents_by_id(result.ids)).all()
+
+
+def _search_files(session: Session, sample: Sample):
+    for mode in PathSearchMode:
+        result = SqlSearchBackend().search_files(session, FileQuery(text=sample.name, mode=mode), PageRequest(limit=50))
+        listed_files(session, session.exec(files_by_id(result.ids)).all(), with_torrents=True)
+
+
+def _torrent_page(session: Session, sample: Sample):
+    session.exec(torrent_with_crawlers(sample.torrent_id)).unique().one().crawlers
+    torrent_tree(session, sample.torrent_id)
+    listed_files(session, session.exec(directory_files(sample.torrent_id, None, 1000)).all())
+    listed_files(session, session.exec(directory_files(sample.torrent_id, sample.directory_id, 1000)).all())
+
+
+def _file_torrents_page(session: Session, sample: Sample):
+    file = listed_files(session, [session.exec(file_with_torrents(sample.file_id)).one()], with_torrents=True)[0]
+    session.exec(torrents_by_id(file.torrent_ids)).all()
+
+
+HOT_QUERIES: Dict[str, Callable[[Session, Sample], None]] = {
+    **{f"browse {mode.value}": _browse(mode) for mode in MODE_KEYSET},
+    "search torrents": _search,
+    "search files": _search_files,
+    "torrent page": _torrent_page,
+    "file torrents page": _file_torrents_page,
+}
+
+
+def _seed(session: Session) -> Sample:
+    prefix = f"check_query_plans.{os.urandom(8).hex()}"
+    crawler = Crawler(name=prefix, token=prefix)
+    session.add(crawler)
+    session.flush()
+    files = [
+        AddTorrentFile(path=f"{prefix}/{directory}/{prefix}.{directory[-1]}{i}.bin", size=i)
+        for directory in ("a", "b/c")
+        for i in range(3)
+    ]
+    files.append(AddTorrentFile(path=f"{prefix}.nfo", size=1))
+    add_torrents(session, [AddTorrent(info_hash=os.urandom(20).hex(), name=prefix, size=7, files=files)], crawler.id)
+    torrent_id = session.exec(select(Torrent.id).where(Torrent.name == prefix)).one()
+    file_id, directory_id = session.exec(
+        select(TorrentFile.id, TorrentFile.directory_id).where(TorrentFile.name == f"{prefix}.a0.bin")
+    ).one()
+    return Sample(name=prefix, torrent_id=torrent_id, file_id=file_id, directory_id=directory_id)
+
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+# Planner settings while explaining, they make the plans look like those on tables too large to read whole
+DISABLED = ("enable_seqscan", "enable_hashjoin", "enable_mergejoin")
+
+
+def _leading_columns(session: Session) -> Dict[str, str]:
+    return dict(session.connection().exec_driver_sql("""
+        SELECT index.relname, attribute.attname
+        FROM pg_index i
+        JOIN pg_class index ON index.oid = i.indexrelid
+        JOIN pg_attribute attribute ON attribute.attrelid = i.indrelid AND attribute.attnum = i.indkey[0]
+    """).all())
+
+
+def _empty_partitions(session: Session) -> Set[str]:
+    """Names of the partitions without rows, e.g. the months created ahead, and of their indexes.
+
+    The planner takes any index to read a partition it knows to be empty, which costs nothing whichever it is.
+    """
+    connection = session.connection()
+    partitions = connection.exec_driver_sql("""
+        SELECT c.oid, c.oid::regclass::text FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE c.relkind = 'r'
+    """).all()
+    empty = [oid for oid, relation in partitions if connection.exec_driver_sql(
+        f"SELECT NOT EXISTS (SELECT 1 FROM {relation})"
+    ).scalar()]
+    if not empty:
+        return set()
+    return set(connection.exec_driver_sql("""
+        SELECT c.relname FROM pg_class c WHERE c.oid = ANY(%(oids)s)
+        UNION ALL
+        SELECT index.relname FROM pg_index i JOIN pg_class index ON index.oid = i.indexrelid
+        WHERE i.indrelid = ANY(%(oids)s)
+    """, {"oids": empty}).scalars())
+
+
+def _full_scans(plan: Dict[str, Any], leading: Dict[str, str], empty: Set[str], limited: bool = False) -> Iterator[str]:
+    node = plan["Node Type"]
+    skipped = plan.get("Relation Name") in empty or plan.get("Index Name") in empty
+    if node == "Seq Scan" and not skipped:
+        yield f"sequential scan on {plan['Relation Name']}"
+    elif node in INDEX_SCANS and not skipped:
+        condition = plan.get("Index Cond")
+        column = leading.get(plan["Index Name"])
+        if condition is None and not limited:
+            yield f"full scan of index {plan['Index Name']}"
+        elif condition is not None and column is not None and not re.search(rf"\b{column}\b", condition):
+            yield f"scan of index {plan['Index Name']} without its leading column {column}"
+    for child in plan.get("Plans", ()):
+        yield from _full_scans(child, leading, empty, limited or node == "Limit")
+
+
+def explain_statements(session: Session, run: Callable[[Session], None]) -> List[Tuple[str, List[str]]]:
+    """Run `run` and return every SELECT it sent with the full scans in its plan."""
+    connection = session.connection()
+    statements = []
+
+    def capture(conn, cursor, statement: str, parameters, context, executemany: bool):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        run(session)
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+
+    explained = []
+    leading = _leading_columns(session)
+    empty = _empty_partitions(session)
+    for setting in DISABLED:
+        connection.exec_driver_sql(f"SET LOCAL {setting} = off")
+    try:
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()[0]["Plan"]
+            explained.append((statement, list(_full_scans(plan, leading, empty))))
+    finally:
+        for setting in DISABLED:
+            connection.exec_driver_sql(f"RESET {setting}")
+    return explained
+
+
+def check_query_plans() -> bool:
+    ok = True
+    with rx.session() as session:
+        try:
+            sample = _seed(session)
+            for name, run in HOT_QUERIES.items():
+                explained = explain_statements(session, lambda s: run(s, sample))
+                failed = [(statement, scans) for statement, scans in explained if scans]
+                for statement, scans in failed:
+                    logger.error(f"{name}: {', '.join(scans)} in\n{statement}")
+                logger.info(f"{name}: {len(explained)} statements, {'FAILED' if failed else 'ok'}")
+                ok = ok and not failed
+        finally:
+            session.rollback()
+    return ok
+
+
+if __name__ == "__main__":
+    ok = check_query_plans()
+    if "--check" in sys.argv[1:]:
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,19 @@
+"""Create the partitions of torrent for the current month and the months ahead, see db/partitions.py.
+
+The application does the same at startup and then regularly; run after migrating so that a new database takes
+torrents before the application started once:
+
+    uv run python -m torrent_garden.utils.create_torrent_partitions
+"""
+import reflex as rx
+
+from torrent_garden.db.partitions import ensure_torrent_partitions
+
+
+def create_torrent_partitions():
+    with rx.session() as session:
+        ensure_torrent_partitions(session)
+
+
+if __name__ == "__main__":
+    create_torrent_partitions()
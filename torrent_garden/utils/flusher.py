@@ -0,0 +1,60 @@
+import threading
+from typing import Optional
+
+from torrent_garden import logger
+
+
+class PeriodicFlusher:
+    """Background thread that calls `flush()` every `interval` seconds, or earlier when woken up.
+
+    Subclasses gather work in memory and write it out in `flush()`. `stop()` runs a last flush so that
+    nothing gathered before shutdown is lost.
+    """
+
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"Started {self.name}")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._flush()
+        logger.info(f"Stopped {self.name}")
+
+    def wake(self):
+        """Flush as soon as possible instead of waiting for the interval."""
+        self._wake.set()
+
+    def flush(self):
+        raise NotImplementedError
+
+    def _flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception(f"{self.name} failed to flush")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stopping.is_set():
+                self._flush()
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+from typing import Generic, Hashable, Mapping, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LruCache(Generic[K, V]):
+    """Thread-safe mapping that keeps the `maxsize` most recently used entries; a maxsize of 0 disables it."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[K, V] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def remember(self, entries: Mapping[K, V]):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            for key, value in entries.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def remember_cold(self, entries: Mapping[K, V]):
+        """Add entries that are not cached yet as the first to be evicted, as far as there is free space."""
+        with self._lock:
+            for key, value in entries.items():
+                if len(self._entries) >= self.maxsize:
+                    break
+                if key not in self._entries:
+                    self._entries[key] = value
+                    self._entries.move_to_end(key, last=False)
+
+    def forget(self, key: K):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,488 @@
+"""Data fixes that have to be applied before `reflex db migrate` can bring the schema up to date.
+
+Run from the project root before migrating:
+
+    uv run python -m torrent_garden.utils.pre_migrate
+
+Every step is idempotent and skips itself once its migration has been applied.
+"""
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import reflex as rx
+from sqlalchemy import Integer, String, column, values
+from sqlmodel import Session, text, update
+
+from torrent_garden import logger
+from torrent_garden.db.info_hash import normalize_info_hash
+from torrent_garden.db.ingest import PATH_DIGEST_SIZE
+from torrent_garden.db.model import NAME_SEARCH_EXPRESSION, Directory, PathSegment, Torrent, TorrentFile, TorrentHash
+from torrent_garden.db.partitions import (
+    PARTITIONS_AHEAD,
+    TORRENT_FILLFACTOR,
+    add_months,
+    create_torrent_partitions,
+    is_partitioned,
+    month_start,
+)
+from torrent_garden.db.tree import resolve_directories, split_path
+
+
+def table_exists(session: Session, name: str) -> bool:
+    return session.exec(text("SELECT to_regclass(:name) IS NOT NULL"), params={"name": name}).one()[0]
+
+
+def constraint_exists(session: Session, name: str) -> bool:
+    return session.exec(text("SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = :name)"), params={"name": name}).one()[0]
+
+
+def column_nullable(session: Session, table: str, column: str) -> Optional[bool]:
+    """Return whether the column is nullable, or None if it does not exist."""
+    row = session.exec(
+        text("SELECT is_nullable FROM information_schema.columns WHERE table_name = :table AND column_name = :column"),
+        params={"table": table, "column": column},
+    ).one_or_none()
+    return None if row is None else row[0] == "YES"
+
+
+def column_type(session: Session, table: str, column: str) -> Optional[str]:
+    """Return the data type of the column, e.g. `bytea`, or None if it does not exist."""
+    row = session.exec(
+        text("SELECT data_type FROM information_schema.columns WHERE table_name = :table AND column_name = :column"),
+        params={"table": table, "column": column},
+    ).one_or_none()
+    return None if row is None else row[0]
+
+
+def _merge_duplicate_torrents(session: Session):
+    """Merge torrents sharing an info_hash into the oldest one, without committing."""
+    session.exec(text("""
+        CREATE TEMPORARY TABLE torrent_duplicate AS
+        SELECT id, min(id) OVER (PARTITION BY info_hash) AS keep_id
+        FROM torrent
+        WHERE info_hash IN (SELECT info_hash FROM torrent GROUP BY info_hash HAVING count(*) > 1)
+    """))
+    session.exec(text("DELETE FROM torrent_duplicate WHERE id = keep_id"))
+    duplicates = session.exec(text("SELECT count(*) FROM torrent_duplicate")).one()[0]
+    if duplicates == 0:
+        session.exec(text("DROP TABLE torrent_duplicate"))
+        return
+
+    logger.info(f"Merging {duplicates} duplicate torrents")
+    session.exec(text("""
+        UPDATE torrent t
+        SET seen_count = t.seen_count + d.seen_count,
+            views = t.views + d.views,
+            downloads = t.downloads + d.downloads,
+            updated_at = greatest(t.updated_at, d.updated_at)
+        FROM (
+            SELECT td.keep_id, sum(x.seen_count) AS seen_count, sum(x.views) AS views,
+                   sum(x.downloads) AS downloads, max(coalesce(x.updated_at, x.created_at)) AS updated_at
+            FROM torrent_duplicate td JOIN torrent x ON x.id = td.id
+            GROUP BY td.keep_id
+        ) d
+        WHERE t.id = d.keep_id
+    """))
+    for table, column in (("filetorrentlinkmodel", "torrent_file_id"), ("crawlertorrentlinkmodel", "crawler_id")):
+        session.exec(text(f"""
+            INSERT INTO {table} (torrent_id, {column})
+            SELECT DISTINCT d.keep_id, l.{column}
+            FROM {table} l JOIN torrent_duplicate d ON l.torrent_id = d.id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} k WHERE k.torrent_id = d.keep_id AND k.{column} = l.{column}
+            )
+        """))
+        session.exec(text(f"DELETE FROM {table} l USING torrent_duplicate d WHERE l.torrent_id = d.id"))
+    # Merged torrents may have gained files, see add_file_counts
+    if column_nullable(session, "torrent", "file_count") is not None:
+        session.exec(text("""
+            UPDATE torrent t SET file_count = (SELECT count(*) FROM filetorrentlinkmodel l WHERE l.torrent_id = t.id)
+            WHERE t.id IN (SELECT keep_id FROM torrent_duplicate)
+        """))
+    session.exec(text("DELETE FROM torrent t USING torrent_duplicate d WHERE t.id = d.id"))
+    session.exec(text("DROP TABLE torrent_duplicate"))
+
+
+def merge_duplicate_torrents(session: Session):
+    """Merge torrents sharing an info_hash into the oldest one so that info_hash can become unique."""
+    if (
+        not table_exists(session, "torrent")
+        or constraint_exists(session, "torrent_info_hash_key")
+        or table_exists(session, "torrenthash")
+    ):
+        return
+    _merge_duplicate_torrents(session)
+    session.commit()
+
+
+def _remove_duplicate_links(session: Session, table: str, columns: str, constraint: str):
+    # Without the surrogate id the pair is the primary key already, see key_links_by_pair
+    if not table_exists(session, table) or constraint_exists(session, constraint) or column_nullable(session, table, "id") is None:
+        return
+    condition = " AND ".join(f"l.{column} = k.{column}" for column in columns.split(", "))
+    result = session.exec(text(f"DELETE FROM {table} l USING {table} k WHERE {condition} AND l.id > k.id"))
+    logger.info(f"Removed {result.rowcount} duplicate rows from {table}")
+    session.commit()
+
+
+def remove_duplicate_file_links(session: Session):
+    """Drop repeated torrent/file link rows so that the pair can become unique."""
+    _remove_duplicate_links(
+        session, "filetorrentlinkmodel", "torrent_id, torrent_file_id", "filetorrentlinkmodel_torrent_id_torrent_file_id_key"
+    )
+
+
+def remove_duplicate_crawler_links(session: Session):
+    """Drop repeated crawler/torrent link rows so that the pair can become unique."""
+    _remove_duplicate_links(
+        session, "crawlertorrentlinkmodel", "crawler_id, torrent_id", "crawlertorrentlinkmodel_crawler_id_torrent_id_key"
+    )
+
+
+def _key_links_by_pair(session: Session, table: str, columns: str, constraint: str):
+    if not table_exists(session, table) or column_nullable(session, table, "id") is None:
+        return
+    logger.info(f"Replacing the surrogate key of {table} by ({columns})")
+    session.exec(text(f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey"))
+    session.exec(text(f"ALTER TABLE {table} DROP COLUMN id"))
+    session.exec(text(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({columns})"))
+    session.exec(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}"))
+    session.commit()
+
+
+def key_links_by_pair(session: Session):
+    """Make the linked pair the primary key of the link tables, in place of the surrogate id.
+
+    The unique constraint on the pair becomes the primary key, so every link is stored in one index instead of
+    two. Alembic does not compare primary keys, hence this step; it adds the reverse indexes afterwards.
+    """
+    _key_links_by_pair(
+        session, "filetorrentlinkmodel", "torrent_id, torrent_file_id", "filetorrentlinkmodel_torrent_id_torrent_file_id_key"
+    )
+    _key_links_by_pair(
+        session, "crawlertorrentlinkmodel", "crawler_id, torrent_id", "crawlertorrentlinkmodel_crawler_id_torrent_id_key"
+    )
+
+
+def add_path_digests(session: Session, batch_size: int = 50000):
+    """Store the digest of every file path so that path_digest can take over the unique index of path.
+
+    Must match `path_digest()` in db/ingest.py. Filled in id ranges, each committed on its own, and repeated until
+    no newer files are left, so it keeps up with an old version of the app still writing.
+    """
+    if not table_exists(session, "torrentfile"):
+        return
+    nullable = column_nullable(session, "torrentfile", "path_digest")
+    if nullable is False:
+        return
+    if nullable is None:
+        session.exec(text("ALTER TABLE torrentfile ADD COLUMN path_digest bytea"))
+        session.commit()
+
+    last_id = 0
+    while True:
+        max_id = session.exec(text("SELECT coalesce(max(id), 0) FROM torrentfile")).one()[0]
+        if last_id >= max_id:
+            break
+        while last_id < max_id:
+            result = session.exec(
+                text("""
+                    UPDATE torrentfile SET path_digest = substring(sha256(convert_to(path, 'UTF8')) FROM 1 FOR :size)
+                    WHERE id > :low AND id <= :high AND path_digest IS NULL
+                """),
+                params={"size": PATH_DIGEST_SIZE, "low": last_id, "high": last_id + batch_size},
+            )
+            session.commit()
+            last_id += batch_size
+            if result.rowcount:
+                logger.info(f"Stored {result.rowcount} path digests up to id {last_id}")
+        last_id = max_id
+
+
+def add_file_counts(session: Session, batch_size: int = 50000):
+    """Store the number of files of every torrent so that file_count can become a NOT NULL column.
+
+    Counted from the file links in id ranges, each committed on its own, and repeated until no newer torrents are
+    left, like `add_path_digests`.
+    """
+    if not table_exists(session, "torrent"):
+        return
+    nullable = column_nullable(session, "torrent", "file_count")
+    if nullable is False:
+        return
+    if nullable is None:
+        session.exec(text("ALTER TABLE torrent ADD COLUMN file_count integer"))
+        session.commit()
+
+    last_id = 0
+    while True:
+        max_id = session.exec(text("SELECT coalesce(max(id), 0) FROM torrent")).one()[0]
+        if last_id >= max_id:
+            break
+        while last_id < max_id:
+            result = session.exec(
+                text("""
+                    UPDATE torrent t SET file_count = (
+                        SELECT count(*) FROM filetorrentlinkmodel l WHERE l.torrent_id = t.id
+                    )
+                    WHERE t.id > :low AND t.id <= :high AND t.file_count IS NULL
+                """),
+                params={"low": last_id, "high": last_id + batch_size},
+            )
+            session.commit()
+            last_id += batch_size
+            if result.rowcount:
+                logger.info(f"Counted the files of {result.rowcount} torrents up to id {last_id}")
+        last_id = max_id
+
+
+def set_torrent_fillfactor(session: Session):
+    """Leave room on the pages of torrent so that re-announcements are updated in place.
+
+    Re-announcements update seen_count and updated_at of a torrent all the time. Neither is indexed, so with free
+    space on the page PostgreSQL writes the new row version next to the old one (a HOT update) without touching
+    any index. Rows then stay in insertion order, which keeps the created_at index and the ranges read by the
+    timelines compact. Only applies to pages written from now on, existing pages keep their layout until the
+    table is rewritten. A partitioned torrent has no pages of its own, its partitions are created with the
+    fillfactor, see db/partitions.py.
+    """
+    if not table_exists(session, "torrent") or is_partitioned(session):
+        return
+    options = session.exec(text("SELECT reloptions FROM pg_class WHERE oid = 'torrent'::regclass")).one()[0] or []
+    if f"fillfactor={TORRENT_FILLFACTOR}" in options:
+        return
+    session.exec(text(f"ALTER TABLE torrent SET (fillfactor = {TORRENT_FILLFACTOR})"))
+    session.commit()
+
+
+def store_info_hashes_as_bytes(session: Session):
+    """Convert info_hash from text to the raw digest, merging torrents that turn out to be the same.
+
+    Info hashes used to be stored as sent, so the same torrent may be stored once in lowercase hex, once in
+    uppercase and once in base32. They are normalized like at ingest first, which makes those spellings equal,
+    the torrents are merged, then the column is rewritten as bytea in one pass, which also lays out the pages with
+    the fillfactor of `set_torrent_fillfactor`. Alembic does not compare column types, hence this step. Values that
+    are no info hash at all stop the migration; they have to be fixed or deleted by hand.
+    """
+    if not table_exists(session, "torrent") or column_type(session, "torrent", "info_hash") == "bytea":
+        return
+    rows = session.exec(text("SELECT id, info_hash FROM torrent WHERE info_hash !~ '^([0-9a-f]{40}|[0-9a-f]{64})$'")).all()
+    normalized = {torrent_id: normalize_info_hash(info_hash) for torrent_id, info_hash in rows}
+    invalid = [f"{torrent_id}: {info_hash!r}" for torrent_id, info_hash in rows if normalized[torrent_id] is None]
+    if invalid:
+        raise ValueError(f"{len(invalid)} torrents have an invalid info_hash: {', '.join(invalid[:20])}")
+
+    logger.info(f"Storing info hashes as bytes, {len(normalized)} of them normalized first")
+    session.exec(text("ALTER TABLE torrent DROP CONSTRAINT IF EXISTS torrent_info_hash_key"))
+    if normalized:
+        session.exec(
+            text("UPDATE torrent SET info_hash = :info_hash WHERE id = :id"),
+            params=[{"id": torrent_id, "info_hash": info_hash} for torrent_id, info_hash in normalized.items()],
+        )
+    _merge_duplicate_torrents(session)
+    session.exec(text("ALTER TABLE torrent ALTER COLUMN info_hash TYPE bytea USING decode(info_hash, 'hex')"))
+    session.exec(text("ALTER TABLE torrent ADD CONSTRAINT torrent_info_hash_key UNIQUE (info_hash)"))
+    session.commit()
+
+
+def partition_torrent_by_month(session: Session):
+    """Move torrent into a table partitioned by created_at month, with its info hashes unique in torrenthash.
+
+    The partitioned table is created from the models under the name of the old one, whose indexes are dropped and
+    whose primary key is renamed out of the way first; then the partitions of every month stored are created and
+    the rows copied in a single transaction. Ids are kept: torrenthash takes the ids, info hashes and created_at
+    of all torrents and continues their sequence, and the link tables reference it instead of torrent. Alembic does
+    not compare partitioning, hence this step.
+
+    Torrent is locked before anything is read, so an old version of the app still running waits for the copy and
+    then fails on the renamed table; it has to be stopped first. Torrents it inserted without file_count since
+    `add_file_counts` get theirs counted from their links.
+    """
+    if not table_exists(session, "torrent") or is_partitioned(session):
+        return
+    if column_type(session, "torrent", "info_hash") != "bytea":
+        raise ValueError("store_info_hashes_as_bytes has to run before partition_torrent_by_month")
+    session.exec(text("LOCK TABLE torrent IN ACCESS EXCLUSIVE MODE"))
+    count = session.exec(text("SELECT count(*) FROM torrent")).one()[0]
+    logger.info(f"Partitioning {count} torrents by month")
+
+    session.exec(text("ALTER TABLE torrent RENAME TO torrent_unpartitioned"))
+    session.exec(text("ALTER TABLE torrent_unpartitioned RENAME CONSTRAINT torrent_pkey TO torrent_unpartitioned_pkey"))
+    indexes = session.exec(text("""
+        SELECT indexrelid::regclass::text FROM pg_index i
+        WHERE indrelid = 'torrent_unpartitioned'::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+    """)).all()
+    for (index,) in indexes:
+        session.exec(text(f"DROP INDEX {index}"))
+
+    connection = session.connection()
+    if not table_exists(session, "torrenthash"):
+        TorrentHash.__table__.create(connection)
+    session.exec(text("""
+        INSERT INTO torrenthash (id, info_hash, created_at)
+        SELECT id, info_hash, created_at FROM torrent_unpartitioned ORDER BY id
+    """))
+    session.exec(text("""
+        SELECT setval(pg_get_serial_sequence('torrenthash', 'id'), coalesce(max(id), 0) + 1, false) FROM torrenthash
+    """))
+    Torrent.__table__.create(connection)
+    first = session.exec(text("SELECT coalesce(min(created_at), now()) FROM torrent_unpartitioned")).one()[0]
+    current = month_start(datetime.now().date())
+    create_torrent_partitions(session, first.date(), add_months(current, PARTITIONS_AHEAD))
+    # Every column but the generated name_search
+    columns = [column.name for column in Torrent.__table__.columns if column.computed is None]
+    selected = [
+        "coalesce(file_count, (SELECT count(*) FROM filetorrentlinkmodel l WHERE l.torrent_id = t.id))"
+        if column == "file_count" else column
+        for column in columns
+    ]
+    session.exec(text(f"""
+        INSERT INTO torrent ({", ".join(columns)}) SELECT {", ".join(selected)} FROM torrent_unpartitioned t
+    """))
+
+    foreign_keys = session.exec(text("""
+        SELECT conrelid::regclass::text, conname, a.attname
+        FROM pg_constraint c JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+        WHERE c.contype = 'f' AND c.confrelid = 'torrent_unpartitioned'::regclass
+    """)).all()
+    for table, name, column in foreign_keys:
+        session.exec(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+        session.exec(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES torrenthash (id)"))
+    session.exec(text("DROP TABLE torrent_unpartitioned"))
+    session.commit()
+    session.exec(text("ANALYZE torrent"))
+    session.commit()
+
+
+def split_names_into_alnum_words(session: Session):
+    """Generate name_search again with NAME_SEARCH_EXPRESSION, which splits names into words like the queries.
+
+    It used to only split names at dots, underscores and dashes, so "AC/DC" was stored as one word that no query
+    finds. A stored generated column cannot change its expression before PostgreSQL 17, so the column is dropped
+    with its index and added again, which rewrites every partition of torrent while holding its lock; the
+    application has to be stopped first. Alembic does not compare generated expressions, hence this step.
+    """
+    if not table_exists(session, "torrent"):
+        return
+    expression = session.exec(text("""
+        SELECT pg_get_expr(d.adbin, d.adrelid) FROM pg_attrdef d
+        JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+        WHERE d.adrelid = 'torrent'::regclass AND a.attname = 'name_search'
+    """)).one_or_none()
+    if expression is None or "regexp_replace" in expression[0]:
+        return
+    logger.info("Splitting torrent names into words of letters and digits")
+    session.exec(text("ALTER TABLE torrent DROP COLUMN name_search"))
+    session.exec(text(f"""
+        ALTER TABLE torrent ADD COLUMN name_search tsvector GENERATED ALWAYS AS ({NAME_SEARCH_EXPRESSION}) STORED
+    """))
+    session.exec(text("CREATE INDEX ix_torrent_name_search ON torrent USING gin (name_search)"))
+    session.commit()
+
+
+def split_file_paths(session: Session, batch_size: int = 5000):
+    """Store every file as its directory and name so that the migration can drop its full path, see db/tree.py.
+
+    Files without a name are walked by id in batches, their directories are resolved like at ingest and each batch
+    is written with one UPDATE ... FROM (VALUES ...), committed on its own; files an old version of the app still
+    inserts meanwhile are reached at the end. Databases from before the tree get its tables and column first.
+    """
+    if not table_exists(session, "torrentfile") or column_nullable(session, "torrentfile", "path") is None:
+        return
+    connection = session.connection()
+    for table in (PathSegment.__table__, Directory.__table__):
+        if not table_exists(session, table.name):
+            table.create(connection)
+    if column_nullable(session, "torrentfile", "directory_id") is None:
+        session.exec(text("ALTER TABLE torrentfile ADD COLUMN directory_id integer REFERENCES directory (id)"))
+    if column_nullable(session, "torrentfile", "name") is None:
+        session.exec(text("ALTER TABLE torrentfile ADD COLUMN name varchar"))
+    session.commit()
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = session.exec(
+            text("SELECT id, path FROM torrentfile WHERE id > :last_id AND name IS NULL ORDER BY id LIMIT :limit"),
+            params={"last_id": last_id, "limit": batch_size},
+        ).all()
+        if not rows:
+            break
+        split = {file_id: split_path(path) for file_id, path in rows}
+        directory_ids = resolve_directories(session, {directory for directory, _ in split.values()})
+        named = values(
+            column("id", Integer), column("directory_id", Integer), column("name", String), name="named"
+        ).data([(file_id, directory_ids.get(directory), name) for file_id, (directory, name) in split.items()])
+        session.exec(
+            update(TorrentFile)
+            .where(TorrentFile.id == named.c.id)
+            .values(directory_id=named.c.directory_id, name=named.c.name)
+        )
+        session.commit()
+        last_id = rows[-1][0]
+        total += len(rows)
+        logger.info(f"Split the paths of {total} files, up to id {last_id}")
+
+
+def create_trigram_extension(session: Session):
+    """Install pg_trgm, whose operator class the trigram index of file names uses.
+
+    Migrations do not create extensions.
+    """
+    session.exec(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    session.commit()
+
+
+def index_file_names_by_trigram(session: Session):
+    """Build the trigram index of file names without blocking ingest.
+
+    Created by the migration, the index would be built in its transaction, holding off every write to torrentfile
+    for as long as the build takes, hours on a large table. It is built CONCURRENTLY here and the migration finds it
+    in place. An interrupted concurrent build leaves an invalid index behind, it is dropped and built again.
+    """
+    if not table_exists(session, "torrentfile"):
+        return
+    valid = session.exec(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('ix_torrentfile_name_trgm')")
+    ).one_or_none()
+    # A concurrent build waits for every open transaction, this one included
+    session.commit()
+    if valid is not None and valid[0]:
+        return
+    logger.info("Building the trigram index of file names")
+    with session.get_bind().connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        if valid is not None:
+            connection.exec_driver_sql("DROP INDEX CONCURRENTLY ix_torrentfile_name_trgm")
+        connection.exec_driver_sql(
+            "CREATE INDEX CONCURRENTLY ix_torrentfile_name_trgm ON torrentfile USING gin (name gin_trgm_ops)"
+        )
+
+
+STEPS: List[Callable[[Session], None]] = [
+    merge_duplicate_torrents,
+    remove_duplicate_file_links,
+    remove_duplicate_crawler_links,
+    key_links_by_pair,
+    add_path_digests,
+    add_file_counts,
+    set_torrent_fillfactor,
+    store_info_hashes_as_bytes,
+    partition_torrent_by_month,
+    split_names_into_alnum_words,
+    split_file_paths,
+    create_trigram_extension,
+    index_file_names_by_trigram,
+]
+
+
+def pre_migrate():
+    with rx.session() as session:
+        for step in STEPS:
+            logger.info(f"Pre-migration step: {step.__name__}")
+            step(session)
+
+
+if __name__ == "__main__":
+    pre_migrate()